@@ -5,13 +5,14 @@ CS2 内战匹配系统 - FastAPI 后端
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 import uvicorn
 import os
 from pathlib import Path
 
-from routers import auth, room, match, bp, submit, history
-from utils.storage import init_storage
+from routers import auth, room, match, bp, submit, history, live, admin
+from utils import diagnostics, metrics
+from utils.storage import init_storage, shutdown_storage
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -29,8 +30,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 初始化数据存储
-init_storage()
+# 请求耗时指标
+app.add_middleware(metrics.MetricsMiddleware)
+
+# 慢请求日志（设置 SLOW_REQUEST_MS / SLOW_OPERATION_MS 时启用）
+app.add_middleware(diagnostics.SlowRequestMiddleware)
+
+@app.on_event("startup")
+async def on_startup():
+    """初始化数据存储
+
+    放在启动事件而不是模块顶层：导入 main 的其他进程（例如 multiprocessing 的 spawn 子进程会把它作为
+    __mp_main__ 重新导入）不会载入数据，也就不会在退出时把自己的旧数据写回磁盘。
+    """
+    init_storage()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """关闭时写出尚未落盘的数据"""
+    shutdown_storage()
 
 # 注册路由
 app.include_router(auth.router, prefix="/api/auth", tags=["认证"])
@@ -39,6 +57,8 @@ app.include_router(match.router, prefix="/api/match", tags=["匹配"])
 app.include_router(bp.router, prefix="/api/bp", tags=["BP"])
 app.include_router(submit.router, prefix="/api/submit", tags=["提交"])
 app.include_router(history.router, prefix="/api/history", tags=["历史"])
+app.include_router(live.router, prefix="/api/live", tags=["实时推送"])
+app.include_router(admin.router, prefix="/api/admin", tags=["管理"])
 
 # 健康检查
 @app.get("/api/health")
@@ -49,6 +69,11 @@ async def health_check():
         "version": "2.0.0 (FastAPI)"
     }
 
+# 运行指标（Prometheus 文本格式）
+@app.get("/api/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # 静态文件服务
 frontend_path = Path(__file__).parent.parent / "frontend"
 if frontend_path.exists():
@@ -0,0 +1,62 @@
+"""
+管理接口路由 - 运行中开关采样分析器
+
+需要设置环境变量 ADMIN_TOKEN，请求头 X-Admin-Token 与之相同才能调用；未设置时接口不可用。
+"""
+import hmac
+import os
+from typing import Optional
+from fastapi import APIRouter, Header
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from utils.diagnostics import profiler, save_profile
+
+router = APIRouter()
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+class StartProfilerRequest(BaseModel):
+    interval_ms: float = Field(10, ge=1, le=1000)
+    max_seconds: float = Field(300, gt=0, le=3600)
+
+def _check_token(token: Optional[str]) -> Optional[dict]:
+    """校验管理令牌，不通过时返回错误响应"""
+    if not ADMIN_TOKEN:
+        return {"code": 1006, "message": "管理接口未启用（未设置 ADMIN_TOKEN）", "data": None}
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        return {"code": 1006, "message": "管理令牌无效", "data": None}
+    return None
+
+@router.get("/profiler")
+async def profiler_status(x_admin_token: Optional[str] = Header(None)):
+    """采样分析器状态"""
+    error = _check_token(x_admin_token)
+    if error:
+        return error
+    return {"code": 0, "message": "获取成功", "data": profiler.status()}
+
+@router.post("/profiler/start")
+async def start_profiler(req: StartProfilerRequest, x_admin_token: Optional[str] = Header(None)):
+    """开始采样，到 max_seconds 自动停止采样，结果保留到调用 stop"""
+    error = _check_token(x_admin_token)
+    if error:
+        return error
+    if not profiler.start(req.interval_ms / 1000, req.max_seconds):
+        return {"code": 1005, "message": "分析器已在运行", "data": profiler.status()}
+    return {"code": 0, "message": "已开始采样", "data": profiler.status()}
+
+@router.post("/profiler/stop")
+def stop_profiler(x_admin_token: Optional[str] = Header(None)):
+    """停止采样，返回折叠格式的调用栈（可直接交给 flamegraph.pl / speedscope），同时保存到 PROFILE_DIR"""
+    error = _check_token(x_admin_token)
+    if error:
+        return error
+    status = profiler.status()
+    collapsed = profiler.stop()
+    if collapsed is None:
+        return {"code": 1005, "message": "分析器未在运行", "data": None}
+    path = save_profile(collapsed)
+    return PlainTextResponse(collapsed, headers={
+        "X-Profile-File": path.name,
+        "X-Profile-Samples": str(status['samples']),
+    })
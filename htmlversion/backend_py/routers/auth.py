@@ -5,7 +5,8 @@ from fastapi import APIRouter
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
-from utils.storage import get_collection
+from utils.storage import get_async_collection, get_collection, storage_handler, DuplicateKeyError
+from utils.leaderboard import leaderboard
 
 router = APIRouter()
 
@@ -18,7 +19,8 @@ class LoginRequest(BaseModel):
     nickname: str
 
 @router.post("/register")
-async def register(req: RegisterRequest):
+@storage_handler
+def register(req: RegisterRequest):
     """玩家注册"""
     try:
         nickname = req.nickname.strip()
@@ -28,12 +30,7 @@ async def register(req: RegisterRequest):
         
         players = get_collection('players')
         
-        # 检查昵称是否已存在
-        existing = players.find_one({"nickname": nickname})
-        if existing:
-            return {"code": 1001, "message": "昵称已存在", "data": None}
-        
-        # 创建新玩家
+        # 创建新玩家（nickname 上有唯一索引，重复昵称由存储层拒绝）
         new_player = {
             "nickname": nickname,
             "steam_id": req.steam_id,
@@ -48,7 +45,11 @@ async def register(req: RegisterRequest):
             "updated_at": datetime.now().isoformat()
         }
         
-        player_id = players.insert_one(new_player)
+        try:
+            player_id = players.insert_one(new_player)
+        except DuplicateKeyError:
+            return {"code": 1001, "message": "昵称已存在", "data": None}
+        leaderboard.update([{**new_player, "_id": player_id}])
         
         return {
             "code": 0,
@@ -71,10 +72,10 @@ async def login(req: LoginRequest):
         if not nickname:
             return {"code": 1001, "message": "昵称不能为空", "data": None}
         
-        players = get_collection('players')
+        players = get_async_collection('players')
         
         # 查找玩家
-        player = players.find_one({"nickname": nickname})
+        player = await players.find_one({"nickname": nickname})
         
         if not player:
             return {"code": 1001, "message": "该昵称未注册，请先注册", "data": None}
@@ -5,7 +5,8 @@ from fastapi import APIRouter
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
-from utils.storage import get_collection
+from utils.storage import ConditionFailed, get_async_collection, get_collection, storage_handler
+from utils.pubsub import publish_bp, publish_room
 
 router = APIRouter()
 
@@ -23,7 +24,8 @@ class VoteRequest(BaseModel):
     player_id: str
 
 @router.post("/start")
-async def start_bp(req: StartBPRequest):
+@storage_handler
+def start_bp(req: StartBPRequest):
     """开始 BP"""
     try:
         rooms = get_collection('rooms')
@@ -65,15 +67,31 @@ async def start_bp(req: StartBPRequest):
         
         bp_id = bp_records.insert_one(new_bp)
         
-        # 更新房间状态
-        rooms.update_one(
-            {"_id": req.room_id},
-            {"$set": {
-                "status": "bp",
-                "bp_id": bp_id,
-                "updated_at": datetime.now().isoformat()
-            }}
-        )
+        # 更新房间状态；两队同时开始 BP 时只有一个请求成功，另一个删掉自己的记录并返回已有的
+        try:
+            room = rooms.find_one_and_update(
+                {"_id": req.room_id},
+                {"$set": {"status": "bp", "bp_id": bp_id}},
+                expect={"status": "matching", "bp_id": None}
+            )
+        except ConditionFailed as e:
+            bp_records.delete_one({"_id": bp_id})
+            if not e.doc.get('bp_id'):
+                return {"code": 1005, "message": "房间状态错误，需先完成匹配", "data": None}
+            bp = bp_records.find_by_id(e.doc['bp_id'])
+            return {
+                "code": 0,
+                "message": "BP 已存在",
+                "data": {
+                    "bp_id": e.doc['bp_id'],
+                    "maps": MAP_POOL,
+                    "next_action": get_bp_action(bp['current_step']) if bp else None
+                }
+            }
+        if room is None:
+            bp_records.delete_one({"_id": bp_id})
+            return {"code": 1003, "message": "房间不存在", "data": None}
+        publish_room(req.room_id, room)
         
         return {
             "code": 0,
@@ -88,7 +106,8 @@ async def start_bp(req: StartBPRequest):
         return {"code": 9999, "message": f"BP开始失败：{str(e)}", "data": None}
 
 @router.post("/vote")
-async def vote_bp(req: VoteRequest):
+@storage_handler
+def vote_bp(req: VoteRequest):
     """BP 投票"""
     try:
         bp_records = get_collection('bp_records')
@@ -122,9 +141,20 @@ async def vote_bp(req: VoteRequest):
         if req.player_id not in team_players:
             return {"code": 1006, "message": "您不在当前操作的队伍中", "data": None}
         
-        # 投票机制
-        current_votes = bp.get('current_votes', {})
-        current_votes[req.player_id] = req.map
+        # 投票机制：只写入自己的一票；BP 已进入下一步或地图已被选走时不计票
+        step = bp['current_step']
+        try:
+            bp = bp_records.find_one_and_update(
+                {"_id": req.bp_id},
+                {"$set": {f"current_votes.{req.player_id}": req.map}},
+                expect={"status": "in_progress", "current_step": step, "available_maps": req.map}
+            )
+        except ConditionFailed:
+            return {"code": 1005, "message": "BP 状态已变化，请刷新后重试", "data": None}
+        if bp is None:
+            return {"code": 1003, "message": "BP 记录不存在", "data": None}
+        publish_bp(req.bp_id, bp_state(bp))
+        current_votes = bp['current_votes']
         
         # 统计投票结果
         vote_counts = {}
@@ -136,15 +166,6 @@ async def vote_bp(req: VoteRequest):
         max_votes = max(vote_counts.values()) if vote_counts else 0
         selected_map = max(vote_counts, key=vote_counts.get) if vote_counts else None
         
-        # 更新投票记录
-        bp_records.update_one(
-            {"_id": req.bp_id},
-            {"$set": {
-                "current_votes": current_votes,
-                "updated_at": datetime.now().isoformat()
-            }}
-        )
-        
         # 检查是否达到所需票数
         if max_votes < required_votes:
             return {
@@ -168,7 +189,7 @@ async def vote_bp(req: VoteRequest):
         }]
         
         new_available_maps = [m for m in bp['available_maps'] if m != selected_map]
-        new_step = bp['current_step'] + 1
+        new_step = step + 1
         
         # 检查是否完成 BP
         final_map = None
@@ -178,7 +199,28 @@ async def vote_bp(req: VoteRequest):
         if new_step >= 3 or len(new_available_maps) == 1:
             final_map = selected_map if req.bp_action == 'pick' else new_available_maps[0]
             status = 'completed'
-            
+        
+        # 更新 BP 记录：同一步只有一个请求能推进，同时达到票数的其他请求返回已执行的结果
+        try:
+            bp = bp_records.find_one_and_update(
+                {"_id": req.bp_id},
+                {"$set": {
+                    "bp_history": new_history,
+                    "available_maps": new_available_maps,
+                    "current_step": new_step,
+                    "current_votes": {},
+                    "final_map": final_map,
+                    "status": status
+                }},
+                expect={"current_step": step}
+            )
+        except ConditionFailed as e:
+            return _step_result(e.doc, step)
+        if bp is None:
+            return {"code": 1003, "message": "BP 记录不存在", "data": None}
+        publish_bp(req.bp_id, bp_state(bp))
+        
+        if status == 'completed':
             # 创建比赛记录
             matches.insert_one({
                 "room_id": bp['room_id'],
@@ -197,48 +239,36 @@ async def vote_bp(req: VoteRequest):
             })
             
             # 更新房间状态
-            rooms.update_one(
-                {"_id": bp['room_id']},
-                {"$set": {
-                    "status": "playing",
-                    "updated_at": datetime.now().isoformat()
-                }}
-            )
-        
-        # 更新 BP 记录
-        bp_records.update_one(
-            {"_id": req.bp_id},
-            {"$set": {
-                "bp_history": new_history,
-                "available_maps": new_available_maps,
-                "current_step": new_step,
-                "current_votes": {},
-                "final_map": final_map,
-                "status": status,
-                "updated_at": datetime.now().isoformat()
-            }}
-        )
+            room = rooms.find_one_and_update({"_id": bp['room_id']}, {"$set": {"status": "playing"}})
+            if room is not None:
+                publish_room(room['_id'], room)
         
-        return {
-            "code": 0,
-            "message": f"{req.team} 队 {'Ban 掉' if req.bp_action == 'ban' else 'Pick'} {selected_map}",
-            "data": {
-                "available_maps": new_available_maps,
-                "final_map": final_map,
-                "completed": status == 'completed',
-                "next_action": get_bp_action(new_step) if status == 'in_progress' else None,
-                "selected_map": selected_map
-            }
-        }
+        return _step_result(bp, step)
     except Exception as e:
         return {"code": 9999, "message": f"BP投票失败：{str(e)}", "data": None}
 
+def _step_result(bp: dict, step: int) -> dict:
+    """第 step 步执行后的响应"""
+    done = bp['bp_history'][step]
+    in_progress = bp['status'] == 'in_progress'
+    return {
+        "code": 0,
+        "message": f"{done['team']} 队 {'Ban 掉' if done['action'] == 'ban' else 'Pick'} {done['map']}",
+        "data": {
+            "available_maps": bp['available_maps'],
+            "final_map": bp['final_map'],
+            "completed": not in_progress,
+            "next_action": get_bp_action(bp['current_step']) if in_progress else None,
+            "selected_map": done['map']
+        }
+    }
+
 @router.get("/{bp_id}")
 async def get_bp_status(bp_id: str):
     """获取 BP 状态"""
     try:
-        bp_records = get_collection('bp_records')
-        bp = bp_records.find_by_id(bp_id)
+        bp_records = get_async_collection('bp_records')
+        bp = await bp_records.find_by_id(bp_id)
         
         if not bp:
             return {"code": 1003, "message": "BP 记录不存在", "data": None}
@@ -246,15 +276,19 @@ async def get_bp_status(bp_id: str):
         return {
             "code": 0,
             "message": "获取成功",
-            "data": {
-                **bp,
-                "next_action": get_bp_action(bp['current_step']) if bp['status'] == 'in_progress' else None,
-                "server_time": datetime.now().isoformat()
-            }
+            "data": bp_state(bp)
         }
     except Exception as e:
         return {"code": 9999, "message": f"获取失败：{str(e)}", "data": None}
 
+def bp_state(bp: dict) -> dict:
+    """BP 记录加上当前应执行的操作（GET 接口和实时推送共用）"""
+    return {
+        **bp,
+        "next_action": get_bp_action(bp['current_step']) if bp['status'] == 'in_progress' else None,
+        "server_time": datetime.now().isoformat()
+    }
+
 def get_bp_action(step: int) -> dict:
     """获取当前 BP 步骤应该的操作"""
     bp_flow = [
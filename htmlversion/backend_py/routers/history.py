@@ -1,26 +1,29 @@
 """
 历史记录和排行榜路由
 """
-from fastapi import APIRouter
-from utils.storage import get_collection
+from typing import Optional
+from fastapi import APIRouter, Query, Request, Response
+from utils.storage import get_async_collection, run_storage
+from utils.leaderboard import leaderboard
 
 router = APIRouter()
 
 @router.get("/player/{player_id}")
-async def get_player_history(player_id: str):
-    """获取玩家历史战绩"""
+async def get_player_history(player_id: str, before: Optional[str] = None,
+                             limit: int = Query(20, ge=1, le=100)):
+    """获取玩家历史战绩（按时间倒序分页）
+
+    before 为游标：传入上一页最后一条的 created_at，返回更早的记录
+    """
     try:
-        player_stats_col = get_collection('player_stats')
-        matches = get_collection('matches')
+        player_stats_col = get_async_collection('player_stats')
+        matches = get_async_collection('matches')
         
-        # 获取玩家所有比赛统计
-        stats = player_stats_col.find({"player_id": player_id})
-        stats.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        stats = stats[:20]
+        # 走 player_id + created_at 排序索引，只读取这一页
+        stats = await player_stats_col.find_latest({"player_id": player_id}, 'created_at', before, limit)
         
-        # 获取对应的比赛信息
-        match_ids = [s['match_id'] for s in stats]
-        match_docs = {m['_id']: m for m in matches.find()}
+        # 只加载这一页引用到的比赛
+        match_docs = {m['_id']: m for m in await matches.find_by_ids((s['match_id'] for s in stats), readonly=True)}
         
         # 组合数据
         history = []
@@ -43,35 +46,22 @@ async def get_player_history(player_id: str):
     except Exception as e:
         return {"code": 9999, "message": f"获取失败：{str(e)}", "data": []}
 
+async def _not_modified(request: Request, response: Response) -> bool:
+    """设置 ETag；客户端缓存的版本仍然有效时返回 True"""
+    etag = await run_storage(leaderboard.current_etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return request.headers.get("if-none-match") == etag
+
 @router.get("/ranking")
-async def get_ranking():
-    """获取排行榜"""
+async def get_ranking(request: Request, response: Response, limit: int = Query(50, ge=1, le=500)):
+    """获取排行榜（前 limit 名，默认 50）"""
     try:
-        players = get_collection('players')
+        if await _not_modified(request, response):
+            return Response(status_code=304, headers=dict(response.headers))
         
-        # 获取前50名玩家
-        all_players = players.find()
-        all_players.sort(key=lambda x: x.get('elo', 0), reverse=True)
-        ranking = all_players[:50]
-        
-        ranking_data = []
-        for index, player in enumerate(ranking):
-            total_matches = player.get('total_matches', 0)
-            wins = player.get('wins', 0)
-            total_kills = player.get('total_kills', 0)
-            total_deaths = player.get('total_deaths', 0)
-            
-            ranking_data.append({
-                "rank": index + 1,
-                "player_id": player['_id'],
-                "nickname": player.get('nickname', ''),
-                "elo": player.get('elo', 1000),
-                "total_matches": total_matches,
-                "wins": wins,
-                "losses": player.get('losses', 0),
-                "win_rate": round((wins / total_matches) * 100) if total_matches > 0 else 0,
-                "kd_ratio": f"{(total_kills / total_deaths):.2f}" if total_deaths > 0 else f"{total_kills:.2f}"
-            })
+        ranking_data, etag = await run_storage(leaderboard.top, limit)
+        response.headers["ETag"] = etag
         
         return {
             "code": 0,
@@ -81,12 +71,32 @@ async def get_ranking():
     except Exception as e:
         return {"code": 9999, "message": f"获取失败：{str(e)}", "data": []}
 
+@router.get("/ranking/{player_id}")
+async def get_player_rank(player_id: str, request: Request, response: Response):
+    """获取玩家的名次"""
+    try:
+        if await _not_modified(request, response):
+            return Response(status_code=304, headers=dict(response.headers))
+        
+        rank, etag = await run_storage(leaderboard.rank_of, player_id)
+        response.headers["ETag"] = etag
+        if not rank:
+            return {"code": 1002, "message": "玩家不存在", "data": None}
+        
+        return {
+            "code": 0,
+            "message": "获取成功",
+            "data": rank
+        }
+    except Exception as e:
+        return {"code": 9999, "message": f"获取失败：{str(e)}", "data": None}
+
 @router.get("/player-info/{player_id}")
 async def get_player_info(player_id: str):
     """获取玩家信息"""
     try:
-        players = get_collection('players')
-        player = players.find_by_id(player_id)
+        players = get_async_collection('players')
+        player = await players.find_by_id(player_id)
         
         if not player:
             return {"code": 1002, "message": "玩家不存在", "data": None}
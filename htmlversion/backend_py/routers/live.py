@@ -0,0 +1,136 @@
+"""
+实时推送路由 - 房间和 BP 状态（WebSocket，SSE 作为降级方案）
+
+同一路径既可以用 WebSocket 连接，也可以用 EventSource 以 SSE 方式订阅：
+    /api/live/room/{room_id}
+    /api/live/bp/{bp_id}
+连接后先推送一份完整状态（snapshot），之后推送增量（delta），格式见 utils.pubsub。
+"""
+import asyncio
+import json
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from routers.bp import bp_state
+from utils.pubsub import bp_channel, broker, publish_bp, publish_room, room_channel
+from utils.storage import add_change_listener, get_collection, run_storage
+
+router = APIRouter()
+
+# SSE 心跳间隔（秒），防止代理断开空闲连接
+HEARTBEAT_INTERVAL = 15
+
+# 多进程模式：其他进程修改的房间 / BP 也推送给本进程的订阅者（推送完整文档作为增量）
+def _bp_changed(bp_id: str, bp: Optional[Dict]):
+    if bp is not None:
+        publish_bp(bp_id, bp_state(bp))
+
+add_change_listener('rooms', publish_room)
+add_change_listener('bp_records', _bp_changed)
+
+# 读取函数返回 (集合版本, 当前状态)：版本在读取文档之前取得，不超过它的写入都已包含在读到的状态中
+Loader = Callable[[], Tuple[int, Optional[Dict]]]
+
+def _load_room(room_id: str) -> Tuple[int, Optional[Dict]]:
+    rooms = get_collection('rooms')
+    version = rooms.version
+    return version, rooms.find_by_id(room_id)
+
+def _load_bp(bp_id: str) -> Tuple[int, Optional[Dict]]:
+    bp_records = get_collection('bp_records')
+    version = bp_records.version
+    bp = bp_records.find_by_id(bp_id)
+    return version, bp_state(bp) if bp else None
+
+async def _open(channel: str, load: Loader):
+    """订阅频道并读取当前状态
+
+    先订阅再在存储线程中读取，读取期间发布的增量进入队列。增量的版本在写入之后取得，
+    不超过快照版本的增量其写入早于读取、已包含在快照中，丢弃；更新的增量保留，按顺序在快照之后推送。
+    """
+    sub = broker.subscribe(channel)
+    version, doc = await run_storage(load)
+    sub.discard_through(version)
+    if doc is None:
+        first = {"type": "deleted", "data": None, "version": version}
+    else:
+        first = {"type": "snapshot", "data": doc, "version": version}
+    return sub, first
+
+def _dumps(message: Dict) -> str:
+    return json.dumps(message, ensure_ascii=False, default=str)
+
+async def _serve_websocket(websocket: WebSocket, channel: str, load: Loader):
+    await websocket.accept()
+    sub, first = await _open(channel, load)
+    try:
+        await websocket.send_text(_dumps(first))
+        receiver = asyncio.ensure_future(websocket.receive_text())
+        while True:
+            getter = asyncio.ensure_future(sub.get())
+            done, _ = await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                # 客户端不需要发送消息；收到任何消息或断开都结束本连接
+                getter.cancel()
+                receiver.result()
+                break
+            message = getter.result()
+            await websocket.send_text(_dumps(message))
+            if message['type'] in ('deleted', 'resync'):
+                receiver.cancel()
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        broker.unsubscribe(sub)
+    try:
+        await websocket.close()
+    except RuntimeError:
+        pass
+
+async def _serve_sse(request: Request, channel: str, load: Loader) -> StreamingResponse:
+    sub, first = await _open(channel, load)
+
+    async def stream():
+        try:
+            yield f"data: {_dumps(first)}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(sub.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                yield f"data: {_dumps(message)}\n\n"
+                if message['type'] in ('deleted', 'resync'):
+                    break
+        finally:
+            broker.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@router.websocket("/room/{room_id}")
+async def room_websocket(websocket: WebSocket, room_id: str):
+    """订阅房间状态（WebSocket）"""
+    await _serve_websocket(websocket, room_channel(room_id), lambda: _load_room(room_id))
+
+@router.get("/room/{room_id}")
+async def room_events(room_id: str, request: Request):
+    """订阅房间状态（SSE）"""
+    return await _serve_sse(request, room_channel(room_id), lambda: _load_room(room_id))
+
+@router.websocket("/bp/{bp_id}")
+async def bp_websocket(websocket: WebSocket, bp_id: str):
+    """订阅 BP 状态（WebSocket）"""
+    await _serve_websocket(websocket, bp_channel(bp_id), lambda: _load_bp(bp_id))
+
+@router.get("/bp/{bp_id}")
+async def bp_events(bp_id: str, request: Request):
+    """订阅 BP 状态（SSE）"""
+    return await _serve_sse(request, bp_channel(bp_id), lambda: _load_bp(bp_id))
@@ -3,17 +3,31 @@
 """
 from fastapi import APIRouter
 from pydantic import BaseModel
-from datetime import datetime
-from utils.storage import get_collection
-from typing import List, Dict
+from utils.storage import ConditionFailed, get_collection, storage_handler
+from utils import balance, batch_match, constrained_balance
+from utils.matchmaking import queue
+from utils.pubsub import publish_room
+from typing import List, Dict, Optional
 
 router = APIRouter()
 
+# balance.STRATEGIES 之外，constrained 为带约束的分队（utils/constrained_balance.py）
+STRATEGIES = balance.STRATEGIES + ('constrained',)
+
 class StartMatchRequest(BaseModel):
     room_id: str
+    strategy: str = 'auto'
+    time_budget_ms: Optional[float] = None
+    # constrained 策略：车队（每个车队为一组 player_id，分在同一队）
+    parties: Optional[List[List[str]]] = None
+
+class BatchMatchRequest(BaseModel):
+    player_ids: Optional[List[str]] = None
+    time_budget_ms: Optional[float] = None
 
 @router.post("/start")
-async def start_match(req: StartMatchRequest):
+@storage_handler
+def start_match(req: StartMatchRequest):
     """开始匹配"""
     try:
         rooms = get_collection('rooms')
@@ -28,20 +42,32 @@ async def start_match(req: StartMatchRequest):
         if len(room['players']) < 2:
             return {"code": 1001, "message": "玩家数量不足，至少需要2人", "data": None}
         
+        if req.strategy not in STRATEGIES:
+            return {"code": 1001, "message": f"未知的分队策略：{req.strategy}", "data": None}
+        
         # 使用 ELO 平衡算法分队
-        teams = balance_teams(room['players'])
+        if req.strategy == 'constrained':
+            teams = _constrained_teams(room, req)
+        else:
+            teams = balance_teams(room['players'], req.strategy, req.time_budget_ms or balance.DEFAULT_TIME_BUDGET_MS)
         
-        # 更新房间信息
-        rooms.update_one(
-            {"_id": req.room_id},
-            {"$set": {
-                "teamA": [p['player_id'] for p in teams['teamA']],
-                "teamB": [p['player_id'] for p in teams['teamB']],
-                "elo_diff": teams['elo_diff'],
-                "status": "matching",
-                "updated_at": datetime.now().isoformat()
-            }}
-        )
+        # 更新房间信息（分队期间玩家或房间状态有变化则放弃本次分队）
+        try:
+            room = rooms.find_one_and_update(
+                {"_id": req.room_id},
+                {"$set": {
+                    "teamA": [p['player_id'] for p in teams['teamA']],
+                    "teamB": [p['player_id'] for p in teams['teamB']],
+                    "elo_diff": teams['elo_diff'],
+                    "status": "matching"
+                }},
+                expect={"status": "ready", "players": room['players']}
+            )
+        except ConditionFailed:
+            return {"code": 1005, "message": "房间状态已变化，请重新开始匹配", "data": None}
+        if room is None:
+            return {"code": 1003, "message": "房间不存在", "data": None}
+        publish_room(req.room_id, room)
         
         return {
             "code": 0,
@@ -51,64 +77,59 @@ async def start_match(req: StartMatchRequest):
                 "teamB": teams['teamB'],
                 "elo_diff": teams['elo_diff'],
                 "teamA_avg_elo": teams['teamA_avg'],
-                "teamB_avg_elo": teams['teamB_avg']
+                "teamB_avg_elo": teams['teamB_avg'],
+                "strategy": teams['strategy'],
+                "kd_diff": teams.get('kd_diff'),
+                "relaxed": teams.get('relaxed', [])
             }
         }
     except Exception as e:
         return {"code": 9999, "message": f"匹配失败：{str(e)}", "data": None}
 
-def balance_teams(players: List[Dict]) -> Dict:
-    """ELO 平衡算法 - 使用暴力枚举找到最平衡的分队方案"""
-    n = len(players)
-    half_size = n // 2
-    
-    best_diff = float('inf')
-    best_team_a = []
-    best_team_b = []
-    
-    # 生成所有可能的组合
-    combinations = get_combinations(players, half_size)
-    
-    for team_a in combinations:
-        team_b = [p for p in players if p not in team_a]
-        
-        if len(team_a) == 0 or len(team_b) == 0:
-            continue
-        
-        elo_a = sum(p['elo'] for p in team_a) / len(team_a)
-        elo_b = sum(p['elo'] for p in team_b) / len(team_b)
-        diff = abs(elo_a - elo_b)
-        
-        if diff < best_diff:
-            best_diff = diff
-            best_team_a = team_a
-            best_team_b = team_b
-    
-    team_a_avg = sum(p['elo'] for p in best_team_a) / len(best_team_a) if best_team_a else 0
-    team_b_avg = sum(p['elo'] for p in best_team_b) / len(best_team_b) if best_team_b else 0
-    
-    return {
-        "teamA": best_team_a,
-        "teamB": best_team_b,
-        "elo_diff": round(best_diff),
-        "teamA_avg": round(team_a_avg),
-        "teamB_avg": round(team_b_avg)
+def _constrained_teams(room: Dict, req: StartMatchRequest) -> Dict:
+    """带约束分队：车队同队、最高分两人分开、不重复该房间上一场的分队，K/D 为次要目标"""
+    player_ids = [p['player_id'] for p in room['players']]
+    kd = {
+        p['_id']: constrained_balance.kd_ratio(p)
+        for p in get_collection('players').find_by_ids(player_ids, readonly=True)
     }
+    # 房间保留着上一场的分队
+    previous = (room['teamA'], room['teamB']) if room.get('teamA') else None
+    return constrained_balance.balance_with_constraints(
+        room['players'], kd, req.parties or [], previous,
+        time_budget_ms=req.time_budget_ms or constrained_balance.DEFAULT_TIME_BUDGET_MS)
 
-def get_combinations(arr: List, size: int) -> List[List]:
-    """获取所有组合"""
-    result = []
-    
-    def combine(start: int, combo: List):
-        if len(combo) == size:
-            result.append(combo[:])
-            return
+@router.post("/batch")
+@storage_handler
+def batch_match_players(req: BatchMatchRequest):
+    """批量匹配：把整个队列（默认为所有等待中房间里的玩家）分成若干场 5v5，使各场两队的 ELO 差之和最小
+
+    只返回分配方案，不修改房间；人数不是 10 的倍数时最后排队的几人留在 unassigned 中。
+    """
+    try:
+        player_ids = req.player_ids if req.player_ids is not None else queue.queued_players()
+        players = [{
+            "player_id": p['_id'],
+            "nickname": p['nickname'],
+            "elo": p['elo']
+        } for p in get_collection('players').find_by_ids(player_ids, readonly=True)]
         
-        for i in range(start, len(arr)):
-            combo.append(arr[i])
-            combine(i + 1, combo)
-            combo.pop()
-    
-    combine(0, [])
-    return result
+        matches, unassigned = batch_match.batch_match(
+            players, req.time_budget_ms or batch_match.DEFAULT_TIME_BUDGET_MS)
+        
+        return {
+            "code": 0,
+            "message": "匹配成功",
+            "data": {
+                "matches": matches,
+                "unassigned": unassigned,
+                "total_elo_diff": sum(m['elo_diff'] for m in matches)
+            }
+        }
+    except Exception as e:
+        return {"code": 9999, "message": f"匹配失败：{str(e)}", "data": None}
 
+def balance_teams(players: List[Dict], strategy: str = 'auto',
+                  time_budget_ms: Optional[float] = balance.DEFAULT_TIME_BUDGET_MS) -> Dict:
+    """ELO 平衡算法 - 小规模精确求解，大规模用差分法 + 局部搜索（见 utils/balance.py）"""
+    return balance.balance_teams(players, strategy, time_budget_ms)
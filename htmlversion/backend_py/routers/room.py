@@ -5,10 +5,18 @@ from fastapi import APIRouter
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
-from utils.storage import get_collection
+import threading
+from utils.query import generate_id
+from utils.storage import (ConditionFailed, document_lock, get_async_collection, get_collection, process_lock,
+                           storage_handler, sync_collection)
+from utils.matchmaking import ROOM_SIZE, queue
+from utils.pubsub import publish_room
 
 router = APIRouter()
 
+# 加入房间的请求依次执行，避免同时创建多个房间；多进程模式下是跨进程的锁，其他进程的加入也要排队
+_join_lock = process_lock('room-join') or threading.Lock()
+
 class JoinRoomRequest(BaseModel):
     player_id: str
 
@@ -22,7 +30,8 @@ class LeaveRoomRequest(BaseModel):
     room_id: str
 
 @router.post("/join")
-async def join_room(req: JoinRoomRequest):
+@storage_handler
+def join_room(req: JoinRoomRequest):
     """加入房间"""
     try:
         if not req.player_id:
@@ -36,41 +45,16 @@ async def join_room(req: JoinRoomRequest):
         if not player:
             return {"code": 1002, "message": "玩家不存在", "data": None}
         
-        # 查找可用房间
-        all_rooms = rooms.find({"status": "waiting"})
-        room = None
-        for r in all_rooms:
-            if len(r.get('players', [])) < 10:
-                room = r
-                break
-        
-        if room:
-            # 检查玩家是否已在房间中
-            player_exists = any(p['player_id'] == req.player_id for p in room['players'])
-            if player_exists:
-                return {"code": 0, "message": "已在房间中", "data": room}
+        with _join_lock:
+            # 多进程模式下先重放其他进程创建 / 加入的房间，匹配队列才是最新的
+            sync_collection('rooms')
+            joined = _join_waiting_room(rooms, req.player_id, player)
+            if joined is not None:
+                return joined
             
-            # 加入现有房间
-            room['players'].append({
-                "player_id": req.player_id,
-                "nickname": player['nickname'],
-                "elo": player['elo'],
-                "ready": False,
-                "team": None
-            })
-            
-            rooms.update_one(
-                {"_id": room['_id']},
-                {"$set": {
-                    "players": room['players'],
-                    "updated_at": datetime.now().isoformat()
-                }}
-            )
-            
-            room = rooms.find_by_id(room['_id'])
-        else:
-            # 创建新房间
+            # 创建新房间：与修改房间一样在房间的文档锁内写入并登记到匹配队列
             new_room = {
+                "_id": generate_id(),
                 "status": "waiting",
                 "players": [{
                     "player_id": req.player_id,
@@ -86,8 +70,10 @@ async def join_room(req: JoinRoomRequest):
                 "updated_at": datetime.now().isoformat()
             }
             
-            room_id = rooms.insert_one(new_room)
-            room = rooms.find_by_id(room_id)
+            with document_lock('rooms', new_room['_id']):
+                rooms.insert_one(new_room)
+                queue.room_changed(new_room)
+            room = new_room
         
         return {
             "code": 0,
@@ -97,58 +83,119 @@ async def join_room(req: JoinRoomRequest):
     except Exception as e:
         return {"code": 9999, "message": f"加入房间失败：{str(e)}", "data": None}
 
+def _join_waiting_room(rooms, player_id: str, player: dict) -> Optional[dict]:
+    """加入匹配队列选出的等待中房间（加入后 ELO 极差最小），返回响应；没有可加入的房间时返回 None"""
+    # 检查玩家是否已在房间中
+    room_id = queue.room_of(player_id)
+    if room_id is not None:
+        with document_lock('rooms', room_id):
+            room = rooms.find_by_id(room_id)
+            if room and room['status'] == 'waiting' and any(p['player_id'] == player_id for p in room['players']):
+                return {"code": 0, "message": "已在房间中", "data": room}
+            _refresh(room_id, room)
+    
+    # 能接受的 ELO 差距按该玩家的等待时间放宽
+    waited = queue.waited(player_id)
+    tried = set()
+    while True:
+        room_id = queue.best_room(player['elo'], exclude=tried, waited=waited)
+        if room_id is None:
+            return None
+        tried.add(room_id)
+        
+        # 加入现有房间：房间仍在等待且未满（第 ROOM_SIZE 个位置为空）时才加入
+        with document_lock('rooms', room_id):
+            try:
+                room = rooms.find_one_and_update(
+                    {"_id": room_id},
+                    {"$push": {"players": {
+                        "player_id": player_id,
+                        "nickname": player['nickname'],
+                        "elo": player['elo'],
+                        "ready": False,
+                        "team": None
+                    }}},
+                    expect={"status": "waiting", f"players.{ROOM_SIZE - 1}": None}
+                )
+            except ConditionFailed as e:
+                # 索引过时：用最新的房间修正后重选
+                _refresh(room_id, e.doc)
+                continue
+            _refresh(room_id, room)
+        if room is None:
+            continue
+        
+        publish_room(room['_id'], room)
+        return {"code": 0, "message": "加入房间成功", "data": room}
+
+def _refresh(room_id: str, room: Optional[dict]):
+    """用最新的房间文档（None 表示已删除）更新匹配队列，调用方持有该房间的文档锁"""
+    if room is None:
+        queue.room_removed(room_id)
+    else:
+        queue.room_changed(room)
+
 @router.post("/ready")
-async def set_ready(req: ReadyRequest):
+@storage_handler
+def set_ready(req: ReadyRequest):
     """设置准备状态"""
     try:
         rooms = get_collection('rooms')
-        room = rooms.find_by_id(req.room_id)
-        
-        if not room:
-            return {"code": 1003, "message": "房间不存在", "data": None}
-        
-        # 查找玩家索引
-        player_index = -1
-        for i, p in enumerate(room['players']):
-            if p['player_id'] == req.player_id:
-                player_index = i
-                break
-        
-        if player_index == -1:
-            return {"code": 1002, "message": "玩家不在房间中", "data": None}
-        
-        # 更新玩家准备状态
-        room['players'][player_index]['ready'] = req.ready
-        
-        # 检查是否所有人都准备好了
-        all_ready = len(room['players']) >= 2 and all(p['ready'] for p in room['players'])
         
-        rooms.update_one(
-            {"_id": req.room_id},
-            {"$set": {
-                "players": room['players'],
-                "status": "ready" if all_ready else "waiting",
-                "updated_at": datetime.now().isoformat()
-            }}
-        )
+        with document_lock('rooms', req.room_id):
+            # 只修改该玩家的准备状态，不影响同时操作的其他玩家
+            room = rooms.find_one_and_update(
+                {"_id": req.room_id, "players.player_id": req.player_id},
+                {"$set": {"players.$.ready": req.ready}}
+            )
+            if room is None:
+                if not rooms.find_by_id(req.room_id):
+                    return {"code": 1003, "message": "房间不存在", "data": None}
+                return {"code": 1002, "message": "玩家不在房间中", "data": None}
+            
+            room = _update_ready_status(rooms, room)
+            _refresh(req.room_id, room)
+        if room is not None:
+            publish_room(req.room_id, room)
         
         return {
             "code": 0,
             "message": "已准备" if req.ready else "取消准备",
             "data": {
                 "ready": req.ready,
-                "all_ready": all_ready
+                "all_ready": room is not None and _all_ready(room['players'])
             }
         }
     except Exception as e:
         return {"code": 9999, "message": f"操作失败：{str(e)}", "data": None}
 
+def _all_ready(players: list) -> bool:
+    return len(players) >= 2 and all(p['ready'] for p in players)
+
+def _update_ready_status(rooms, room: dict) -> Optional[dict]:
+    """根据所有玩家的准备情况更新房间状态，返回最新的房间（已被删除时返回 None）
+
+    只在玩家列表与计算时一致的情况下更新；期间有其他玩家改变了状态则按最新的列表重新计算。
+    """
+    while True:
+        status = "ready" if _all_ready(room['players']) else "waiting"
+        if room['status'] == status:
+            return room
+        try:
+            return rooms.find_one_and_update(
+                {"_id": room['_id']},
+                {"$set": {"status": status}},
+                expect={"players": room['players']}
+            )
+        except ConditionFailed as e:
+            room = e.doc
+
 @router.get("/{room_id}")
 async def get_room(room_id: str):
     """获取房间状态"""
     try:
-        rooms = get_collection('rooms')
-        room = rooms.find_by_id(room_id)
+        rooms = get_async_collection('rooms')
+        room = await rooms.find_by_id(room_id)
         
         if not room:
             return {"code": 1003, "message": "房间不存在", "data": None}
@@ -165,13 +212,14 @@ async def get_room(room_id: str):
 async def list_rooms():
     """获取可用房间列表"""
     try:
-        rooms = get_collection('rooms')
-        available_rooms = rooms.find()
-        
-        # 过滤并排序
-        available_rooms = [r for r in available_rooms if r.get('status') in ['waiting', 'ready']]
-        available_rooms.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        available_rooms = available_rooms[:10]
+        rooms = get_async_collection('rooms')
+        # 最新的 10 个：沿 status 索引按创建时间倒序读取，取够即停，只复制需要的字段
+        available_rooms = await rooms.find(
+            {"status": {"$in": ["waiting", "ready"]}},
+            sort=[("created_at", -1)],
+            limit=10,
+            projection=["players", "status", "created_at"]
+        )
         
         room_list = [{
             "_id": room['_id'],
@@ -189,31 +237,26 @@ async def list_rooms():
         return {"code": 9999, "message": f"获取失败：{str(e)}", "data": []}
 
 @router.post("/leave")
-async def leave_room(req: LeaveRoomRequest):
+@storage_handler
+def leave_room(req: LeaveRoomRequest):
     """离开房间"""
     try:
         rooms = get_collection('rooms')
-        room = rooms.find_by_id(req.room_id)
-        
-        if not room:
-            return {"code": 1003, "message": "房间不存在", "data": None}
         
-        # 移除玩家
-        new_players = [p for p in room['players'] if p['player_id'] != req.player_id]
-        
-        if len(new_players) == 0:
-            # 房间无人，删除房间
-            rooms.delete_one({"_id": req.room_id})
-        else:
-            # 更新玩家列表
-            rooms.update_one(
+        with document_lock('rooms', req.room_id):
+            # 移除玩家
+            room = rooms.find_one_and_update(
                 {"_id": req.room_id},
-                {"$set": {
-                    "players": new_players,
-                    "status": "waiting",
-                    "updated_at": datetime.now().isoformat()
-                }}
+                {"$pull": {"players": {"player_id": req.player_id}}, "$set": {"status": "waiting"}}
             )
+            if room is None:
+                return {"code": 1003, "message": "房间不存在", "data": None}
+            
+            # 房间无人，删除房间
+            deleted = len(room['players']) == 0 and rooms.delete_one({"_id": req.room_id, "players": []})
+            _refresh(req.room_id, None if deleted else room)
+        
+        publish_room(req.room_id, None if deleted else room)
         
         return {
             "code": 0,
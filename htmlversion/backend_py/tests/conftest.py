@@ -0,0 +1,34 @@
+"""
+测试公共设置
+
+存储配置在导入 utils.storage 时读取，这里在任何测试导入它之前把数据目录指向临时目录，不碰 data/。
+需要其他存储配置（STORAGE_MODE、STORAGE_BACKEND 等）或完整进程生命周期的测试用 run_python 在子进程中执行。
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ["STORAGE_DATA_DIR"] = tempfile.mkdtemp(prefix="cs2battle_test_")
+os.environ.pop("SQLITE_PATH", None)
+
+def run_python(code: str, env: dict, timeout: float = 120) -> str:
+    """在 backend_py 目录下用新的解释器执行 code，返回标准输出（失败时带上标准错误）"""
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env={**os.environ, **env},
+        capture_output=True, text=True, timeout=timeout
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+@pytest.fixture
+def data_dir(tmp_path) -> Path:
+    """子进程使用的空数据目录"""
+    path = tmp_path / "data"
+    path.mkdir()
+    return path
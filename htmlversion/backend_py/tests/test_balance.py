@@ -0,0 +1,67 @@
+"""ELO 分队：与穷举的最优解对比"""
+import random
+import time
+from itertools import combinations
+
+import pytest
+
+from utils.balance import balance_teams, split_teams
+
+def _gap(elos, team_a) -> float:
+    """两队平均 ELO 之差"""
+    in_a = set(team_a)
+    a = [e for i, e in enumerate(elos) if i in in_a]
+    b = [e for i, e in enumerate(elos) if i not in in_a]
+    return abs(sum(a) / len(a) - sum(b) / len(b))
+
+def _brute_force(elos) -> float:
+    n = len(elos)
+    return min(_gap(elos, team_a) for team_a in combinations(range(n), n // 2))
+
+CASES = [
+    [random.Random(seed).randint(600, 2400) for _ in range(n)]
+    for seed, n in enumerate([2, 3, 4, 5, 7, 8, 9, 10, 10, 10, 11, 12, 13, 14])
+]
+
+@pytest.mark.parametrize("elos", CASES)
+def test_exact_matches_brute_force(elos):
+    team_a, used = split_teams(elos, 'exact', time_budget_ms=None)
+    assert used == 'exact'
+    assert len(team_a) == len(elos) // 2 == len(set(team_a))
+    assert _gap(elos, team_a) == pytest.approx(_brute_force(elos))
+
+@pytest.mark.parametrize("elos", CASES)
+def test_greedy_is_valid_and_close(elos):
+    team_a, used = split_teams(elos, 'greedy', time_budget_ms=None)
+    assert used == 'greedy'
+    assert len(team_a) == len(elos) // 2 == len(set(team_a))
+    assert all(0 <= i < len(elos) for i in team_a)
+    # 差分 + 两两交换不保证最优，但不应比最优解差出一名玩家的分差
+    assert _gap(elos, team_a) <= _brute_force(elos) + (max(elos) - min(elos)) / (len(elos) // 2)
+
+def test_auto_uses_exact_for_a_room():
+    elos = CASES[8]
+    team_a, used = split_teams(elos)
+    assert used == 'exact'
+    assert _gap(elos, team_a) == pytest.approx(_brute_force(elos))
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        split_teams([1000, 1100], 'random')
+
+def test_balance_teams_result():
+    players = [{"player_id": f"p{i}", "elo": elo} for i, elo in enumerate(CASES[8])]
+    result = balance_teams(players)
+    assert len(result['teamA']) == len(result['teamB']) == 5
+    ids = {p['player_id'] for p in result['teamA'] + result['teamB']}
+    assert ids == {p['player_id'] for p in players}
+    assert result['elo_diff'] == round(_brute_force(CASES[8]))
+
+def test_exact_respects_time_budget():
+    """人数多时 exact 在建子集表的过程中也检查时间预算，超时退回差分法"""
+    elos = [random.Random(7).randint(600, 2400) for _ in range(44)]
+    started = time.perf_counter()
+    team_a, used = split_teams(elos, 'exact', time_budget_ms=10)
+    assert time.perf_counter() - started < 0.2
+    assert used == 'greedy'
+    assert len(team_a) == 22 == len(set(team_a))
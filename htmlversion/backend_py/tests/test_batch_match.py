@@ -0,0 +1,80 @@
+import random
+import textwrap
+from itertools import combinations
+
+from tests.conftest import run_python
+from utils.batch_match import MATCH_SIZE, batch_match, best_split
+
+def brute_force_diff(elos):
+    total = sum(elos)
+    return min(abs(2 * sum(elos[i] for i in team) - total) for team in combinations(range(MATCH_SIZE), 5))
+
+def test_best_split_is_optimal():
+    rng = random.Random(1)
+    for _ in range(50):
+        elos = [rng.randint(600, 2400) for _ in range(MATCH_SIZE)]
+        diff, team = best_split(elos)
+        assert len(team) == 5
+        assert abs(diff) == brute_force_diff(elos)
+        assert diff == 2 * sum(elos[i] for i in team) - sum(elos)
+
+def test_batch_match_assigns_every_player_once():
+    rng = random.Random(2)
+    players = [{"player_id": f"p{i}", "elo": rng.randint(600, 2400)} for i in range(237)]
+    matches, unassigned = batch_match(players, time_budget_ms=None)
+
+    assert len(matches) == 23
+    assert unassigned == players[230:]
+    assigned = [p['player_id'] for m in matches for p in m['teamA'] + m['teamB']]
+    assert sorted(assigned) == sorted(p['player_id'] for p in players[:230])
+    for m in matches:
+        assert len(m['teamA']) == len(m['teamB']) == 5
+
+def test_batch_match_beats_sorted_chunks():
+    """交换改进后总差值不大于"排序后每 10 人一场再精确分队"的基线"""
+    rng = random.Random(3)
+    players = [{"player_id": f"p{i}", "elo": rng.randint(600, 2400)} for i in range(200)]
+    matches, _ = batch_match(players, time_budget_ms=None)
+
+    def total_diff(match_list):
+        return sum(abs(sum(p['elo'] for p in m['teamA']) - sum(p['elo'] for p in m['teamB'])) for m in match_list)
+
+    elos = sorted(p['elo'] for p in players)
+    baseline = sum(abs(best_split(elos[i:i + MATCH_SIZE])[0]) for i in range(0, len(elos), MATCH_SIZE))
+    assert total_diff(matches) <= baseline
+
+def test_importing_main_does_not_load_storage(data_dir):
+    """spawn 子进程会把 main 作为 __mp_main__ 重新导入，导入时不能载入数据"""
+    out = run_python(textwrap.dedent("""
+        import main
+        from utils import storage
+        print(len(storage._store))
+    """), {"STORAGE_DATA_DIR": str(data_dir)})
+    assert out.strip() == "0"
+
+def test_writes_after_batch_match_survive_shutdown(data_dir):
+    env = {"STORAGE_DATA_DIR": str(data_dir), "STORAGE_MODE": "journal", "STORAGE_BACKEND": "json"}
+    out = run_python(textwrap.dedent("""
+        import main
+        from fastapi.testclient import TestClient
+
+        def register(c, name):
+            r = c.post('/api/auth/register', json={'nickname': name}).json()
+            assert r['code'] == 0, r
+            return r['data']['player_id']
+
+        with TestClient(main.app) as c:
+            ids = [register(c, f'a{i}') for i in range(60)]
+            r = c.post('/api/match/batch', json={'player_ids': ids}).json()
+            assert r['code'] == 0 and len(r['data']['matches']) == 6, r
+            for i in range(20):
+                register(c, f'b{i}')
+    """), env)
+    assert out.count("Data storage initialized") == 1, out
+
+    out = run_python(textwrap.dedent("""
+        from utils import storage
+        storage.init_storage()
+        print(len(storage.get_collection('players')))
+    """), env)
+    assert out.strip().splitlines()[-1] == "80"
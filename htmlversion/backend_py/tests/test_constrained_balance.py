@@ -0,0 +1,112 @@
+"""带约束的分队：分支定界与穷举对比"""
+import random
+from itertools import combinations
+
+import pytest
+
+from utils import constrained_balance
+from utils.constrained_balance import balance_with_constraints
+
+def _cost(players, kd, team_a_ids):
+    """(平均 ELO 之差取整, 平均 K/D 之差)：K/D 只在 ELO 差相同时比较"""
+    a = [p for p in players if p['player_id'] in team_a_ids]
+    b = [p for p in players if p['player_id'] not in team_a_ids]
+    elo_gap = abs(sum(p['elo'] for p in a) * len(b) - sum(p['elo'] for p in b) * len(a)) / (len(a) * len(b))
+    kd_gap = abs(sum(kd[p['player_id']] for p in a) / len(a) - sum(kd[p['player_id']] for p in b) / len(b))
+    return round(elo_gap), kd_gap
+
+def _brute_force(players, kd, parties, previous):
+    """满足全部约束的最小代价，没有可行方案时为 None"""
+    n = len(players)
+    ids = [p['player_id'] for p in players]
+    first, second = sorted(range(n), key=lambda i: -players[i]['elo'])[:2]
+    best = None
+    for team in combinations(range(n), n // 2):
+        team_a = {ids[i] for i in team}
+        if any(set(party) & team_a and not set(party) <= team_a for party in parties):
+            continue
+        if (first in team) == (second in team):
+            continue
+        if previous and team_a in (set(previous[0]), set(previous[1])):
+            continue
+        cost = _cost(players, kd, team_a)
+        if best is None or cost[0] < best[0] or cost[0] == best[0] and cost[1] < best[1] - 1e-9:
+            best = cost
+    return best
+
+def _case(seed: int):
+    rng = random.Random(seed)
+    n = rng.choice([4, 6, 8, 9, 10, 10])
+    players = [{"player_id": f"p{i}", "elo": rng.randint(600, 2400)} for i in range(n)]
+    kd = {p['player_id']: round(rng.uniform(0.5, 1.8), 2) for p in players}
+    parties = [[f"p{i}" for i in rng.sample(range(n), rng.randint(2, 3))]] if n >= 6 else []
+    previous = None
+    if rng.random() < 0.5:
+        order = [f"p{i}" for i in rng.sample(range(n), n)]
+        previous = (order[:n // 2], order[n // 2:])
+    return players, kd, parties, previous
+
+@pytest.mark.parametrize("seed", range(40))
+def test_matches_brute_force(seed):
+    players, kd, parties, previous = _case(seed)
+    result = balance_with_constraints(players, kd, parties, previous, time_budget_ms=None)
+    best = _brute_force(players, kd, parties, previous)
+    team_a_ids = {p['player_id'] for p in result['teamA']}
+    assert len(result['teamA']) == len(players) // 2
+    if best is None:
+        assert result['relaxed']
+        return
+    assert result['optimal'] and result['relaxed'] == []
+    elo_gap, kd_gap = _cost(players, kd, team_a_ids)
+    assert elo_gap == best[0] and kd_gap == pytest.approx(best[1])
+
+def test_kd_only_breaks_elo_ties():
+    players = [{"player_id": f"p{i}", "elo": elo} for i, elo in enumerate([1000, 1000, 1100, 1100])]
+    # p0+p2 / p1+p3 与 p0+p3 / p1+p2 的 ELO 差都是 0，选 K/D 更接近的一种
+    kd = {"p0": 2.0, "p1": 0.5, "p2": 0.5, "p3": 1.0}
+    result = balance_with_constraints(players, kd, split_top=False)
+    assert result['elo_diff'] == 0
+    assert {p['player_id'] for p in result['teamA']} in ({"p0", "p2"}, {"p1", "p3"})
+    # K/D 差距再大也不换更大的 ELO 差
+    kd = {"p0": 5.0, "p1": 5.0, "p2": 0.1, "p3": 0.1}
+    result = balance_with_constraints(players, kd, split_top=False)
+    assert result['elo_diff'] == 0
+
+def test_constraints_hold():
+    players = [{"player_id": f"p{i}", "elo": 1000 + 100 * i} for i in range(10)]
+    previous = (["p0", "p2", "p4", "p6", "p8"], ["p1", "p3", "p5", "p7", "p9"])
+    result = balance_with_constraints(players, parties=[["p0", "p1", "p2"]], previous=previous)
+    team_a = {p['player_id'] for p in result['teamA']}
+    assert {"p0", "p1", "p2"} <= team_a or not {"p0", "p1", "p2"} & team_a
+    assert ("p9" in team_a) != ("p8" in team_a)
+    assert team_a not in (set(previous[0]), set(previous[1]))
+
+def test_relaxes_impossible_constraints():
+    players = [{"player_id": f"p{i}", "elo": 1000 + i} for i in range(4)]
+    # 车队里有两名最高分玩家：split_top 无法满足
+    result = balance_with_constraints(players, parties=[["p2", "p3"]])
+    assert result['relaxed'] == ['split_top']
+    # 车队超过一队的人数
+    result = balance_with_constraints(players, parties=[["p0", "p1", "p2"]])
+    assert 'parties' in result['relaxed']
+    assert len(result['teamA']) == 2
+
+def test_fallback_reports_only_active_constraints(monkeypatch):
+    """超时前没有找到方案、退回只平衡 ELO 时，relaxed 只列出本来生效的约束"""
+    def run(self, fix_first):
+        self.timed_out = True
+    monkeypatch.setattr(constrained_balance._Search, "run", run)
+    players = [{"player_id": f"p{i}", "elo": 1000 + 10 * i} for i in range(6)]
+    result = balance_with_constraints(players, split_top=False)
+    assert result['relaxed'] == [] and not result['optimal']
+    previous = (["p0", "p1", "p2"], ["p3", "p4", "p5"])
+    result = balance_with_constraints(players, previous=previous)
+    assert result['relaxed'] == ['split_top', 'avoid']
+    result = balance_with_constraints(players, parties=[["p0", "p1"]], split_top=False)
+    assert result['relaxed'] == ['parties']
+
+def test_time_budget_returns_a_split():
+    rng = random.Random(1)
+    players = [{"player_id": f"p{i}", "elo": rng.randint(600, 2400)} for i in range(24)]
+    result = balance_with_constraints(players, time_budget_ms=1)
+    assert len(result['teamA']) == len(result['teamB']) == 12
@@ -0,0 +1,77 @@
+"""只读文档视图：读取不复制，修改时写时复制"""
+import json
+
+import pytest
+
+from utils import storage
+from utils.docview import DocumentView, ReadOnlyDict, ReadOnlyList, thaw
+
+NAME = 'docview_rooms'
+
+def _stored(doc_id: str) -> dict:
+    return storage._get_data(NAME).docs[doc_id]
+
+@pytest.fixture
+def rooms():
+    collection = storage.Collection(NAME)
+    collection.insert_one({"_id": "v1", "status": "waiting", "players": [{"player_id": "p1", "ready": False}],
+                           "meta": {"mode": "5v5"}})
+    yield collection
+    collection.delete_one({"_id": "v1"})
+
+def test_readonly_returns_view_without_copy(rooms):
+    view = rooms.find_by_id("v1", readonly=True)
+    assert isinstance(view, DocumentView)
+    assert view._data is _stored("v1")
+    assert isinstance(view['players'], ReadOnlyList)
+    assert isinstance(view['players'][0], ReadOnlyDict)
+    assert view['players'][0]['player_id'] == "p1"
+    assert view == rooms.find_by_id("v1")
+
+def test_top_level_write_copies(rooms):
+    view = rooms.find_one({"status": "waiting"}, readonly=True)
+    view['status'] = "ready"
+    del view['meta']
+    assert view['status'] == "ready" and 'meta' not in view
+    stored = _stored("v1")
+    assert stored['status'] == "waiting" and 'meta' in stored
+
+def test_nested_values_are_read_only(rooms):
+    view = rooms.find_by_id("v1", readonly=True)
+    with pytest.raises(TypeError):
+        view['players'][0]['ready'] = True
+    with pytest.raises(TypeError):
+        view['meta']['mode'] = "2v2"
+    with pytest.raises(AttributeError):
+        view['players'].append({"player_id": "p2"})
+    assert _stored("v1")['players'][0]['ready'] is False
+
+def test_to_dict_is_independent_copy(rooms):
+    view = rooms.find_by_id("v1", readonly=True)
+    doc = view.to_dict()
+    assert type(doc) is dict and type(doc['players']) is list and type(doc['players'][0]) is dict
+    doc['players'][0]['ready'] = True
+    assert _stored("v1")['players'][0]['ready'] is False
+    json.dumps(doc)
+
+def test_view_does_not_see_later_writes(rooms):
+    view = rooms.find_by_id("v1", readonly=True)
+    rooms.update_one({"_id": "v1"}, {"$set": {"status": "ready"}})
+    assert view['status'] == "waiting"
+    assert rooms.find_by_id("v1")['status'] == "ready"
+
+def test_writing_views_back_stores_plain_values(rooms):
+    view = rooms.find_by_id("v1", readonly=True)
+    rooms.update_one({"_id": "v1"}, {"$set": {"copy": view['players']}, "$push": {"history": view['meta']}})
+    stored = _stored("v1")
+    assert type(stored['copy']) is list and type(stored['copy'][0]) is dict
+    assert type(stored['history'][0]) is dict
+    assert stored['copy'] is not stored['players']
+    rooms.insert_one({"_id": "v2", "players": view['players']})
+    assert type(_stored("v2")['players'][0]) is dict
+    rooms.delete_one({"_id": "v2"})
+
+def test_thaw_nested_views():
+    data = {"a": [{"b": 1}]}
+    thawed = thaw(ReadOnlyDict(data))
+    assert thawed == data and thawed is not data and thawed['a'] is not data['a']
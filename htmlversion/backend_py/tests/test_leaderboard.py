@@ -0,0 +1,31 @@
+"""排行榜的增量维护"""
+from utils.leaderboard import Leaderboard
+
+def _player(pid: str, elo: int, updated_at: str) -> dict:
+    return {"_id": pid, "nickname": pid, "elo": elo, "updated_at": updated_at}
+
+def _board() -> Leaderboard:
+    board = Leaderboard()
+    board.top(1)
+    return board
+
+def test_stale_update_is_ignored():
+    """两场比赛的提交乱序调用 update 时保留较新的文档"""
+    board = _board()
+    board.update([_player("lb-a", 1000, "2024-01-01T10:00:00")])
+    board.update([_player("lb-a", 1040, "2024-01-01T10:00:02.000001")])
+    board.update([_player("lb-a", 1020, "2024-01-01T10:00:01.500000")])
+    row, _ = board.rank_of("lb-a")
+    assert row['elo'] == 1040
+
+def test_updates_reorder_players():
+    board = _board()
+    board.update([_player("lb-b", 1100, "2024-01-01T10:00:00"), _player("lb-c", 1050, "2024-01-01T10:00:00")])
+    board.update([_player("lb-c", 1200, "2024-01-01T10:00:05")])
+    assert board.rank_of("lb-c")[0]['rank'] < board.rank_of("lb-b")[0]['rank']
+    # 删除（其他进程的删除经变化回调到达）
+    board.external_change("lb-c", None)
+    assert board.rank_of("lb-c")[0] is None
+    # 删除后重新注册的玩家不受旧记录影响
+    board.update([_player("lb-c", 900, "2024-01-01T09:00:00")])
+    assert board.rank_of("lb-c")[0]['elo'] == 900
@@ -0,0 +1,59 @@
+"""实时推送：订阅时快照与增量的衔接"""
+import asyncio
+
+from routers import live
+from utils.pubsub import broker, publish_room, room_channel
+from utils.storage import get_collection
+
+def _new_room(room_id: str):
+    get_collection('rooms').insert_one({"_id": room_id, "status": "waiting", "players": []})
+
+def _write(room_id: str, status: str):
+    room = get_collection('rooms').find_one_and_update({"_id": room_id}, {"$set": {"status": status}})
+    publish_room(room_id, room)
+
+async def _drain(sub):
+    messages = []
+    while not sub.queue.empty():
+        messages.append(await sub.get())
+    return messages
+
+def test_open_keeps_delta_written_after_snapshot():
+    """读取快照之后、回到事件循环之前发布的增量不能丢"""
+    _new_room("live-after")
+
+    def load():
+        result = live._load_room("live-after")
+        _write("live-after", "ready")
+        return result
+
+    async def scenario():
+        sub, first = await live._open(room_channel("live-after"), load)
+        try:
+            return first, await _drain(sub)
+        finally:
+            broker.unsubscribe(sub)
+
+    first, queued = asyncio.run(scenario())
+    assert first['type'] == 'snapshot' and first['data']['status'] == 'waiting'
+    assert [m['data']['status'] for m in queued] == ['ready']
+    assert queued[0]['version'] > first['version']
+
+def test_open_drops_delta_included_in_snapshot():
+    """读取快照之前发布的增量已包含在快照中，丢弃"""
+    _new_room("live-before")
+
+    def load():
+        _write("live-before", "ready")
+        return live._load_room("live-before")
+
+    async def scenario():
+        sub, first = await live._open(room_channel("live-before"), load)
+        try:
+            return first, await _drain(sub)
+        finally:
+            broker.unsubscribe(sub)
+
+    first, queued = asyncio.run(scenario())
+    assert first['data']['status'] == 'ready'
+    assert queued == []
@@ -0,0 +1,54 @@
+"""匹配队列：ELO 窗口与等待时间"""
+from datetime import datetime, timedelta
+
+from utils.matchmaking import ELO_WINDOW, ELO_WINDOW_GROWTH, REJOIN_GRACE, MatchmakingQueue
+
+def _room(room_id: str, elos, status: str = "waiting", age: float = 0.0, player_ids=None) -> dict:
+    player_ids = player_ids or [f"{room_id}-{i}" for i in range(len(elos))]
+    return {
+        "_id": room_id,
+        "status": status,
+        "players": [{"player_id": pid, "elo": elo} for pid, elo in zip(player_ids, elos)],
+        "created_at": (datetime.now() - timedelta(seconds=age)).isoformat()
+    }
+
+def _queue(*rooms) -> MatchmakingQueue:
+    queue = MatchmakingQueue()
+    queue.room_of("")
+    for room in rooms:
+        queue.room_changed(room)
+    return queue
+
+def test_window_follows_joining_player_wait():
+    """房间等待得再久，刚开始等待的玩家也只接受基础窗口内的房间"""
+    far = 1000 + ELO_WINDOW + 10 * ELO_WINDOW_GROWTH
+    queue = _queue(_room("mm-old", [1000], age=3600))
+    assert queue.best_room(far) is None
+    assert queue.best_room(far, waited=5) is None
+    assert queue.best_room(far, waited=11) == "mm-old"
+
+def test_prefers_smallest_spread():
+    queue = _queue(_room("mm-a", [1000, 1200]), _room("mm-b", [1090, 1110]))
+    assert queue.best_room(1100) == "mm-b"
+    assert queue.best_room(1100, exclude=["mm-b"]) == "mm-a"
+
+def test_wait_clock_survives_rejoin_and_clears_when_placed():
+    queue = _queue()
+    start = 1_000_000.0
+    assert queue.waited("mm-p", now=start) == 0
+    queue.room_changed(_room("mm-r", [1000], player_ids=["mm-p"]))
+    assert queue.waited("mm-p", now=start + 30) == 30
+    # 离开后在宽限期内重新加入，继续计时
+    queue.room_changed(_room("mm-r", [1000], player_ids=["mm-q"]))
+    assert queue.room_of("mm-p") is None
+    assert queue.waited("mm-p", now=start + 40) == 40
+    # 进入开始匹配的房间后清除
+    queue.room_changed(_room("mm-s", [1000], player_ids=["mm-p"]))
+    queue.room_changed(_room("mm-s", [1000], status="matching", player_ids=["mm-p"]))
+    assert queue.waited("mm-p", now=start + 50) == 0
+
+def test_wait_clock_restarts_after_grace():
+    queue = _queue(_room("mm-g", [1000]))
+    queue.room_removed("mm-g")
+    left_at = queue.clocks["mm-g-0"][1]
+    assert queue.waited("mm-g-0", now=left_at + REJOIN_GRACE + 1) == 0
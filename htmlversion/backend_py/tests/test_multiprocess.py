@@ -0,0 +1,47 @@
+"""多进程模式：多个进程共用 data/ 时加入房间的互斥"""
+import os
+import subprocess
+import sys
+
+from tests.conftest import ROOT, run_python
+
+JOIN = '''
+import sys
+from utils import storage
+storage.init_storage()
+from routers.room import JoinRoomRequest, _join_lock, join_room
+assert _join_lock is storage.process_lock('room-join')
+for i in range(int(sys.argv[1]), int(sys.argv[2])):
+    result = join_room.__wrapped__(JoinRoomRequest(player_id=f"p{i}"))
+    assert result["code"] == 0, result
+storage.shutdown_storage()
+'''
+
+def test_joins_from_several_processes_fill_rooms(data_dir):
+    env = {"STORAGE_DATA_DIR": str(data_dir), "STORAGE_MULTIPROCESS": "1"}
+    run_python(
+        "from utils import storage\n"
+        "storage.init_storage()\n"
+        "with storage.transaction('players') as tx:\n"
+        "    for i in range(60):\n"
+        "        tx['players'].insert_one({'_id': f'p{i}', 'nickname': f'p{i}', 'elo': 1000})\n"
+        "storage.shutdown_storage()\n",
+        env
+    )
+    workers = [
+        subprocess.Popen([sys.executable, "-c", JOIN, str(start), str(start + 20)], cwd=ROOT,
+                         env={**os.environ, **env}, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        for start in (0, 20, 40)
+    ]
+    for worker in workers:
+        output, _ = worker.communicate(timeout=120)
+        assert worker.returncode == 0, output
+    out = run_python(
+        "from utils import storage\n"
+        "storage.init_storage()\n"
+        "rooms = storage.get_collection('rooms').find()\n"
+        "print(sorted(len(r['players']) for r in rooms))\n",
+        env
+    )
+    # 同样的 ELO 总是加入未满的房间：60 人正好 6 个满员房间
+    assert out.strip().splitlines()[-1] == str([10] * 6)
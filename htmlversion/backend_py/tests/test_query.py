@@ -0,0 +1,98 @@
+"""查询运算符、排序、分页和投影：JSON 存储与 SQLite 存储的结果一致"""
+import random
+
+import pytest
+
+from utils import storage
+from utils.index import Index
+from utils.query import matches_query, normalize_sort, sort_key
+from utils.sqlite_store import SQLiteCollection, SQLiteDatabase
+
+NAME = 'query_rooms'
+
+def _docs():
+    rng = random.Random(1)
+    docs = []
+    for i in range(300):
+        doc = {
+            "_id": f"r{i:04d}",
+            "status": rng.choice(["waiting", "ready", "playing", "finished"]),
+            "created_at": f"2026-01-{rng.randint(1, 28):02d}T00:00:{rng.randint(0, 59):02d}",
+            "elo": rng.choice([None, rng.randint(800, 2000)]),
+            "tags": rng.sample(["a", "b", "c", "d"], 2),
+            "players": [{"player_id": f"p{rng.randint(0, 20)}"}]
+        }
+        if rng.random() < 0.1:
+            del doc['elo']
+        docs.append(doc)
+    return docs
+
+DOCS = _docs()
+
+@pytest.fixture(scope='module')
+def backends(tmp_path_factory):
+    indexes = [Index(['status'], order_by='created_at')]
+    storage.INDEXES[NAME] = indexes
+    json_rooms = storage.Collection(NAME)
+    sqlite_rooms = SQLiteCollection(NAME, SQLiteDatabase(tmp_path_factory.mktemp("sqlite") / "q.db"), indexes)
+    for doc in DOCS:
+        json_rooms.insert_one(doc)
+        sqlite_rooms.insert_one(doc)
+    yield {"json": json_rooms, "sqlite": sqlite_rooms}
+    del storage.INDEXES[NAME]
+
+def _expected(query, sort, skip, limit):
+    found = [doc for doc in DOCS if matches_query(doc, query)]
+    spec = normalize_sort(sort)
+    if spec:
+        key, reverse = sort_key(spec)
+        found.sort(key=key, reverse=reverse)
+    return [doc['_id'] for doc in found][skip:None if limit is None else skip + limit]
+
+QUERIES = [
+    {},
+    {"status": {"$in": ["waiting", "ready"]}},
+    {"status": "waiting", "elo": {"$gte": 1000, "$lt": 1500}},
+    {"elo": {"$ne": None}},
+    {"elo": {"$gt": "x"}},
+    {"status": {"$nin": ["playing"]}},
+    {"status": {"$in": []}},
+    {"players.player_id": {"$in": ["p1", "p2"]}},
+    {"_id": {"$in": ["r0001", "r0005", "missing"]}},
+    {"_id": {"$gt": "r0290"}},
+]
+# SQLite 下推时假定顶层字段为标量，数组字段的"包含"查询只在 JSON 存储上检查
+ARRAY_QUERIES = [{"tags": "a"}, {"tags": {"$in": ["a"]}}, {"tags": {"$ne": "a"}}]
+SORTS = [None, "created_at", "-elo", [("created_at", -1)], [("elo", 1), ("created_at", -1)], [("status", 1), ("elo", -1)]]
+PAGES = [(0, None), (0, 10), (5, 7), (0, 0)]
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+@pytest.mark.parametrize("query", QUERIES)
+def test_find_matches_reference(backends, backend, query):
+    for sort in SORTS:
+        for skip, limit in PAGES:
+            found = backends[backend].find(query, sort=sort, skip=skip, limit=limit)
+            assert [doc['_id'] for doc in found] == _expected(query, sort, skip, limit), (sort, skip, limit)
+
+@pytest.mark.parametrize("query", ARRAY_QUERIES)
+def test_array_queries_on_json(backends, query):
+    for sort in SORTS:
+        found = backends["json"].find(query, sort=sort, limit=10)
+        assert [doc['_id'] for doc in found] == _expected(query, sort, 0, 10)
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_projection(backends, backend):
+    rooms = backends[backend]
+    found = rooms.find({"status": "waiting"}, sort="-created_at", limit=2, projection=["status"])
+    assert [set(doc) for doc in found] == [{"_id", "status"}] * 2
+    found = rooms.find({}, limit=1, projection={"players": 0, "_id": 0})
+    assert "_id" not in found[0] and "players" not in found[0] and "status" in found[0]
+    assert found == backends["sqlite" if backend == "json" else "json"].find({}, limit=1, projection={"players": 0, "_id": 0})
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_count_and_find_one(backends, backend):
+    rooms = backends[backend]
+    for query in QUERIES:
+        assert rooms.count(query) == len(_expected(query, None, 0, None))
+    first = rooms.find_one({"status": {"$in": ["ready"]}, "elo": {"$gte": 1500}})
+    assert first['_id'] == _expected({"status": "ready", "elo": {"$gte": 1500}}, None, 0, 1)[0]
@@ -0,0 +1,92 @@
+"""事务：异常回滚、唯一索引撤销、崩溃后补完提交"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from tests.conftest import ROOT, run_python
+from utils.index import DuplicateKeyError
+from utils.storage import get_collection, transaction
+
+class _Abort(Exception):
+    pass
+
+def test_exception_rolls_back_every_collection():
+    get_collection('players').insert_one({"_id": "tx-p1", "nickname": "tx-p1", "elo": 1000})
+    with pytest.raises(_Abort):
+        with transaction('players', 'matches') as tx:
+            tx['players'].update_one({"_id": "tx-p1"}, {"$inc": {"elo": 25}})
+            tx['matches'].insert_one({"_id": "tx-m1", "status": "finished"})
+            raise _Abort()
+    assert get_collection('players').find_by_id("tx-p1")['elo'] == 1000
+    assert get_collection('matches').find_by_id("tx-m1") is None
+
+def test_duplicate_key_undoes_earlier_writes_and_indexes():
+    players = get_collection('players')
+    players.insert_one({"_id": "tx-u1", "nickname": "tx-old", "elo": 1000})
+    players.insert_one({"_id": "tx-u2", "nickname": "tx-taken", "elo": 1000})
+    with pytest.raises(DuplicateKeyError):
+        with transaction('players') as tx:
+            tx['players'].update_one({"_id": "tx-u1"}, {"$set": {"nickname": "tx-new"}})
+            tx['players'].insert_one({"_id": "tx-u3", "nickname": "tx-added", "elo": 1000})
+            tx['players'].insert_one({"_id": "tx-u4", "nickname": "tx-taken", "elo": 1000})
+    assert players.find_by_id("tx-u1")['nickname'] == "tx-old"
+    assert players.find_by_id("tx-u3") is None
+    # 唯一索引同样恢复：撤销的昵称可以再用，原来的昵称仍然被占用
+    assert players.find_one({"nickname": "tx-old"})['_id'] == "tx-u1"
+    assert players.find_one({"nickname": "tx-new"}) is None
+    players.insert_one({"_id": "tx-u5", "nickname": "tx-new", "elo": 1000})
+    players.insert_one({"_id": "tx-u6", "nickname": "tx-added", "elo": 1000})
+    with pytest.raises(DuplicateKeyError):
+        players.insert_one({"_id": "tx-u7", "nickname": "tx-old", "elo": 1000})
+
+def test_clear_is_undone_by_rollback():
+    history = get_collection('elo_history')
+    history.insert_one({"_id": "tx-h1", "player_id": "tx-h"})
+    with pytest.raises(_Abort):
+        with transaction('elo_history') as tx:
+            assert tx['elo_history'].clear() == history.count()
+            assert tx['elo_history'].find() == []
+            raise _Abort()
+    assert history.find_one({"player_id": "tx-h"})['_id'] == "tx-h1"
+
+# 提交记录写入后、各集合生效前退出进程，模拟提交到一半时崩溃
+CRASH = '''
+import os
+from utils import storage
+storage.init_storage()
+storage.get_collection('players').insert_one({"_id": "c1", "nickname": "c1", "elo": 1000})
+storage.shutdown_storage()
+
+write_file_atomic = storage.write_file_atomic
+def crash_after_pending(path, payload):
+    write_file_atomic(path, payload)
+    if path.name.endswith(".pending"):
+        os._exit(3)
+storage.write_file_atomic = crash_after_pending
+
+with storage.transaction('players', 'matches') as tx:
+    tx['players'].update_one({"_id": "c1"}, {"$set": {"elo": 1025}})
+    tx['matches'].insert_one({"_id": "m1", "status": "finished"})
+'''
+
+CHECK = '''
+from utils import storage
+storage.init_storage()
+print(storage.get_collection('players').find_by_id("c1")['elo'],
+      storage.get_collection('matches').find_by_id("m1")['status'])
+print(sorted(p.name for p in storage.DATA_DIR.glob("*.pending")))
+'''
+
+@pytest.mark.parametrize("mode", ["snapshot", "journal"])
+def test_init_storage_rolls_interrupted_commit_forward(data_dir, mode):
+    env = {"STORAGE_DATA_DIR": str(data_dir), "STORAGE_MODE": mode, "STORAGE_FLUSH_INTERVAL": "0"}
+    crashed = subprocess.run([sys.executable, "-c", CRASH], cwd=ROOT, env={**os.environ, **env},
+                             capture_output=True, text=True, timeout=120)
+    assert crashed.returncode == 3, crashed.stdout + crashed.stderr
+    assert [p.name for p in data_dir.glob("*.pending")] == ["transaction.matches+players.pending"]
+
+    out = run_python(CHECK, env).strip().splitlines()
+    assert "✓ Recovered an interrupted transaction" in out
+    assert out[-2:] == ["1025 finished", "[]"]
@@ -0,0 +1,85 @@
+"""
+快照格式基准：对比各 STORAGE_FORMAT / STORAGE_COMPRESS 组合的保存、载入耗时和文件大小
+
+用法（在 backend_py 目录下）：
+    python -m tools.bench_serializer [--sizes 10000 100000 1000000] [--collections players rooms matches player_stats]
+                                     [--formats json orjson msgpack] [--repeat 3] [--dir /tmp/bench]
+
+文档由 tools/synthetic.py 按各集合实际的字段结构随机生成（固定种子）。保存 = 序列化 + 写临时文件 + fsync + 替换，
+与刷盘线程写快照的过程相同；载入 = 读文件 + 反序列化。每项取 --repeat 次中最快的一次。
+缺少依赖的格式会跳过。1M 场比赛的文档和序列化结果合计需要约 5GB 内存，内存不足时减小 --sizes。
+"""
+import argparse
+import gc
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tools.synthetic import GENERATORS
+from utils.serializer import FORMATS, get_serializer
+from utils.storage import write_file_atomic
+
+def bench(serializer, docs, directory: Path, repeat: int) -> dict:
+    """保存、载入 docs 各 repeat 次，返回最快的耗时和文件大小"""
+    path = directory / f"bench{serializer.suffix}"
+    save = load = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        write_file_atomic(path, serializer.dumps(docs))
+        save = min(save, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        loaded = serializer.loads(path.read_bytes())
+        load = min(load, time.perf_counter() - started)
+        assert len(loaded) == len(docs)
+        del loaded
+    size = path.stat().st_size
+    path.unlink()
+    return {"save": save, "load": load, "bytes": size}
+
+def available_serializers(formats, compressions):
+    serializers = []
+    for name in formats:
+        for compress in compressions:
+            try:
+                serializers.append(get_serializer(name, compress))
+            except RuntimeError as e:
+                print(f"  skip {name}{'+' + compress if compress else ''}: {e}")
+    return serializers
+
+def main():
+    parser = argparse.ArgumentParser(description="对比快照格式的保存 / 载入耗时和文件大小")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000, 1_000_000], help="每个集合的文档数")
+    parser.add_argument("--collections", nargs="+", choices=list(GENERATORS), default=list(GENERATORS))
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--no-zstd", action="store_true", help="不测试 zstd 压缩")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最快")
+    parser.add_argument("--dir", type=Path, help="写文件的目录（默认临时目录，应与 data/ 在同一类磁盘上）")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    serializers = available_serializers(args.formats, [''] if args.no_zstd else ['', 'zstd'])
+    directory = args.dir or Path(tempfile.mkdtemp(prefix="bench_serializer_"))
+    directory.mkdir(parents=True, exist_ok=True)
+
+    # 大小以第一个格式为基准
+    print(f"{'collection':<13} {'docs':>9} {'format':<13} {'size':>10} {'ratio':>8} {'save':>9} {'load':>9}")
+    for collection in args.collections:
+        for size in args.sizes:
+            docs = GENERATORS[collection](size, random.Random(args.seed))
+            baseline = None
+            for serializer in serializers:
+                result = bench(serializer, docs, directory, args.repeat)
+                baseline = baseline or result['bytes']
+                print(f"{collection:<13} {size:>9,} {serializer.name:<13} "
+                      f"{result['bytes'] / 1e6:>8.1f}MB {result['bytes'] / baseline:>7.0%} "
+                      f"{result['save']:>8.3f}s {result['load']:>8.3f}s", flush=True)
+            del docs
+            gc.collect()
+
+if __name__ == "__main__":
+    main()
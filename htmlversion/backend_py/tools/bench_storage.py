@@ -0,0 +1,268 @@
+"""
+存储微基准：测量各存储后端上 find_by_id / find_one / find / find_by_ids / count / update_one / insert_one / delete_one
+的延迟和吞吐，以及读操作每次调用分配的内存（tracemalloc 峰值，*_readonly 为 readonly=True 的只读视图）
+
+用法（在 backend_py 目录下）：
+    python -m tools.bench_storage [--backends snapshot journal sqlite] [--docs 10000] [--ops 2000]
+                                  [--collections players rooms matches player_stats]
+                                  [--json results.json] [--csv results.csv]
+                                  [--compare baseline.json] [--max-regression 0.2]
+
+每个后端在单独的子进程中运行（存储配置在导入时读取），数据写在临时目录（STORAGE_DATA_DIR），不影响 data/；
+STORAGE_FORMAT 等其他存储环境变量原样传给子进程。每个集合先用一个事务写入 --docs 条由 tools/synthetic.py
+生成的文档（固定种子），再对随机选取的文档依次执行各操作 --ops 次。查询条件使用路由中实际的查询字段。
+json 后端的写入由后台线程合并落盘，测得的是请求路径上的耗时；sqlite 后端每次写入都会提交。
+find_by_ids 每次取 10 个随机文档（一场比赛的玩家）。分配量在计时之后单独测量（tracemalloc 会拖慢执行），
+取前 ALLOC_SAMPLES 次调用的平均值。
+
+--json / --csv 保存结果（附带提交号和运行参数）；--compare 与之前保存的 JSON 结果逐项比较中位延迟，
+任一项变慢超过 --max-regression 时以状态 1 退出，可以作为存储改动上线前的检查。
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from itertools import islice
+from typing import Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from tools.synthetic import GENERATORS
+
+# 后端名 -> 子进程的环境变量
+BACKENDS = {
+    'snapshot': {"STORAGE_BACKEND": "json", "STORAGE_MODE": "snapshot"},
+    'journal': {"STORAGE_BACKEND": "json", "STORAGE_MODE": "journal"},
+    'sqlite': {"STORAGE_BACKEND": "sqlite"},
+}
+
+OPERATIONS = ['find_by_id', 'find_one', 'find', 'find_readonly', 'find_by_ids', 'find_by_ids_readonly',
+              'count', 'update_one', 'insert_one', 'delete_one']
+
+# 每种读操作测量分配量的调用次数
+ALLOC_SAMPLES = 200
+
+# 各集合的典型查询（与路由中的查询字段一致）
+QUERIES: Dict[str, Callable[[Dict], Dict]] = {
+    'players': lambda doc: {"nickname": doc['nickname']},
+    'rooms': lambda doc: {"status": doc['status']},
+    'matches': lambda doc: {"room_id": doc['room_id'], "status": doc['status']},
+    'player_stats': lambda doc: {"player_id": doc['player_id']},
+}
+
+# 各集合的典型更新
+UPDATES: Dict[str, Callable[[int], Dict]] = {
+    'players': lambda i: {"$set": {"elo": 1000 + i % 500}, "$inc": {"total_matches": 1}},
+    'rooms': lambda i: {"$set": {"elo_diff": i % 40}},
+    'matches': lambda i: {"$set": {"score_a": i % 14, "score_b": 13}},
+    'player_stats': lambda i: {"$inc": {"kills": 1}},
+}
+
+FIELDS = ['backend', 'collection', 'op', 'docs', 'ops', 'seconds', 'ops_per_sec',
+          'mean_us', 'p50_us', 'p95_us', 'p99_us', 'max_us', 'alloc_bytes']
+
+def percentile(sorted_values: List[int], q: float) -> int:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def summarize(backend: str, collection: str, op: str, docs: int, latencies: List[int],
+              allocations: Optional[List[int]] = None) -> Dict:
+    """latencies 为每次操作的纳秒耗时，allocations 为每次操作分配的字节数"""
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "backend": backend,
+        "collection": collection,
+        "op": op,
+        "docs": docs,
+        "ops": len(latencies),
+        "seconds": round(total / 1e9, 6),
+        "ops_per_sec": round(len(latencies) / (total / 1e9), 1) if total else None,
+        "mean_us": round(total / len(latencies) / 1e3, 2),
+        "p50_us": round(percentile(latencies, 0.50) / 1e3, 2),
+        "p95_us": round(percentile(latencies, 0.95) / 1e3, 2),
+        "p99_us": round(percentile(latencies, 0.99) / 1e3, 2),
+        "max_us": round(latencies[-1] / 1e3, 2),
+        "alloc_bytes": round(sum(allocations) / len(allocations)) if allocations else None,
+    }
+
+def timed(calls) -> List[int]:
+    """依次执行 calls 中的无参函数，返回每次的纳秒耗时"""
+    latencies = []
+    clock = time.perf_counter_ns
+    for call in calls:
+        started = clock()
+        call()
+        latencies.append(clock() - started)
+    return latencies
+
+def allocated(calls) -> List[int]:
+    """依次执行 calls 中的无参函数，返回每次执行期间分配内存的峰值（字节，含返回值）"""
+    sizes = []
+    tracemalloc.start()
+    try:
+        for call in calls:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            call()
+            sizes.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return sizes
+
+def bench_collection(storage, backend: str, name: str, docs: int, ops: int, seed: int) -> List[Dict]:
+    rng = random.Random(seed)
+    # 前 docs 条预先写入，后 ops 条用于 insert_one（ID 和唯一字段不重复）
+    generated = GENERATORS[name](docs + ops, rng)
+    seeded, extra = generated[:docs], generated[docs:]
+
+    started = time.perf_counter()
+    with storage.transaction(name) as tx:
+        for doc in seeded:
+            tx[name].insert_one(doc)
+    print(f"  {backend}/{name}: seeded {docs:,} documents in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+    col = storage.get_collection(name)
+    query = QUERIES[name]
+    update = UPDATES[name]
+    targets = [rng.choice(seeded) for _ in range(ops)]
+    batches = [[doc['_id'] for doc in rng.sample(seeded, min(10, docs))] for _ in range(ops)]
+
+    reads = {
+        'find_by_id': lambda: (lambda doc=doc: col.find_by_id(doc['_id']) for doc in targets),
+        'find_one': lambda: (lambda doc=doc: col.find_one(query(doc)) for doc in targets),
+        'find': lambda: (lambda doc=doc: col.find(query(doc)) for doc in targets),
+        'find_readonly': lambda: (lambda doc=doc: col.find(query(doc), readonly=True) for doc in targets),
+        'find_by_ids': lambda: (lambda ids=ids: col.find_by_ids(ids) for ids in batches),
+        'find_by_ids_readonly': lambda: (lambda ids=ids: col.find_by_ids(ids, readonly=True) for ids in batches),
+    }
+    latencies = {op: timed(calls()) for op, calls in reads.items()}
+    allocations = {op: allocated(islice(calls(), ALLOC_SAMPLES)) for op, calls in reads.items()}
+    latencies.update({
+        'count': timed(lambda doc=doc: col.count(query(doc)) for doc in targets),
+        'update_one': timed(
+            lambda doc=doc, i=i: col.update_one({"_id": doc['_id']}, update(i)) for i, doc in enumerate(targets)
+        ),
+        'insert_one': timed(lambda doc=doc: col.insert_one(doc) for doc in extra),
+        'delete_one': timed(lambda doc=doc: col.delete_one({"_id": doc['_id']}) for doc in extra),
+    })
+    return [summarize(backend, name, op, docs, latencies[op], allocations.get(op)) for op in OPERATIONS]
+
+def run_worker(backend: str, collections: List[str], docs: int, ops: int, seed: int) -> List[Dict]:
+    """在子进程中执行：环境变量已经选好了后端和数据目录"""
+    from utils import storage
+
+    storage.init_storage()
+    results = []
+    for name in collections:
+        results.extend(bench_collection(storage, backend, name, docs, ops, seed))
+    storage.shutdown_storage()
+    return results
+
+def run_backend(backend: str, args) -> List[Dict]:
+    with tempfile.TemporaryDirectory(prefix=f"bench_storage_{backend}_") as data_dir:
+        out = Path(data_dir) / "results.json"
+        env = {**os.environ, **BACKENDS[backend], "STORAGE_DATA_DIR": str(Path(data_dir) / "data")}
+        env.pop("SQLITE_PATH", None)
+        subprocess.run([
+            sys.executable, "-m", "tools.bench_storage", "--worker", backend, "--out", str(out),
+            "--docs", str(args.docs), "--ops", str(args.ops), "--seed", str(args.seed),
+            "--collections", *args.collections
+        ], cwd=ROOT, env=env, check=True, stdout=sys.stderr)
+        return json.loads(out.read_text())
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", "."], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_table(results: List[Dict]):
+    print(f"{'backend':<9} {'collection':<13} {'op':<20} {'ops/s':>11} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} "
+          f"{'max':>10} {'alloc':>11}")
+    for r in results:
+        alloc = f"{r['alloc_bytes']:>10,}B" if r.get('alloc_bytes') is not None else f"{'-':>11}"
+        print(f"{r['backend']:<9} {r['collection']:<13} {r['op']:<20} {r['ops_per_sec'] or 0:>11,.0f} "
+              f"{r['mean_us']:>7.1f}us {r['p50_us']:>7.1f}us {r['p95_us']:>7.1f}us {r['p99_us']:>7.1f}us "
+              f"{r['max_us']:>8.1f}us {alloc}")
+
+def compare(results: List[Dict], baseline: Dict, max_regression: float) -> bool:
+    """逐项比较中位延迟（比总吞吐更不受偶发停顿影响），打印变化，返回是否没有超出阈值的退化"""
+    old = {(r['backend'], r['collection'], r['op']): r for r in baseline['results']}
+    print(f"\nCompared with {baseline['meta'].get('commit', '?')} (max regression {max_regression:.0%}):")
+    ok = True
+    for r in results:
+        before = old.get((r['backend'], r['collection'], r['op']))
+        if not before or not before['p50_us'] or not r['p50_us']:
+            continue
+        change = before['p50_us'] / r['p50_us'] - 1
+        regressed = change < -max_regression
+        ok = ok and not regressed
+        print(f"  {'REGRESSION' if regressed else 'ok':<10} {r['backend']:<9} {r['collection']:<13} {r['op']:<20} "
+              f"p50 {before['p50_us']:>9.1f}us -> {r['p50_us']:>9.1f}us ({change:+.0%} speed)")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="测量各存储后端上集合操作的延迟和吞吐")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument("--collections", nargs="+", choices=list(GENERATORS), default=list(GENERATORS))
+    parser.add_argument("--docs", type=int, default=10_000, help="每个集合预先写入的文档数")
+    parser.add_argument("--ops", type=int, default=2_000, help="每种操作执行的次数")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", type=Path, help="把结果写入 JSON 文件")
+    parser.add_argument("--csv", type=Path, help="把结果写入 CSV 文件")
+    parser.add_argument("--compare", type=Path, help="与之前保存的 JSON 结果比较")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="允许的变慢比例")
+    parser.add_argument("--worker", choices=list(BACKENDS), help=argparse.SUPPRESS)
+    parser.add_argument("--out", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        results = run_worker(args.worker, args.collections, args.docs, args.ops, args.seed)
+        args.out.write_text(json.dumps(results))
+        return
+
+    results = []
+    for backend in args.backends:
+        results.extend(run_backend(backend, args))
+
+    meta = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "docs": args.docs,
+        "ops": args.ops,
+        "seed": args.seed,
+        "env": {k: v for k, v in os.environ.items() if k.startswith("STORAGE_")},
+    }
+    print_table(results)
+
+    if args.json:
+        args.json.write_text(json.dumps({"meta": meta, "results": results}, ensure_ascii=False, indent=2))
+    if args.csv:
+        with open(args.csv, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['commit'] + FIELDS)
+            writer.writeheader()
+            for r in results:
+                writer.writerow({"commit": meta['commit'], **r})
+
+    if args.compare:
+        if not compare(results, json.loads(args.compare.read_text()), args.max_regression):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
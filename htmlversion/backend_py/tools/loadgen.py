@@ -0,0 +1,418 @@
+"""
+端到端压测：模拟若干组 10 人完整走一遍对局流程，找出单节点的饱和点
+
+每个模拟玩家：注册 → 登录 → 循环 [加入房间 → 准备 → 分队 → BP（两队同时开始 BP，三轮投票）
+→ 自动保存比分 → 提交结果]。凑满 10 人的房间由第 10 个加入的玩家驱动流程，房间里的玩家并发发送
+准备、投票等请求（每队 4 人投同一张图、1 人随机投，--think-ms 给每个操作加随机延迟）。
+
+用法（在 backend_py 目录下）：
+    python -m tools.loadgen [--groups 4] [--duration 30]                # 进程内驱动应用，数据写在临时目录
+    python -m tools.loadgen --groups 1 2 4 8 16 --duration 20           # 逐级加压
+    python -m tools.loadgen --url http://127.0.0.1:3000 --groups 8      # 压测已启动的服务
+
+进程内模式通过 httpx 的 ASGITransport 直接调用应用（与服务共用一个 CPU，结果偏保守）；
+实时推送不参与压测，流程推进以接口返回为准。
+
+报告：
+    每个接口的请求数、错误数、预期内被拒绝的请求数（投票在本轮已结束后到达等）、延迟分位数和直方图；
+    每秒完成的完整流程数；
+    丢失更新：准备 / 投票后房间或 BP 状态没有推进、两队开始 BP 得到不同的记录，
+    以及结束时逐个核对玩家的 total_matches 与实际参加并提交成功的场数。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# 与 routers/room.py 中的 ROOM_SIZE 一致
+ROOM_SIZE = 10
+
+# BP 流程：A Ban -> B Ban -> A Pick（与 routers/bp.py 一致）
+BP_FLOW = [('A', 'ban'), ('B', 'ban'), ('A', 'pick')]
+
+# 直方图的桶上限（毫秒）
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.rejected = 0
+
+class Stats:
+    """一轮压测的统计"""
+
+    def __init__(self):
+        self.endpoints: Dict[str, EndpointStats] = {}
+        self.lifecycles = 0
+        self.lost_updates: Dict[str, int] = {}
+        self.failures: Dict[str, int] = {}
+        self.started = time.perf_counter()
+
+    def endpoint(self, name: str) -> EndpointStats:
+        stats = self.endpoints.get(name)
+        if stats is None:
+            stats = self.endpoints[name] = EndpointStats()
+        return stats
+
+    def lost(self, what: str):
+        self.lost_updates[what] = self.lost_updates.get(what, 0) + 1
+
+    def failed(self, what: str):
+        self.failures[what] = self.failures.get(what, 0) + 1
+
+    @property
+    def requests(self) -> int:
+        return sum(len(s.latencies) for s in self.endpoints.values())
+
+    @property
+    def errors(self) -> int:
+        return sum(s.errors for s in self.endpoints.values())
+
+class RequestFailed(Exception):
+    pass
+
+class Api:
+    """带计时的接口调用：响应 code 不在 accept 中时记为错误并抛出 RequestFailed"""
+
+    def __init__(self, client: httpx.AsyncClient, stats: Stats):
+        self.client = client
+        self.stats = stats
+
+    async def call(self, method: str, path: str, endpoint: str, body: Optional[Dict] = None,
+                   accept=(0,), reject=()) -> Dict:
+        stats = self.stats.endpoint(f"{method} {endpoint}")
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, json=body)
+            result = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            stats.latencies.append(time.perf_counter() - started)
+            stats.errors += 1
+            raise RequestFailed(f"{method} {path}: {e}")
+        stats.latencies.append(time.perf_counter() - started)
+        code = result.get('code')
+        if code in reject:
+            stats.rejected += 1
+        elif code not in accept:
+            stats.errors += 1
+            raise RequestFailed(f"{method} {path}: {code} {result.get('message')}")
+        return result
+
+    async def post(self, path: str, body: Dict, **kwargs) -> Dict:
+        return await self.call('POST', path, path, body, **kwargs)
+
+    async def get(self, path: str, endpoint: str, **kwargs) -> Dict:
+        return await self.call('GET', path, endpoint, **kwargs)
+
+class Player:
+    def __init__(self, nickname: str):
+        self.nickname = nickname
+        self.player_id: Optional[str] = None
+        self.finished_matches = 0
+        self.elo: Optional[int] = None
+
+class Room:
+    """凑人中的房间：第 ROOM_SIZE 个加入的玩家驱动流程，其余玩家等待流程结束"""
+
+    def __init__(self, room_id: str):
+        self.room_id = room_id
+        self.players: List[Player] = []
+        self.done = asyncio.Event()
+
+class LoadGenerator:
+    def __init__(self, api: Api, args, rng: random.Random):
+        self.api = api
+        self.stats = api.stats
+        self.args = args
+        self.rng = rng
+        self.rooms: Dict[str, Room] = {}
+        self.stop = asyncio.Event()
+
+    async def think(self):
+        if self.args.think_ms:
+            await asyncio.sleep(self.rng.uniform(0, self.args.think_ms) / 1000)
+
+    async def register(self, player: Player):
+        result = await self.api.post('/api/auth/register', {"nickname": player.nickname})
+        player.player_id = result['data']['player_id']
+        await self.api.post('/api/auth/login', {"nickname": player.nickname})
+
+    async def player_loop(self, player: Player):
+        await self.register(player)
+        while not self.stop.is_set():
+            try:
+                result = await self.api.post('/api/room/join', {"player_id": player.player_id})
+            except RequestFailed:
+                self.stats.failed('join')
+                continue
+            room_id = result['data']['_id']
+            room = self.rooms.setdefault(room_id, Room(room_id))
+            room.players.append(player)
+            if len(room.players) == ROOM_SIZE:
+                del self.rooms[room_id]
+                try:
+                    await self.lifecycle(room)
+                except RequestFailed as e:
+                    self.stats.failed(str(e).split(':')[0])
+                finally:
+                    room.done.set()
+            else:
+                stopped = asyncio.ensure_future(self.stop.wait())
+                await asyncio.wait([asyncio.ensure_future(room.done.wait()), stopped],
+                                   return_when=asyncio.FIRST_COMPLETED)
+                stopped.cancel()
+
+    async def lifecycle(self, room: Room):
+        api, rid, players = self.api, room.room_id, room.players
+        by_id = {p.player_id: p for p in players}
+
+        # 准备：10 人并发
+        async def ready(player: Player):
+            await self.think()
+            await api.post('/api/room/ready', {"player_id": player.player_id, "room_id": rid, "ready": True})
+        await asyncio.gather(*(ready(p) for p in players))
+        state = (await api.get(f'/api/room/{rid}', '/api/room/{room_id}'))['data']
+        if state['status'] != 'ready':
+            self.stats.lost('room ready')
+            return
+
+        # 分队
+        teams = (await api.post('/api/match/start', {"room_id": rid}))['data']
+        team_ids = {
+            'A': [p['player_id'] for p in teams['teamA']],
+            'B': [p['player_id'] for p in teams['teamB']],
+        }
+
+        # 两队同时开始 BP，应得到同一条记录
+        started = await asyncio.gather(*(
+            api.post('/api/bp/start', {"room_id": rid}) for _ in team_ids
+        ))
+        bp_ids = {r['data']['bp_id'] for r in started}
+        if len(bp_ids) != 1:
+            self.stats.lost('bp start')
+            return
+        bp_id = bp_ids.pop()
+
+        # 三轮投票：每队多数人投同一张图，并发发送
+        for step, (team, action) in enumerate(BP_FLOW):
+            bp = (await api.get(f'/api/bp/{bp_id}', '/api/bp/{bp_id}'))['data']
+            maps = bp['available_maps']
+            favourite = self.rng.choice(maps)
+            members = team_ids[team]
+            choices = [favourite] * (len(members) - 1) + [self.rng.choice(maps)]
+            self.rng.shuffle(choices)
+
+            async def vote(player_id: str, map_name: str):
+                await self.think()
+                await api.post('/api/bp/vote', {
+                    "bp_id": bp_id, "team": team, "map": map_name, "bp_action": action, "player_id": player_id
+                }, reject=(1001, 1005))
+            await asyncio.gather(*(vote(pid, m) for pid, m in zip(members, choices)))
+
+            bp = (await api.get(f'/api/bp/{bp_id}', '/api/bp/{bp_id}'))['data']
+            if bp['current_step'] != step + 1:
+                self.stats.lost('bp vote')
+                return
+
+        # 比赛：自动保存若干次后提交
+        match = (await api.get(f'/api/submit/{rid}', '/api/submit/{room_id}'))['data']
+        all_ids = team_ids['A'] + team_ids['B']
+        stats = [{
+            "player_id": pid,
+            "kills": self.rng.randint(5, 30),
+            "deaths": self.rng.randint(5, 25),
+            "assists": self.rng.randint(0, 10)
+        } for pid in all_ids]
+        for i in range(self.args.autosaves):
+            await self.think()
+            await api.post('/api/submit/update', {
+                "match_id": match['_id'],
+                "score_a": i, "score_b": i,
+                "player_stats": [{**s, "kills": s['kills'] * (i + 1) // (self.args.autosaves + 1)} for s in stats]
+            })
+        score_a = self.rng.choice([13, self.rng.randint(0, 11)])
+        score_b = 13 if score_a < 13 else self.rng.randint(0, 11)
+        result = await api.post('/api/submit/finish', {
+            "match_id": match['_id'], "score_a": score_a, "score_b": score_b, "player_stats": stats
+        })
+        changes = result['data']['elo_changes']
+        if len(changes) != len(all_ids):
+            self.stats.lost('elo changes')
+        for change in changes:
+            player = by_id[change['player_id']]
+            player.finished_matches += 1
+            player.elo = change['new_elo']
+        self.stats.lifecycles += 1
+
+    async def audit(self, players: List[Player]):
+        """核对每个玩家的场数和 ELO 与客户端记录的一致"""
+        for player in players:
+            if player.player_id is None:
+                continue
+            doc = (await self.api.get(f'/api/history/player-info/{player.player_id}',
+                                      '/api/history/player-info/{player_id}'))['data']
+            if doc['total_matches'] != player.finished_matches:
+                self.stats.lost('player total_matches')
+            elif player.elo is not None and doc['elo'] != player.elo:
+                self.stats.lost('player elo')
+
+    async def report_progress(self):
+        last_requests, last_time = 0, time.perf_counter()
+        while not self.stop.is_set():
+            try:
+                await asyncio.wait_for(self.stop.wait(), self.args.report_interval)
+            except asyncio.TimeoutError:
+                pass
+            now = time.perf_counter()
+            requests = self.stats.requests
+            print(f"  [{now - self.stats.started:6.1f}s] lifecycles {self.stats.lifecycles:5d}  "
+                  f"{(requests - last_requests) / (now - last_time):7.1f} req/s  errors {self.stats.errors}",
+                  file=sys.stderr, flush=True)
+            last_requests, last_time = requests, now
+
+    async def run(self, groups: int, run_id: str) -> float:
+        players = [Player(f"lg{run_id}_{i}") for i in range(groups * ROOM_SIZE)]
+        progress = asyncio.ensure_future(self.report_progress())
+        workers = [asyncio.ensure_future(self.player_loop(p)) for p in players]
+        await asyncio.sleep(self.args.duration)
+        self.stop.set()
+        # 已开始的流程走完再结束
+        await asyncio.gather(*workers, return_exceptions=True)
+        elapsed = time.perf_counter() - self.stats.started
+        progress.cancel()
+        await self.audit(players)
+        return elapsed
+
+def histogram(latencies: List[float]) -> str:
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    for seconds in latencies:
+        ms = seconds * 1000
+        counts[next((i for i, bound in enumerate(BUCKETS_MS) if ms <= bound), len(BUCKETS_MS))] += 1
+    top = max(counts) or 1
+    lines = []
+    lower = 0
+    for i, count in enumerate(counts):
+        if count:
+            label = f"{lower}-{BUCKETS_MS[i]}ms" if i < len(BUCKETS_MS) else f">{BUCKETS_MS[-1]}ms"
+            lines.append(f"      {label:>12} {count:>7} {'#' * max(1, round(40 * count / top))}")
+        lower = BUCKETS_MS[i] if i < len(BUCKETS_MS) else lower
+    return "\n".join(lines)
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def summarize(stats: Stats, groups: int, elapsed: float) -> Dict:
+    endpoints = {}
+    for name, s in sorted(stats.endpoints.items()):
+        values = sorted(s.latencies)
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": s.errors,
+            "rejected": s.rejected,
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p90_ms": round(percentile(values, 0.90) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+        }
+    return {
+        "groups": groups,
+        "seconds": round(elapsed, 2),
+        "lifecycles": stats.lifecycles,
+        "lifecycles_per_sec": round(stats.lifecycles / elapsed, 3),
+        "requests_per_sec": round(stats.requests / elapsed, 1),
+        "errors": stats.errors,
+        "failed_lifecycles": stats.failures,
+        "lost_updates": stats.lost_updates,
+        "endpoints": endpoints,
+    }
+
+def print_report(stats: Stats, summary: Dict, show_histograms: bool):
+    print(f"\n== {summary['groups']} groups ({summary['groups'] * ROOM_SIZE} players), {summary['seconds']}s ==")
+    print(f"{'endpoint':<40} {'requests':>8} {'errors':>6} {'rejected':>8} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for name, e in summary['endpoints'].items():
+        print(f"{name:<40} {e['requests']:>8} {e['errors']:>6} {e['rejected']:>8} "
+              f"{e['p50_ms']:>7.1f}ms {e['p90_ms']:>7.1f}ms {e['p99_ms']:>7.1f}ms {e['max_ms']:>7.1f}ms")
+        if show_histograms:
+            print(histogram(stats.endpoints[name].latencies))
+    print(f"lifecycles: {summary['lifecycles']} ({summary['lifecycles_per_sec']:.2f}/s), "
+          f"{summary['requests_per_sec']:.1f} req/s, errors: {summary['errors']}")
+    print(f"failed lifecycles: {summary['failed_lifecycles'] or 'none'}")
+    print(f"lost updates: {summary['lost_updates'] or 'none'}")
+
+async def run_level(make_client, groups: int, args, seed: int) -> Dict:
+    stats = Stats()
+    async with make_client() as client:
+        generator = LoadGenerator(Api(client, stats), args, random.Random(seed))
+        elapsed = await generator.run(groups, uuid.uuid4().hex[:8])
+    summary = summarize(stats, groups, elapsed)
+    print_report(stats, summary, not args.no_histograms)
+    return summary
+
+async def main_async(args):
+    if args.url:
+        def make_client():
+            return httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        # 进程内模式：导入应用之前选好数据目录（存储配置在导入时读取）
+        os.environ.setdefault("STORAGE_DATA_DIR", args.data_dir or tempfile.mkdtemp(prefix="loadgen_"))
+        import main
+        from utils.storage import init_storage
+        # ASGITransport 不发送 lifespan 事件，手动初始化存储
+        init_storage()
+        transport = httpx.ASGITransport(app=main.app)
+
+        def make_client():
+            return httpx.AsyncClient(transport=transport, base_url="http://loadgen", timeout=args.timeout)
+
+    summaries = []
+    for level, groups in enumerate(args.groups):
+        summaries.append(await run_level(make_client, groups, args, args.seed + level))
+
+    if len(summaries) > 1:
+        print(f"\n{'groups':>6} {'lifecycles/s':>13} {'req/s':>8} {'errors':>7} {'lost':>5} {'worst p99':>10}")
+        for s in summaries:
+            worst = max((e['p99_ms'] for e in s['endpoints'].values()), default=0)
+            print(f"{s['groups']:>6} {s['lifecycles_per_sec']:>13.2f} {s['requests_per_sec']:>8.1f} "
+                  f"{s['errors']:>7} {sum(s['lost_updates'].values()):>5} {worst:>8.1f}ms")
+
+    if args.json:
+        args.json.write_text(json.dumps({
+            "url": args.url, "duration": args.duration, "think_ms": args.think_ms,
+            "autosaves": args.autosaves, "levels": summaries
+        }, ensure_ascii=False, indent=2))
+
+    if not args.url:
+        from utils.storage import shutdown_storage
+        shutdown_storage()
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟多组玩家的完整对局流程进行压测")
+    parser.add_argument("--groups", nargs="+", type=int, default=[4], help="同时进行的组数（每组 10 人）；给出多个值时逐级运行")
+    parser.add_argument("--duration", type=float, default=30, help="每一级的持续时间（秒），之后不再开始新流程")
+    parser.add_argument("--url", help="压测已启动的服务，例如 http://127.0.0.1:3000（默认进程内驱动应用）")
+    parser.add_argument("--data-dir", help="进程内模式的数据目录（默认临时目录）")
+    parser.add_argument("--think-ms", type=float, default=0, help="每个玩家操作前的随机延迟上限（毫秒）")
+    parser.add_argument("--autosaves", type=int, default=3, help="每场比赛提交前自动保存的次数")
+    parser.add_argument("--timeout", type=float, default=30, help="单个请求的超时（秒）")
+    parser.add_argument("--report-interval", type=float, default=5, help="进度输出间隔（秒）")
+    parser.add_argument("--no-histograms", action="store_true", help="不输出延迟直方图")
+    parser.add_argument("--json", type=Path, help="把结果写入 JSON 文件")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+一次性迁移：把 data/ 下的快照（任一 STORAGE_FORMAT，以及 journal 模式下未压缩的日志）导入 SQLite
+
+用法（在 backend_py 目录下）：
+    python -m tools.migrate_to_sqlite [--db data/cs2battle.db] [--collections players rooms ...]
+
+迁移完成后以 STORAGE_BACKEND=sqlite 启动服务即可。同 _id 的文档会被覆盖，可重复执行。
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils import storage
+from utils.journal import Journal, replay
+from utils.serializer import snapshot_suffix
+from utils.sqlite_store import SQLiteDatabase, import_documents
+
+def load_json_collection(name: str):
+    """读取快照并重放残留的 journal"""
+    docs = storage.load_collection(name)
+    journal = Journal(storage.DATA_DIR / f"{name}.journal")
+    if journal.path.exists() or journal.rotated_path.exists():
+        docs = replay(docs, journal)
+    return docs
+
+def main():
+    parser = argparse.ArgumentParser(description="把 JSON 数据文件导入 SQLite")
+    parser.add_argument("--db", type=Path, default=storage.get_sqlite_path(), help="SQLite 数据库路径")
+    parser.add_argument("--collections", nargs="*", help="要迁移的集合（默认 data/ 下所有快照文件）")
+    args = parser.parse_args()
+
+    names = args.collections or sorted({
+        p.name[:-len(snapshot_suffix(p))] for p in storage.DATA_DIR.iterdir() if snapshot_suffix(p)
+    })
+    db = SQLiteDatabase(args.db)
+    start = time.perf_counter()
+    total = 0
+    for name in names:
+        docs = load_json_collection(name)
+        count = import_documents(db, name, docs, storage.INDEXES.get(name, ()))
+        total += count
+        print(f"  {name}: {count} documents")
+    db.close()
+
+    print(f"✓ Imported {total} documents into {args.db} in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
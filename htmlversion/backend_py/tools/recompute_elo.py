@@ -0,0 +1,139 @@
+"""
+ELO 重算工具：按 finished_at 顺序重放所有已完成的比赛，从头重建 ELO
+
+重建内容：
+    players       elo 以及 total_matches / wins / losses / total_kills / total_deaths
+    elo_history   清空后按重放结果重新生成
+    player_stats  elo_before / elo_after / elo_change
+
+用法（在 backend_py 目录下，先停止服务）：
+    python -m tools.recompute_elo [--dry-run] [--k-default 32 --low-elo 1200 ...]
+
+所有写入在一个事务中完成，中途失败不会留下一半的结果：比赛和玩家只读一遍（不复制），
+elo_history 整体清空后重新写入，事务内的写入都在内存中，提交时每个集合只落盘一次。
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils import storage
+from utils.elo import DEFAULT_CONFIG, DEFAULT_ELO, EloConfig, settle_matches
+
+COLLECTIONS = ('matches', 'players', 'player_stats', 'elo_history')
+
+def parse_config(args) -> EloConfig:
+    """命令行参数覆盖默认的 ELO 规则"""
+    overrides = {
+        field: getattr(args, field)
+        for field in EloConfig.__dataclass_fields__
+        if getattr(args, field) is not None
+    }
+    return EloConfig(**{**DEFAULT_CONFIG.__dict__, **overrides})
+
+def recompute(config: EloConfig, dry_run: bool = False) -> dict:
+    """重放所有比赛并写回结果，返回统计信息"""
+    started = time.perf_counter()
+    with storage.transaction(*COLLECTIONS) as tx:
+        players = tx['players']
+        player_stats = tx['player_stats']
+        elo_history = tx['elo_history']
+
+        finished = tx['matches'].find({"status": "finished"}, readonly=True)
+        finished.sort(key=lambda m: m.get('finished_at') or '')
+        player_docs = {p['_id']: p for p in players.find(readonly=True)}
+        loaded = time.perf_counter()
+
+        # 一次性结算全部比赛
+        ratings = {pid: DEFAULT_ELO for pid in player_docs}
+        results = settle_matches(finished, ratings, config)
+        computed = time.perf_counter()
+
+        counters = {
+            pid: {"total_matches": 0, "wins": 0, "losses": 0, "total_kills": 0, "total_deaths": 0}
+            for pid in player_docs
+        }
+        history = []
+        stat_updates = []
+        for match, changes in zip(finished, results):
+            winner = match.get('winner')
+            stats = {}
+            for s in match.get('player_stats') or []:
+                stats.setdefault(s['player_id'], s)
+            for change in changes:
+                pid = change['player_id']
+                stat = stats.get(pid)
+                is_winner = (
+                    (winner == 'A' and pid in match['teamA']) or
+                    (winner == 'B' and pid in match['teamB'])
+                )
+                counter = counters[pid]
+                counter['total_matches'] += 1
+                counter['wins'] += 1 if is_winner and winner != 'draw' else 0
+                counter['losses'] += 1 if not is_winner and winner != 'draw' else 0
+                counter['total_kills'] += stat['kills'] if stat else 0
+                counter['total_deaths'] += stat['deaths'] if stat else 0
+
+                history.append({
+                    "player_id": pid,
+                    "match_id": match['_id'],
+                    "elo_before": change['old_elo'],
+                    "elo_after": change['new_elo'],
+                    "elo_change": change['elo_change'],
+                    "reason": 'win' if is_winner else ('draw' if winner == 'draw' else 'loss'),
+                    "created_at": match.get('finished_at')
+                })
+                stat_updates.append((match['_id'], change))
+
+        if not dry_run:
+            for pid, counter in counters.items():
+                players.update_one({"_id": pid}, {"$set": {"elo": ratings[pid], **counter}})
+
+            elo_history.clear()
+            for doc in history:
+                elo_history.insert_one(doc)
+
+            for match_id, change in stat_updates:
+                player_stats.update_one(
+                    {"match_id": match_id, "player_id": change['player_id']},
+                    {"$set": {
+                        "elo_before": change['old_elo'],
+                        "elo_after": change['new_elo'],
+                        "elo_change": change['elo_change']
+                    }}
+                )
+    finished_at = time.perf_counter()
+
+    return {
+        "matches": len(finished),
+        "players": len(player_docs),
+        "load_seconds": loaded - started,
+        "compute_seconds": computed - loaded,
+        "total_seconds": finished_at - started,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="按 finished_at 顺序重放所有比赛，重建 ELO")
+    parser.add_argument("--dry-run", action="store_true", help="只计算并报告，不写回")
+    for field, default in DEFAULT_CONFIG.__dict__.items():
+        parser.add_argument(f"--{field.replace('_', '-')}", dest=field, type=float,
+                            help=f"默认 {default}")
+    args = parser.parse_args()
+
+    storage.init_storage()
+    report = recompute(parse_config(args), args.dry_run)
+    storage.shutdown_storage()
+
+    matches = report['matches']
+    print(f"✓ Replayed {matches} matches for {report['players']} players"
+          f"{' (dry run)' if args.dry_run else ''}")
+    print(f"  load:    {report['load_seconds']:.2f}s")
+    print(f"  compute: {report['compute_seconds']:.2f}s "
+          f"({matches / max(report['compute_seconds'], 1e-9):,.0f} matches/sec)")
+    print(f"  total:   {report['total_seconds']:.2f}s "
+          f"({matches / max(report['total_seconds'], 1e-9):,.0f} matches/sec)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+基准测试用的合成数据：按各集合实际的字段结构随机生成文档
+
+    docs = GENERATORS['matches'](10000, random.Random(1))
+
+同一种子生成的数据相同，不同提交之间的基准结果可以直接比较。
+玩家 ID 从固定的 ID 池中选取（池大小随文档数增长），使按玩家查询的结果数与真实数据接近。
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+START = datetime(2026, 1, 1)
+MAPS = ['inferno', 'mirage', 'dust2', 'nuke', 'overpass', 'ancient', 'anubis']
+ROOM_STATUSES = ['waiting', 'ready', 'matching', 'bp', 'playing', 'finished']
+
+def make_id(rng: random.Random, at: datetime) -> str:
+    """与 generate_id() 相同格式的 ID：时间戳 + 6 位随机数"""
+    return at.strftime('%Y%m%d%H%M%S%f') + ''.join(rng.choice('0123456789') for _ in range(6))
+
+def player_ids(count: int) -> List[str]:
+    return [f"{20260101000000000000 + i:020d}{i % 1000000:06d}" for i in range(count)]
+
+def gen_players(n: int, rng: random.Random) -> List[Dict]:
+    docs = []
+    for i, pid in enumerate(player_ids(n)):
+        at = (START + timedelta(seconds=i)).isoformat()
+        matches = rng.randint(0, 300)
+        wins = rng.randint(0, matches)
+        docs.append({
+            "_id": pid,
+            "nickname": f"player_{i}",
+            "steam_id": str(76561198000000000 + i),
+            "avatar": None,
+            "elo": rng.randint(600, 2400),
+            "total_matches": matches,
+            "wins": wins,
+            "losses": matches - wins,
+            "total_kills": rng.randint(0, matches * 30),
+            "total_deaths": rng.randint(0, matches * 30),
+            "created_at": at,
+            "updated_at": at
+        })
+    return docs
+
+def gen_rooms(n: int, rng: random.Random) -> List[Dict]:
+    pool = player_ids(max(1000, n))
+    docs = []
+    for i in range(n):
+        at = START + timedelta(seconds=i * 30)
+        status = rng.choice(ROOM_STATUSES)
+        players = rng.sample(pool, 10 if status != 'waiting' else rng.randint(1, 9))
+        teams = status not in ('waiting', 'ready')
+        docs.append({
+            "_id": make_id(rng, at),
+            "status": status,
+            "players": [{
+                "player_id": pid,
+                "nickname": f"player_{int(pid[:20]) - 20260101000000000000}",
+                "elo": rng.randint(600, 2400),
+                "ready": status != 'waiting' or rng.random() < 0.5,
+                "team": None
+            } for pid in players],
+            "teamA": players[:5] if teams else [],
+            "teamB": players[5:] if teams else [],
+            "elo_diff": rng.randint(0, 40) if teams else 0,
+            "created_at": at.isoformat(),
+            "updated_at": (at + timedelta(minutes=5)).isoformat()
+        })
+    return docs
+
+def _stats(rng: random.Random, players: List[str]) -> List[Dict]:
+    return [{
+        "player_id": pid,
+        "kills": rng.randint(0, 35),
+        "deaths": rng.randint(0, 30),
+        "assists": rng.randint(0, 15)
+    } for pid in players]
+
+def gen_matches(n: int, rng: random.Random) -> List[Dict]:
+    pool = player_ids(max(1000, n // 10))
+    docs = []
+    for i in range(n):
+        at = START + timedelta(minutes=i)
+        players = rng.sample(pool, 10)
+        score_a, score_b = rng.randint(0, 13), 13
+        if rng.random() < 0.5:
+            score_a, score_b = score_b, score_a
+        docs.append({
+            "_id": make_id(rng, at),
+            "room_id": make_id(rng, at),
+            "date": at.isoformat(),
+            "map": rng.choice(MAPS),
+            "teamA": players[:5],
+            "teamB": players[5:],
+            "score_a": score_a,
+            "score_b": score_b,
+            "winner": 'A' if score_a > score_b else 'B',
+            "mvp_id": None,
+            "status": "finished",
+            "player_stats": _stats(rng, players),
+            "created_at": at.isoformat(),
+            "finished_at": (at + timedelta(minutes=40)).isoformat()
+        })
+    return docs
+
+def gen_player_stats(n: int, rng: random.Random) -> List[Dict]:
+    pool = player_ids(max(1000, n // 100))
+    docs = []
+    for i in range(n):
+        at = START + timedelta(seconds=i * 6)
+        kills, deaths = rng.randint(0, 35), rng.randint(0, 30)
+        elo_before = rng.randint(600, 2400)
+        elo_change = rng.randint(-40, 40)
+        docs.append({
+            "_id": make_id(rng, at),
+            "match_id": make_id(rng, at - timedelta(seconds=i % 10)),
+            "player_id": rng.choice(pool),
+            "team": rng.choice('AB'),
+            "kills": kills,
+            "deaths": deaths,
+            "assists": rng.randint(0, 15),
+            "kd_ratio": kills / deaths if deaths > 0 else kills,
+            "elo_before": elo_before,
+            "elo_after": elo_before + elo_change,
+            "elo_change": elo_change,
+            "created_at": at.isoformat()
+        })
+    return docs
+
+GENERATORS = {
+    'players': gen_players,
+    'rooms': gen_rooms,
+    'matches': gen_matches,
+    'player_stats': gen_player_stats,
+}
@@ -0,0 +1,226 @@
+"""
+ELO 分队引擎
+
+目标：把 n 名玩家分成 n//2 与 n - n//2 两队，使两队平均 ELO 之差最小。
+队伍人数固定时，平均分之差只取决于 A 队总分与 k*T/n 的距离（k 为 A 队人数，T 为总分），
+所以问题等价于带人数约束的子集和问题。
+
+策略：
+    exact   折半搜索（meet-in-the-middle）：两半各枚举 2^(n/2) 个子集，
+            按人数分组排序后二分查找互补的总分，得到精确最优解
+    greedy  平衡差分法（Karmarkar-Karp 的等人数版本）得到初始解，
+            再用两两交换的局部搜索改进，适合大规模玩家池
+    auto    人数不超过 EXACT_LIMIT 时用 exact，否则用 greedy
+
+所有策略都接受时间预算：超时后返回当前找到的最好方案。
+"""
+import heapq
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+STRATEGIES = ('auto', 'exact', 'greedy')
+
+# auto 策略下使用精确解的最大人数（2^(n/2) 个子集，约 1-5ms）
+EXACT_LIMIT = 22
+
+# 默认时间预算（毫秒）
+DEFAULT_TIME_BUDGET_MS = 10.0
+
+class _Deadline:
+    """时间预算；每隔若干次检查一次时钟，降低开销"""
+
+    def __init__(self, budget_ms: Optional[float]):
+        self.end = None if budget_ms is None else time.perf_counter() + budget_ms / 1000
+        self.ticks = 0
+
+    def expired(self, every: int = 256) -> bool:
+        if self.end is None:
+            return False
+        self.ticks += 1
+        if self.ticks % every:
+            return False
+        return time.perf_counter() >= self.end
+
+# 枚举子集时每生成这么多个检查一次时间预算
+_CHUNK = 4096
+
+def _subset_sums(values: List[float], deadline: _Deadline) -> Optional[List[Tuple[float, int, int]]]:
+    """枚举所有子集，返回 (总分, 人数, 位掩码)；超出时间预算时返回 None"""
+    subsets = [(0, 0, 0)]
+    for i, v in enumerate(values):
+        bit = 1 << i
+        size = len(subsets)
+        for start in range(0, size, _CHUNK):
+            subsets += [(s + v, c + 1, m | bit) for s, c, m in subsets[start:min(start + _CHUNK, size)]]
+            if deadline.expired(every=1):
+                return None
+    return subsets
+
+def _exact(elos: List[float], k: int, deadline: _Deadline) -> Tuple[Optional[List[int]], bool]:
+    """折半搜索 A 队（k 人）的最优下标集合；返回 (下标, 是否完成搜索)
+
+    两半的子集表有 2^(n/2) 项，枚举和排序过程中也检查时间预算，表还没建好就超时时下标为 None。
+    """
+    n = len(elos)
+    target = k * sum(elos) / n
+    half = n // 2
+    left = elos[:half]
+    right = elos[half:]
+
+    # 左半部分按人数分组，组内按总分排序
+    left_sums = _subset_sums(left, deadline)
+    if left_sums is None:
+        return None, False
+    groups: Dict[int, List[Tuple[float, int]]] = {size: [] for size in range(len(left) + 1)}
+    for s, c, m in left_sums:
+        groups[c].append((s, m))
+    del left_sums
+    by_size: Dict[int, Tuple[List[float], List[int]]] = {}
+    for size, group in groups.items():
+        group.sort()
+        by_size[size] = ([s for s, _ in group], [m for _, m in group])
+        if deadline.expired(every=1):
+            return None, False
+    right_sums = _subset_sums(right, deadline)
+    if right_sums is None:
+        return None, False
+
+    best_err = float('inf')
+    best = (0, 0)
+    completed = True
+    for s_right, c_right, m_right in right_sums:
+        need = k - c_right
+        if need < 0 or need > len(left):
+            continue
+        sums, masks = by_size[need]
+        want = target - s_right
+        pos = bisect_left(sums, want)
+        for j in (pos - 1, pos):
+            if 0 <= j < len(sums):
+                err = abs(sums[j] - want)
+                if err < best_err:
+                    best_err = err
+                    best = (masks[j], m_right)
+        if best_err < 1e-9:
+            break
+        if deadline.expired():
+            completed = False
+            break
+
+    m_left, m_right = best
+    team_a = [i for i in range(half) if m_left >> i & 1]
+    team_a += [half + i for i in range(len(right)) if m_right >> i & 1]
+    return team_a, completed
+
+def _differencing(elos: List[float], k: int) -> List[int]:
+    """平衡差分法：按分数排序两两配对拆到两队，再用 KK 合并各对的差值"""
+    order = sorted(range(len(elos)), key=lambda i: elos[i], reverse=True)
+    if len(order) % 2:
+        order.append(-1)  # 虚拟玩家（0 分），所在的一队少一人
+
+    def value(i: int) -> float:
+        return elos[i] if i >= 0 else 0
+
+    # 堆元素：(-差值, 序号, 高分组, 低分组)
+    heap = []
+    for seq in range(0, len(order), 2):
+        hi, lo = order[seq], order[seq + 1]
+        heapq.heappush(heap, (-(value(hi) - value(lo)), seq, [hi], [lo]))
+    while len(heap) > 1:
+        d1, seq, hi1, lo1 = heapq.heappop(heap)
+        d2, _, hi2, lo2 = heapq.heappop(heap)
+        heapq.heappush(heap, (d1 - d2, seq, hi1 + lo2, lo1 + hi2))
+    _, _, side_x, side_y = heap[0]
+
+    # 含虚拟玩家的一队（或任意一队）作为 A 队（k = n//2 人）
+    team_a = side_x if -1 in side_x else side_y
+    return [i for i in team_a if i >= 0]
+
+def _local_search(elos: List[float], team_a: List[int], deadline: _Deadline) -> List[int]:
+    """两两交换改进：每轮为 A 队每名玩家二分查找最合适的 B 队交换对象"""
+    n = len(elos)
+    k = len(team_a)
+    target = k * sum(elos) / n
+    in_a = set(team_a)
+    team_b = [i for i in range(n) if i not in in_a]
+    sum_a = sum(elos[i] for i in team_a)
+
+    improved = True
+    while improved and not deadline.expired(every=1):
+        improved = False
+        err = abs(sum_a - target)
+        if err < 1e-9:
+            break
+        b_sorted = sorted(team_b, key=lambda i: elos[i])
+        b_values = [elos[i] for i in b_sorted]
+        best = None
+        for ai, a in enumerate(team_a):
+            # 交换后 A 队总分为 sum_a - elos[a] + elos[b]，希望它接近 target
+            want = target - sum_a + elos[a]
+            pos = bisect_left(b_values, want)
+            for j in (pos - 1, pos):
+                if 0 <= j < len(b_values):
+                    new_err = abs(sum_a - elos[a] + b_values[j] - target)
+                    if new_err < err - 1e-9:
+                        err = new_err
+                        best = (ai, b_sorted[j])
+        if best is not None:
+            ai, b = best
+            a = team_a[ai]
+            team_a[ai] = b
+            team_b[team_b.index(b)] = a
+            sum_a += elos[b] - elos[a]
+            improved = True
+    return team_a
+
+def split_teams(elos: List[float], strategy: str = 'auto',
+                time_budget_ms: Optional[float] = DEFAULT_TIME_BUDGET_MS) -> Tuple[List[int], str]:
+    """返回 A 队（n//2 人）的玩家下标以及实际使用的策略"""
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown balance strategy: {strategy}")
+    n = len(elos)
+    k = n // 2
+    if k == 0:
+        return [], strategy
+
+    deadline = _Deadline(time_budget_ms)
+    if strategy == 'auto':
+        strategy = 'exact' if n <= EXACT_LIMIT else 'greedy'
+
+    if strategy == 'exact':
+        team_a, completed = _exact(elos, k, deadline)
+        if completed:
+            return team_a, 'exact'
+        # 超时：在已找到的最好方案和差分法结果中取较好的一个（子集表没建好时只有差分法结果）
+        greedy = _differencing(elos, k)
+        if team_a is None:
+            return greedy, 'greedy'
+        target = k * sum(elos) / n
+        if abs(sum(elos[i] for i in greedy) - target) < abs(sum(elos[i] for i in team_a) - target):
+            return greedy, 'greedy'
+        return team_a, 'exact'
+
+    team_a = _differencing(elos, k)
+    return _local_search(elos, team_a, deadline), 'greedy'
+
+def balance_teams(players: List[Dict], strategy: str = 'auto',
+                  time_budget_ms: Optional[float] = DEFAULT_TIME_BUDGET_MS) -> Dict:
+    """ELO 平衡分队，返回格式与 routers.match.balance_teams 相同"""
+    elos = [p['elo'] for p in players]
+    team_a_idx, used = split_teams(elos, strategy, time_budget_ms)
+    in_a = set(team_a_idx)
+    best_team_a = [players[i] for i in sorted(in_a)]
+    best_team_b = [p for i, p in enumerate(players) if i not in in_a]
+
+    team_a_avg = sum(p['elo'] for p in best_team_a) / len(best_team_a) if best_team_a else 0
+    team_b_avg = sum(p['elo'] for p in best_team_b) / len(best_team_b) if best_team_b else 0
+
+    return {
+        "teamA": best_team_a,
+        "teamB": best_team_b,
+        "elo_diff": round(abs(team_a_avg - team_b_avg)),
+        "teamA_avg": round(team_a_avg),
+        "teamB_avg": round(team_b_avg),
+        "strategy": used
+    }
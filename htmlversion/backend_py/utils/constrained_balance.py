@@ -0,0 +1,273 @@
+"""
+带约束的分队：分支定界
+
+硬约束：
+    parties     同一车队（预先组队）的玩家分在同一队
+    split_top   ELO 最高的两名玩家分在两队
+    avoid       不与该房间上一场的分队完全相同（两队互换也算相同）
+目标：两队平均 ELO 之差（取整到 1 分，与返回的 elo_diff 一致）最小；平均 ELO 之差相同的分队中
+      两队平均 K/D 之差最小（K/D 只用于打破平局，不会用 ELO 差换 K/D 差）
+
+搜索：
+    - 同一车队合并为一个单元，单元按人数、ELO 从大到小依次决定去 A 队还是 B 队
+    - 两队人数相同时固定第一个单元在 A 队，去掉互换对称的一半
+    - 两队的总分、K/D 总和、人数随每一步增量更新
+    - 下界：剩余玩家中还需放进 A 队 r 人，A 队最终总分落在 [当前 + 最小的 r 个, 当前 + 最大的 r 个] 之间
+      （按玩家预先排序的前缀和，O(1)），两队平均分之差与 A 队总分呈线性关系，由区间到目标值的距离得到；
+      K/D 同理，(ELO 下界, K/D 下界) 按字典序不小于当前最优时剪枝
+    - 到时间预算时返回当前找到的最好方案（optimal 为 False）
+约束无法同时满足时按 avoid、split_top、parties 的顺序放宽，放宽的约束在结果的 relaxed 中列出。
+"""
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils import balance
+
+DEFAULT_TIME_BUDGET_MS = 50.0
+
+def kd_ratio(player: Dict) -> float:
+    """玩家的 K/D（players 文档），没有战绩的新玩家按 1.0 计"""
+    kills = player.get('total_kills', 0)
+    deaths = player.get('total_deaths', 0)
+    if deaths > 0:
+        return kills / deaths
+    return float(kills) if kills > 0 else 1.0
+
+def _prefix_bounds(values: List[float]) -> Tuple[List[float], List[float]]:
+    """values 中任取 r 个的最小和、最大和（下标为 r）"""
+    ordered = sorted(values)
+    low, high = [0.0], [0.0]
+    for v in ordered:
+        low.append(low[-1] + v)
+    for v in reversed(ordered):
+        high.append(high[-1] + v)
+    return low, high
+
+class _Search:
+    """一次分支定界搜索"""
+
+    def __init__(self, units: List[List[int]], elos: List[float], kds: List[float], k: int,
+                 top: Optional[Tuple[int, int]], avoid: Sequence[frozenset], deadline: float):
+        n = len(elos)
+        self.units = units
+        self.unit_elo = [sum(elos[i] for i in unit) for unit in units]
+        self.unit_kd = [sum(kds[i] for i in unit) for unit in units]
+        # 前 d 个单元的总分，B 队总分 = placed[d] - A 队总分
+        self.placed = [0.0]
+        for value in self.unit_elo:
+            self.placed.append(self.placed[-1] + value)
+        self.k = k
+        self.size_b = n - k
+        # 平均分之差 = |A 队总分 * n - 总分 * k| / (k * (n - k))，ELO 为整数时分子是精确的
+        self.n = n
+        self.total_elo_k = sum(elos) * k
+        self.elo_denom = k * (n - k)
+        # 平均 K/D 之差 = scale * |A 队 K/D 总和 - target|
+        self.scale = 1 / k + 1 / (n - k)
+        self.target_kd = sum(kds) * k / n
+        self.avoid = avoid
+        self.deadline = deadline
+        # top 两名玩家所在的单元
+        self.top_units = None
+        if top is not None:
+            unit_of = {i: u for u, unit in enumerate(units) for i in unit}
+            self.top_units = (unit_of[top[0]], unit_of[top[1]])
+        # 第 d 个单元及之后的玩家任取 r 人的总分范围
+        self.elo_bounds = []
+        self.kd_bounds = []
+        for d in range(len(units) + 1):
+            rest = [i for unit in units[d:] for i in unit]
+            self.elo_bounds.append(_prefix_bounds([elos[i] for i in rest]))
+            self.kd_bounds.append(_prefix_bounds([kds[i] for i in rest]))
+
+        self.side = [0] * len(units)
+        self.best_cost = (float('inf'), float('inf'))
+        self.best_side: Optional[List[int]] = None
+        self.nodes = 0
+        self.timed_out = False
+
+    def cost(self, sum_elo: float, sum_kd: float) -> Tuple[int, float]:
+        """(平均 ELO 之差取整, 平均 K/D 之差)，按字典序比较"""
+        return (round(abs(sum_elo * self.n - self.total_elo_k) / self.elo_denom),
+                self.scale * abs(sum_kd - self.target_kd))
+
+    def bound(self, depth: int, count_a: int, sum_elo: float, sum_kd: float) -> Tuple[int, float]:
+        r = self.k - count_a
+        low, high = self.elo_bounds[depth]
+        gap_elo = max(0.0, (sum_elo + low[r]) * self.n - self.total_elo_k, self.total_elo_k - (sum_elo + high[r]) * self.n)
+        low, high = self.kd_bounds[depth]
+        gap_kd = max(0.0, sum_kd + low[r] - self.target_kd, self.target_kd - sum_kd - high[r])
+        # 取整单调不减，仍是下界
+        return round(gap_elo / self.elo_denom), self.scale * gap_kd
+
+    def _pruned(self, bound: Tuple[int, float]) -> bool:
+        best_elo, best_kd = self.best_cost
+        return bound[0] > best_elo or bound[0] == best_elo and bound[1] >= best_kd - 1e-9
+
+    def run(self, fix_first: bool):
+        if fix_first:
+            self.side[0] = 1
+            size = len(self.units[0])
+            self._visit(1, size, 0, self.unit_elo[0], self.unit_kd[0])
+        else:
+            self._visit(0, 0, 0, 0.0, 0.0)
+
+    def _visit(self, depth: int, count_a: int, count_b: int, sum_elo: float, sum_kd: float):
+        self.nodes += 1
+        if self.nodes % 1024 == 0 and time.perf_counter() >= self.deadline:
+            self.timed_out = True
+        if self.timed_out:
+            return
+        if depth == len(self.units):
+            cost = self.cost(sum_elo, sum_kd)
+            if (cost[0] < self.best_cost[0] or cost[0] == self.best_cost[0] and cost[1] < self.best_cost[1] - 1e-9) \
+                    and not self._avoided():
+                self.best_cost = cost
+                self.best_side = list(self.side)
+            return
+        if self._pruned(self.bound(depth, count_a, sum_elo, sum_kd)):
+            return
+
+        size = len(self.units[depth])
+        # A 队平均分偏低时先试把这个单元放进 A 队
+        a_first = count_a == 0 or (count_b > 0 and sum_elo / count_a <= (self.placed[depth] - sum_elo) / count_b)
+        for to_a in ((True, False) if a_first else (False, True)):
+            if to_a and count_a + size > self.k or not to_a and count_b + size > self.size_b:
+                continue
+            if not self._top_allowed(depth, to_a):
+                continue
+            self.side[depth] = 1 if to_a else -1
+            if to_a:
+                self._visit(depth + 1, count_a + size, count_b,
+                            sum_elo + self.unit_elo[depth], sum_kd + self.unit_kd[depth])
+            else:
+                self._visit(depth + 1, count_a, count_b + size, sum_elo, sum_kd)
+        self.side[depth] = 0
+
+    def _top_allowed(self, depth: int, to_a: bool) -> bool:
+        if self.top_units is None:
+            return True
+        first, second = self.top_units
+        other = second if depth == first else first if depth == second else None
+        if other is None or other > depth:
+            return True
+        return (self.side[other] == 1) != to_a
+
+    def _avoided(self) -> bool:
+        if not self.avoid:
+            return False
+        team_a = frozenset(i for u, unit in enumerate(self.units) if self.side[u] == 1 for i in unit)
+        return team_a in self.avoid
+
+def _party_units(player_ids: List[str], parties: Iterable[Iterable[str]]) -> List[List[int]]:
+    """把有共同成员的车队合并，返回每个单元的玩家下标（不在车队中的玩家单独成为一个单元）"""
+    index = {pid: i for i, pid in enumerate(player_ids)}
+    parent = list(range(len(player_ids)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for party in parties:
+        members = [index[pid] for pid in party if pid in index]
+        for i in members[1:]:
+            parent[find(i)] = find(members[0])
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(player_ids)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+def balance_with_constraints(players: List[Dict], kd: Optional[Dict[str, float]] = None,
+                             parties: Iterable[Iterable[str]] = (),
+                             previous: Optional[Tuple[List[str], List[str]]] = None,
+                             split_top: bool = True,
+                             time_budget_ms: Optional[float] = DEFAULT_TIME_BUDGET_MS) -> Dict:
+    """带约束的 ELO 分队
+
+    players 为房间中的玩家（player_id、elo），kd 为 player_id -> K/D（缺省按 1.0），
+    parties 为车队的 player_id 列表，previous 为上一场的 (A 队, B 队) player_id。
+    返回格式与 balance.balance_teams 相同，另有 kd_diff、optimal、relaxed、nodes。
+    """
+    n = len(players)
+    k = n // 2
+    player_ids = [p['player_id'] for p in players]
+    elos = [p['elo'] for p in players]
+    kds = [(kd or {}).get(pid, 1.0) for pid in player_ids]
+    deadline = time.perf_counter() + (time_budget_ms if time_budget_ms is not None else 1e9) / 1000
+
+    units = _party_units(player_ids, [list(p) for p in parties])
+    relaxed = []
+    if any(len(unit) > k for unit in units):
+        # 车队人数超过一队的人数
+        units = [[i] for i in range(n)]
+        relaxed.append('parties')
+    units.sort(key=lambda unit: (-len(unit), -sum(elos[i] for i in unit)))
+
+    top = None
+    if split_top and n >= 2:
+        first, second = sorted(range(n), key=lambda i: -elos[i])[:2]
+        top = (first, second)
+        if any(first in unit and second in unit for unit in units):
+            # 两人在同一车队
+            top = None
+            relaxed.append('split_top')
+
+    avoid: List[frozenset] = []
+    if previous is not None and sorted(previous[0] + previous[1]) == sorted(player_ids):
+        index = {pid: i for i, pid in enumerate(player_ids)}
+        avoid = [frozenset(index[pid] for pid in team) for team in previous]
+    # 实际生效的约束（退回只平衡 ELO 时全部放宽）
+    active = [name for name, on in (('parties', any(len(unit) > 1 for unit in units)),
+                                    ('split_top', top is not None), ('avoid', bool(avoid))) if on]
+
+    search = None
+    nodes = 0
+    while k > 0:
+        search = _Search(units, elos, kds, k, top, avoid, deadline)
+        search.run(fix_first=k == n - k)
+        nodes += search.nodes
+        if search.best_side is not None or search.timed_out:
+            break
+        # 约束无法同时满足：依次放宽
+        if avoid:
+            avoid = []
+            relaxed.append('avoid')
+        elif top is not None:
+            top = None
+            relaxed.append('split_top')
+        elif len(units) < n:
+            units = sorted(([i] for i in range(n)), key=lambda unit: -elos[unit[0]])
+            relaxed.append('parties')
+        else:
+            break
+
+    if search is not None and search.best_side is not None:
+        in_a = {i for u, unit in enumerate(search.units) if search.best_side[u] == 1 for i in unit}
+        optimal = not search.timed_out
+    else:
+        # 超时前没有找到满足约束的方案：退回只平衡 ELO
+        in_a = set(balance.split_teams(elos, 'auto', time_budget_ms)[0])
+        optimal = False
+        relaxed += [name for name in active if name not in relaxed]
+
+    team_a = [players[i] for i in range(n) if i in in_a]
+    team_b = [players[i] for i in range(n) if i not in in_a]
+    team_a_avg = sum(p['elo'] for p in team_a) / len(team_a) if team_a else 0
+    team_b_avg = sum(p['elo'] for p in team_b) / len(team_b) if team_b else 0
+    kd_a = sum(kds[i] for i in range(n) if i in in_a) / len(team_a) if team_a else 0
+    kd_b = sum(kds[i] for i in range(n) if i not in in_a) / len(team_b) if team_b else 0
+
+    return {
+        "teamA": team_a,
+        "teamB": team_b,
+        "elo_diff": round(abs(team_a_avg - team_b_avg)),
+        "teamA_avg": round(team_a_avg),
+        "teamB_avg": round(team_b_avg),
+        "kd_diff": round(abs(kd_a - kd_b), 2),
+        "strategy": "constrained",
+        "optimal": optimal,
+        "relaxed": relaxed,
+        "nodes": nodes
+    }
@@ -0,0 +1,250 @@
+"""
+诊断工具 - 慢操作日志和采样分析器，默认关闭
+
+慢操作日志（写到 "slow" logger，WARNING 级别，uvicorn 下输出到标准错误）：
+    SLOW_REQUEST_MS    请求耗时超过该值（毫秒）时记录路由、状态码、请求中各存储操作的次数和耗时，
+                       以及请求执行到阈值时存储线程的调用栈；0 关闭
+    SLOW_OPERATION_MS  Collection 操作超过该值时记录集合名、操作、集合文档数、所属请求的路由和调用栈；0 关闭
+
+请求内的存储操作在存储线程中执行，run_storage() 会把请求上下文带过去，慢操作因此能对应到路由。
+阈值到达时如果请求正在事件循环里做计算（而不是在存储线程里），事件循环被占用，采不到调用栈。
+
+采样分析器：
+    profiler.start() 之后后台线程每隔 interval 秒抓取一次所有线程的调用栈，profiler.stop() 返回
+    flamegraph.pl / speedscope 可读的折叠格式（"线程;外层帧;...;内层帧 次数"，每行一种调用栈）。
+    线程池和事件循环空闲等待的样本不计入。通过 /api/admin/profiler/start、/stop 在运行中的服务上开关；
+    多进程部署时只分析收到请求的那个进程。
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "0"))
+SLOW_OPERATION_MS = float(os.environ.get("SLOW_OPERATION_MS", "0"))
+ENABLED = SLOW_REQUEST_MS > 0 or SLOW_OPERATION_MS > 0
+
+# 慢操作日志中调用栈保留的帧数（最内层的若干帧）
+STACK_DEPTH = int(os.environ.get("SLOW_STACK_DEPTH", "12"))
+
+logger = logging.getLogger("slow")
+
+# ==================== 慢操作日志 ====================
+
+class RequestState:
+    """一个请求的诊断信息，通过 contextvar 传到存储线程"""
+
+    __slots__ = ('scope', 'threads', 'operations', 'stacks')
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.threads = set()                        # 正在为该请求执行存储操作的线程
+        self.operations: Dict[str, List] = {}       # "集合.操作" -> [次数, 秒]
+        self.stacks: List[str] = []                 # 到达阈值时采到的调用栈
+
+    @property
+    def route(self) -> str:
+        path = getattr(self.scope.get('route'), 'path', None) or self.scope['path']
+        return f"{self.scope['method']} {path}"
+
+_current_request: ContextVar[Optional[RequestState]] = ContextVar('current_request', default=None)
+
+def _format_stack(frame=None) -> str:
+    stack = traceback.extract_stack(frame)[-STACK_DEPTH:]
+    return ''.join(traceback.format_list(stack)).rstrip()
+
+def track_thread(func, *args):
+    """在存储线程中执行 func(*args)，执行期间把当前线程记到所属请求上（供阈值到达时采样）"""
+    state = _current_request.get()
+    if state is None:
+        return func(*args)
+    ident = threading.get_ident()
+    state.threads.add(ident)
+    try:
+        return func(*args)
+    finally:
+        state.threads.discard(ident)
+
+def operation_finished(collection, op: str, args: tuple, seconds: float):
+    """Collection 操作结束时调用（metrics.timed_operation）"""
+    state = _current_request.get()
+    if state is not None and SLOW_REQUEST_MS > 0:
+        entry = state.operations.setdefault(f"{collection.name}.{op}", [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    if SLOW_OPERATION_MS > 0 and seconds * 1000 >= SLOW_OPERATION_MS:
+        try:
+            size = len(collection)
+        except Exception:
+            size = '?'
+        arguments = ', '.join(repr(arg) for arg in args)
+        if len(arguments) > 200:
+            arguments = arguments[:200] + '...'
+        logger.warning(
+            "slow storage operation %.1fms: %s.%s(%s) docs=%s route=%s\n%s",
+            seconds * 1000, collection.name, op, arguments, size,
+            state.route if state is not None else '-', _format_stack(sys._getframe(2)))
+
+def _sample_request(state: RequestState):
+    """请求到达 SLOW_REQUEST_MS 时采样其存储线程的调用栈"""
+    frames = sys._current_frames()
+    for ident in list(state.threads):
+        frame = frames.get(ident)
+        if frame is not None:
+            state.stacks.append(_format_stack(frame))
+
+def _log_request(state: RequestState, status, seconds: float):
+    lines = [f"slow request {seconds * 1000:.1f}ms: {state.route} status={status}"]
+    operations = sorted(state.operations.items(), key=lambda item: -item[1][1])
+    for name, (count, total) in operations[:10]:
+        lines.append(f"  {name} x{count} {total * 1000:.1f}ms")
+    for stack in state.stacks:
+        lines.append("  stack at threshold:\n" + stack)
+    logger.warning("\n".join(lines))
+
+class SlowRequestMiddleware:
+    """ASGI 中间件：建立请求上下文，记录超过 SLOW_REQUEST_MS 的请求"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not ENABLED or scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        state = RequestState(scope)
+        token = _current_request.set(state)
+        started = time.perf_counter()
+        status = None
+        timer = None
+        if SLOW_REQUEST_MS > 0:
+            timer = asyncio.get_running_loop().call_later(SLOW_REQUEST_MS / 1000, _sample_request, state)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_request.reset(token)
+            if timer is not None:
+                timer.cancel()
+                seconds = time.perf_counter() - started
+                if seconds * 1000 >= SLOW_REQUEST_MS:
+                    _log_request(state, status or 500, seconds)
+
+# ==================== 采样分析器 ====================
+
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR") or Path(__file__).parent.parent / "profiles")
+
+# 空闲等待的最内层帧：线程池等任务、事件循环等 I/O、Event.wait（刷盘线程等定时任务）；
+# 读写锁上的 Condition.wait 是锁竞争，保留
+_IDLE = {('thread.py', '_worker'), ('selectors.py', 'select')}
+
+def _frame_key(frame):
+    return os.path.basename(frame.f_code.co_filename), frame.f_code.co_name
+
+def _is_idle(frame) -> bool:
+    key = _frame_key(frame)
+    if key in _IDLE:
+        return True
+    return key == ('threading.py', 'wait') and frame.f_back is not None and _frame_key(frame.f_back) == key
+
+def _collapse(thread_name: str, frame) -> Optional[str]:
+    """把调用栈折叠成 "线程;外层帧;...;内层帧"，空闲等待返回 None"""
+    if _is_idle(frame):
+        return None
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.append(thread_name)
+    return ';'.join(reversed(names))
+
+class SamplingProfiler:
+    """定时抓取所有线程调用栈的采样分析器（同一时间只能有一次分析）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.interval = 0.01
+        self.max_seconds = 0.0
+        self.started_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def status(self) -> Dict:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "max_seconds": self.max_seconds,
+            "seconds": round(time.time() - self.started_at, 3) if self.started_at else 0,
+            "samples": self.samples,
+        }
+
+    def start(self, interval: float = 0.01, max_seconds: float = 300) -> bool:
+        """开始采样，max_seconds 后自动停止采样（结果保留到 stop()）；已在运行时返回 False"""
+        with self.lock:
+            if self.thread is not None:
+                return False
+            self.stacks = Counter()
+            self.samples = 0
+            self.interval = interval
+            self.max_seconds = max_seconds
+            self.started_at = time.time()
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+            self.thread.start()
+            return True
+
+    def stop(self) -> Optional[str]:
+        """停止采样，返回折叠格式的调用栈；没有在分析时返回 None"""
+        with self.lock:
+            if self.thread is None:
+                return None
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+            self.started_at = None
+            return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def _run(self):
+        me = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        while not self.stop_event.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = _collapse(names.get(ident, str(ident)), frame)
+                if stack is not None:
+                    self.stacks[stack] += 1
+            self.samples += 1
+
+def save_profile(collapsed: str) -> Path:
+    """把折叠格式的结果写到 PROFILE_DIR/profile-<时间>.folded"""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    path = PROFILE_DIR / f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded"
+    path.write_text(collapsed, encoding='utf-8')
+    return path
+
+profiler = SamplingProfiler()
@@ -0,0 +1,133 @@
+"""
+只读文档视图 - 读取时不复制文档
+
+存储中的文档写时复制：更新生成新的字典替换旧文档，已有的文档对象不会再被修改，
+因此只读取字段的调用方不需要像 clone() 那样逐层复制整个文档。
+find / find_one / find_by_id / find_by_ids 传入 readonly=True 时返回 DocumentView：
+    - 读取直接访问存储中的文档，嵌套的字典 / 列表在访问时包装为 ReadOnlyDict / ReadOnlyList，不复制
+    - 修改顶层字段（doc['x'] = ...、del、pop、update、setdefault）时先浅复制顶层字典（写时复制），
+      存储中的文档不受影响；嵌套的字典 / 列表不能原地修改（抛出 TypeError），需要时用 to_dict() 取得可修改的副本
+    - 视图是 Mapping 而不是 dict：作为接口响应或序列化前用 to_dict()；insert / $set / $push / $addToSet
+      写入的值用 thaw() 复制，其中的视图会变成普通的字典 / 列表，把视图中的值写回存储是安全的
+"""
+from collections.abc import Mapping, MutableMapping, Sequence
+from typing import Any, Dict, List
+
+def _wrap(value: Any) -> Any:
+    if isinstance(value, dict):
+        return ReadOnlyDict(value)
+    if isinstance(value, list):
+        return ReadOnlyList(value)
+    return value
+
+def thaw(value: Any) -> Any:
+    """与 query.clone 相同地逐层复制，其中的视图复制为普通的字典 / 列表（用于写入存储的值）"""
+    if isinstance(value, dict):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [thaw(v) for v in value]
+    # 用 type() 判断：对 Mapping 子类的 isinstance 要经过 ABCMeta，每个标量值都会慢几倍
+    if type(value) in _VIEWS:
+        return thaw(value._data)
+    return value
+
+def _raw(value: Any) -> Any:
+    return value._data if type(value) in _VIEWS else value
+
+class ReadOnlyDict(Mapping):
+    """字典的只读视图"""
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data: Dict):
+        self._data = data
+
+    def __getitem__(self, key):
+        return _wrap(self._data[key])
+
+    def get(self, key, default=None):
+        value = self._data.get(key, default)
+        return value if value is default else _wrap(value)
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __eq__(self, other) -> bool:
+        return self._data == _raw(other)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self._data!r})"
+
+    def to_dict(self) -> Dict:
+        """可修改的副本（逐层复制）"""
+        return thaw(self._data)
+
+    copy = to_dict
+
+class ReadOnlyList(Sequence):
+    """列表的只读视图"""
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data: List):
+        self._data = data
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ReadOnlyList(self._data[index])
+        return _wrap(self._data[index])
+
+    def __iter__(self):
+        return map(_wrap, self._data)
+
+    def __contains__(self, value) -> bool:
+        return _raw(value) in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __eq__(self, other) -> bool:
+        return self._data == _raw(other)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self._data!r})"
+
+    def to_list(self) -> List:
+        """可修改的副本（逐层复制）"""
+        return thaw(self._data)
+
+    copy = to_list
+
+class DocumentView(ReadOnlyDict, MutableMapping):
+    """存储中文档的视图：顶层字段写时复制，嵌套结构只读"""
+
+    __slots__ = ('_owned',)
+
+    def __init__(self, data: Dict):
+        super().__init__(data)
+        self._owned = False
+
+    def _own(self):
+        if not self._owned:
+            self._data = dict(self._data)
+            self._owned = True
+
+    def __setitem__(self, key, value):
+        self._own()
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        self._own()
+        del self._data[key]
+
+_VIEWS = frozenset((ReadOnlyDict, ReadOnlyList, DocumentView))
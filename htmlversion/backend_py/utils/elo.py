@@ -0,0 +1,140 @@
+"""
+ELO 计算引擎（NumPy 向量化）
+
+规则与原 submit.calculate_elo 相同：
+    期望胜率  E_A = 1 / (1 + 10^((avg_B - avg_A) / 400))
+    K 因子    ELO < 1200 为 40，> 1800 为 24，其余为 32
+    KD 修正   KD > 1.5 乘 1.2，KD < 0.8 乘 0.8
+    变化值    round(K * (实际得分 - 期望) * 修正)，新 ELO 不低于 0
+
+settle_matches() 一次结算多场比赛：互不共享玩家的比赛放在同一批中一次向量化计算，
+同一玩家的多场比赛按给定顺序依次结算（批次之间更新分数）。
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_ELO = 1000
+
+@dataclass(frozen=True)
+class EloConfig:
+    """ELO 规则参数"""
+    k_default: float = 32
+    k_low: float = 40            # ELO 低于 low_elo 时的 K
+    k_high: float = 24           # ELO 高于 high_elo 时的 K
+    low_elo: float = 1200
+    high_elo: float = 1800
+    kd_high: float = 1.5         # KD 高于此值时乘 kd_high_multiplier
+    kd_low: float = 0.8          # KD 低于此值时乘 kd_low_multiplier
+    kd_high_multiplier: float = 1.2
+    kd_low_multiplier: float = 0.8
+
+DEFAULT_CONFIG = EloConfig()
+
+def _waves(matches: List[Dict]) -> List[List[int]]:
+    """把比赛分批：每场比赛排在它所有玩家上一场比赛之后的第一批"""
+    last_wave: Dict[str, int] = {}
+    waves: List[List[int]] = []
+    for i, match in enumerate(matches):
+        pids = list(match['teamA']) + list(match['teamB'])
+        wave = max((last_wave.get(pid, -1) for pid in pids), default=-1) + 1
+        if wave == len(waves):
+            waves.append([])
+        waves[wave].append(i)
+        for pid in pids:
+            last_wave[pid] = wave
+    return waves
+
+def _settle_wave(matches: List[Dict], ratings: Dict[str, float], config: EloConfig) -> List[List[Dict]]:
+    """向量化结算一批互不共享玩家的比赛"""
+    pids: List[str] = []
+    match_idx: List[int] = []
+    team: List[int] = []
+    kills: List[float] = []
+    deaths: List[float] = []
+    has_stat: List[bool] = []
+    actual_a: List[float] = []
+
+    for mi, match in enumerate(matches):
+        stats = {}
+        for s in match.get('player_stats') or []:
+            stats.setdefault(s['player_id'], s)
+        winner = match.get('winner')
+        actual_a.append(1 if winner == 'A' else (0.5 if winner == 'draw' else 0))
+
+        team_a = set(match['teamA'])
+        for pid in list(match['teamA']) + list(match['teamB']):
+            if pid not in ratings:
+                continue
+            stat = stats.get(pid)
+            pids.append(pid)
+            match_idx.append(mi)
+            team.append(0 if pid in team_a else 1)
+            kills.append(float(stat['kills']) if stat else 0.0)
+            deaths.append(float(stat['deaths']) if stat else 0.0)
+            has_stat.append(stat is not None)
+
+    results: List[List[Dict]] = [[] for _ in matches]
+    if not pids:
+        return results
+
+    r = np.array([ratings[pid] for pid in pids], dtype=np.float64)
+    mi = np.array(match_idx)
+    tm = np.array(team)
+    k_arr = np.array(kills)
+    d_arr = np.array(deaths)
+    stat_mask = np.array(has_stat)
+
+    # 各场比赛两队的平均 ELO（没有玩家的一队按 DEFAULT_ELO 计）
+    groups = mi * 2 + tm
+    sums = np.bincount(groups, weights=r, minlength=2 * len(matches))
+    counts = np.bincount(groups, minlength=2 * len(matches))
+    avg = np.where(counts > 0, sums / np.maximum(counts, 1), DEFAULT_ELO)
+    avg_a = avg[0::2]
+    avg_b = avg[1::2]
+
+    expected_a = 1 / (1 + np.power(10.0, (avg_b - avg_a) / 400))
+    act_a = np.array(actual_a)
+    is_a = tm == 0
+    expected = np.where(is_a, expected_a[mi], 1 - expected_a[mi])
+    actual = np.where(is_a, act_a[mi], 1 - act_a[mi])
+
+    k_factor = np.where(r < config.low_elo, config.k_low,
+                        np.where(r > config.high_elo, config.k_high, config.k_default))
+    change = k_factor * (actual - expected)
+
+    kd = np.where(d_arr > 0, k_arr / np.where(d_arr > 0, d_arr, 1), k_arr)
+    change = np.where(stat_mask & (kd > config.kd_high), change * config.kd_high_multiplier, change)
+    change = np.where(stat_mask & (kd <= config.kd_high) & (kd < config.kd_low),
+                      change * config.kd_low_multiplier, change)
+    deltas = np.round(change).astype(np.int64)
+
+    for i, pid in enumerate(pids):
+        old_elo = ratings[pid]
+        elo_change = int(deltas[i])
+        results[match_idx[i]].append({
+            "player_id": pid,
+            "old_elo": old_elo,
+            "new_elo": max(0, old_elo + elo_change),
+            "elo_change": elo_change
+        })
+    return results
+
+def settle_matches(matches: List[Dict], ratings: Dict[str, float],
+                   config: Optional[EloConfig] = None) -> List[List[Dict]]:
+    """按顺序结算多场比赛
+
+    matches: [{"teamA": [...], "teamB": [...], "winner": 'A'|'B'|'draw', "player_stats": [...]}, ...]
+    ratings: 玩家当前 ELO，结算后原地更新；不在其中的玩家不参与计算
+    返回每场比赛的 ELO 变化列表 [{"player_id", "old_elo", "new_elo", "elo_change"}, ...]
+    """
+    config = config or DEFAULT_CONFIG
+    results: List[List[Dict]] = [[] for _ in matches]
+    for wave in _waves(matches):
+        wave_results = _settle_wave([matches[i] for i in wave], ratings, config)
+        for i, changes in zip(wave, wave_results):
+            results[i] = changes
+            for change in changes:
+                ratings[change['player_id']] = change['new_elo']
+    return results
@@ -0,0 +1,147 @@
+"""
+集合的哈希索引
+
+每个索引把若干字段的取值映射到文档 ID 集合，插入/更新/删除时同步维护，
+点查询从 O(N) 扫描变为 O(1) 查表。唯一索引在存储层拒绝重复值。
+索引字段上的条件可以是相等或 $in（查多个取值后合并），其他运算符不走索引。
+指定 order_by 的索引在每个取值下按该字段排序，支持"某玩家最近 N 条"这类分页查询和按该字段排序的查询。
+"""
+import heapq
+from itertools import product
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sortedcontainers import SortedList
+
+from utils.query import is_operator
+
+class DuplicateKeyError(Exception):
+    """违反唯一索引约束"""
+
+    def __init__(self, collection: str, fields: Tuple[str, ...], key: Tuple):
+        self.collection = collection
+        self.fields = fields
+        self.key = key
+        desc = ", ".join(f"{f}={v!r}" for f, v in zip(fields, key))
+        super().__init__(f"{collection}: duplicate key {desc}")
+
+def hashable(value: Any) -> Any:
+    """把列表/字典转换为可哈希的形式，便于作为索引键"""
+    if isinstance(value, list):
+        return tuple(hashable(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, hashable(v)) for k, v in value.items()))
+    return value
+
+class Index:
+    """字段组合上的哈希索引（可选按 order_by 字段排序）"""
+
+    def __init__(self, fields: Iterable[str], unique: bool = False, order_by: Optional[str] = None):
+        self.fields = tuple(fields)
+        self.unique = unique
+        self.order_by = order_by
+        # order_by 为空时每个取值对应 {doc_id: None}，否则对应按 (排序值, doc_id) 排序的 SortedList
+        self.entries: Dict[Tuple, Any] = {}
+
+    def copy(self) -> 'Index':
+        """同样定义的空索引"""
+        return Index(self.fields, self.unique, self.order_by)
+
+    def key(self, doc: Dict) -> Tuple:
+        return tuple(hashable(doc.get(f)) for f in self.fields)
+
+    def _sort_entry(self, doc_id: str, doc: Dict) -> Tuple:
+        # 缺失的值排在最前（倒序时排在最后）
+        value = doc.get(self.order_by)
+        return (value is not None, value, doc_id)
+
+    def changed(self, old_doc: Dict, new_doc: Dict) -> bool:
+        """更新文档后是否需要调整索引"""
+        if self.key(old_doc) != self.key(new_doc):
+            return True
+        return self.order_by is not None and old_doc.get(self.order_by) != new_doc.get(self.order_by)
+
+    def keys(self, query: Dict) -> Optional[List[Tuple]]:
+        """查询在索引字段上的所有取值组合；有字段不在查询中或不是相等/$in 条件时返回 None"""
+        choices = []
+        for f in self.fields:
+            if f not in query:
+                return None
+            value = query[f]
+            if not is_operator(value):
+                choices.append([hashable(value)])
+            elif set(value) == {'$in'} and isinstance(value['$in'], (list, tuple)):
+                choices.append(list(dict.fromkeys(hashable(v) for v in value['$in'])))
+            else:
+                return None
+        return list(product(*choices))
+
+    def covers(self, query: Dict) -> bool:
+        """查询条件是否包含索引的全部字段（相等或 $in）"""
+        return self.keys(query) is not None
+
+    def check(self, collection: str, doc_id: str, doc: Dict):
+        """检查写入 doc 是否违反唯一约束（空值不参与唯一性检查）"""
+        if not self.unique:
+            return
+        key = self.key(doc)
+        if any(v is None for v in key):
+            return
+        bucket = self.entries.get(key)
+        if bucket and any(other != doc_id for other in self._ids(bucket)):
+            raise DuplicateKeyError(collection, self.fields, key)
+
+    def _ids(self, bucket) -> Iterable[str]:
+        if self.order_by is None:
+            return bucket
+        return (entry[-1] for entry in bucket)
+
+    def add(self, doc_id: str, doc: Dict):
+        key = self.key(doc)
+        if self.order_by is None:
+            self.entries.setdefault(key, {})[doc_id] = None
+        else:
+            self.entries.setdefault(key, SortedList()).add(self._sort_entry(doc_id, doc))
+
+    def remove(self, doc_id: str, doc: Dict):
+        key = self.key(doc)
+        bucket = self.entries.get(key)
+        if bucket is not None:
+            if self.order_by is None:
+                bucket.pop(doc_id, None)
+            else:
+                bucket.discard(self._sort_entry(doc_id, doc))
+            if not bucket:
+                del self.entries[key]
+
+    def lookup(self, query: Dict) -> Optional[Iterable[str]]:
+        """返回匹配查询的文档 ID（查询需覆盖索引字段）"""
+        buckets = [self.entries[key] for key in self.keys(query) if key in self.entries]
+        if not buckets:
+            return None
+        if len(buckets) == 1 and self.order_by is None:
+            return buckets[0]
+        return [doc_id for bucket in buckets for doc_id in self._ids(bucket)]
+
+    def ordered(self, query: Dict, reverse: bool = False, before: Any = None) -> Iterator[str]:
+        """按 order_by 排序返回匹配查询的文档 ID（$in 的多个取值归并）
+
+        倒序时 before 不为空则只返回排序值小于 before 的。
+        """
+        runs = []
+        for key in self.keys(query):
+            bucket = self.entries.get(key)
+            if not bucket:
+                continue
+            if reverse:
+                stop = len(bucket) if before is None else bucket.bisect_left((True, before))
+                runs.append(bucket.islice(0, stop, reverse=True))
+            else:
+                runs.append(iter(bucket))
+        if not runs:
+            return iter(())
+        entries = runs[0] if len(runs) == 1 else heapq.merge(*runs, reverse=reverse)
+        return (entry[-1] for entry in entries)
+
+    def latest(self, query: Dict, before: Any = None) -> Iterator[str]:
+        """按 order_by 倒序返回匹配查询的文档 ID，before 不为空时只返回排序值小于 before 的"""
+        return self.ordered(query, reverse=True, before=before)
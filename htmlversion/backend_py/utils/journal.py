@@ -0,0 +1,132 @@
+"""
+追加日志（journal）- 每次写入只追加一行 JSON，由后台压缩进快照
+
+记录格式（每行一条）：
+    {"op": "put", "doc": {...}}      插入或更新后的完整文档
+    {"op": "del", "_id": "..."}      删除文档
+
+put 记录保存的是完整的文档，重放是幂等的，所以快照写入后、日志删除前崩溃也不会出错。
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+class Journal:
+    """单个集合的追加日志"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.rotated_path = path.with_name(path.name + ".1")
+        self.file = None
+        self.records = 0
+        # 已追加 / 已 fsync 的记录序号，用于组提交
+        self.appended = 0
+        self.synced = 0
+        # 保护 fsync 以及文件的关闭、轮转
+        self.sync_lock = threading.Lock()
+
+    def append(self, record: Dict):
+        """追加一条记录（调用方需持有集合锁以保证顺序）"""
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str)
+        self.file.write(line + "\n")
+        self.file.flush()
+        self.records += 1
+        self.appended += 1
+
+    def sync(self):
+        """把已追加的记录 fsync 到磁盘（可与追加并发调用）
+
+        多个线程同时调用时，等待锁期间别的线程的 fsync 已经覆盖了自己追加的记录就直接返回，
+        一次 fsync 提交一批写入。
+        """
+        target = self.appended
+        with self.sync_lock:
+            self._sync(target)
+
+    def _sync(self, target: int):
+        if self.file is not None and self.synced < target:
+            appended = self.appended
+            os.fsync(self.file.fileno())
+            self.synced = appended
+
+    def rotate(self):
+        """把当前日志移到 .1，之后的写入进入新日志；快照写好后再调用 discard_rotated()"""
+        with self.sync_lock:
+            self._sync(self.appended)
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        self.records = 0
+        if not self.path.exists():
+            return
+        if self.rotated_path.exists():
+            # 上一次压缩没有完成，把当前日志接到旧日志后面
+            with open(self.rotated_path, 'a', encoding='utf-8') as dst, \
+                    open(self.path, 'r', encoding='utf-8') as src:
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.remove(self.path)
+        else:
+            os.replace(self.path, self.rotated_path)
+
+    def discard_rotated(self):
+        """删除已经压缩进快照的旧日志"""
+        if self.rotated_path.exists():
+            os.remove(self.rotated_path)
+
+    def close(self):
+        with self.sync_lock:
+            self._sync(self.appended)
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+def read_records(path: Path) -> Iterator[Dict]:
+    """读取日志记录；最后一行写到一半（崩溃）时忽略"""
+    if not path.exists():
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    for i, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            if i == len(lines) - 1:
+                print(f"Ignoring truncated journal record in {path.name}")
+            else:
+                raise
+
+def replay(data: List[Dict], journal: Journal) -> List[Dict]:
+    """在快照数据上重放旧日志和当前日志，返回恢复后的文档列表"""
+    positions = {doc.get('_id'): i for i, doc in enumerate(data)}
+    deleted = set()
+    replayed = 0
+
+    for path in (journal.rotated_path, journal.path):
+        for record in read_records(path):
+            replayed += 1
+            if record['op'] == 'put':
+                doc = record['doc']
+                doc_id = doc['_id']
+                deleted.discard(doc_id)
+                if doc_id in positions:
+                    data[positions[doc_id]] = doc
+                else:
+                    positions[doc_id] = len(data)
+                    data.append(doc)
+            elif record['op'] == 'del':
+                if record['_id'] in positions:
+                    deleted.add(record['_id'])
+
+    journal.records = replayed
+    if deleted:
+        data = [doc for doc in data if doc.get('_id') not in deleted]
+    return data
@@ -0,0 +1,143 @@
+"""
+物化排行榜
+
+首次访问时从 players 集合构建，之后由写入方（注册、提交比赛结果）增量维护，
+请求排行榜时不再全表读取和排序。
+
+排序键为 (-elo, 加入顺序, _id)，同分时保持玩家的插入顺序，与原来对全表稳定排序的结果一致；
+键保存在 SortedList 中，前 N 名为 O(log N + N)，查询某个玩家的名次为 O(log N)。
+每次变化递增 version，配合启动时刻生成 ETag，客户端可用 If-None-Match 跳过未变化的响应。
+写入方在事务提交后、不持有玩家锁时调用 update，并发提交的结果可能乱序到达：
+记录每名玩家的 updated_at，忽略比已记录的更旧的玩家文档。
+多进程模式下其他进程修改的玩家通过 storage.add_change_listener 进入待处理队列，下次读取时应用。
+"""
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sortedcontainers import SortedList
+
+from utils.storage import add_change_listener, get_collection
+
+def _row(player: Dict) -> Dict:
+    """排行榜中一名玩家的展示数据（不含名次）"""
+    total_matches = player.get('total_matches', 0)
+    wins = player.get('wins', 0)
+    total_kills = player.get('total_kills', 0)
+    total_deaths = player.get('total_deaths', 0)
+    return {
+        "player_id": player['_id'],
+        "nickname": player.get('nickname', ''),
+        "elo": player.get('elo', 1000),
+        "total_matches": total_matches,
+        "wins": wins,
+        "losses": player.get('losses', 0),
+        "win_rate": round((wins / total_matches) * 100) if total_matches > 0 else 0,
+        "kd_ratio": f"{(total_kills / total_deaths):.2f}" if total_deaths > 0 else f"{total_kills:.2f}"
+    }
+
+class Leaderboard:
+    """按 ELO 排序的玩家排行"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.order = SortedList()
+        self.keys: Dict[str, Tuple] = {}
+        self.rows: Dict[str, Dict] = {}
+        # 玩家 -> 已应用的文档的 updated_at
+        self.updated: Dict[str, str] = {}
+        self.next_seq = 0
+        self.version = 0
+        # 其他进程产生的变化 (player_id, 文档或 None)；回调中不能加锁等待，先入队
+        self.pending = deque()
+        # 进程重启后 version 从 0 开始，ETag 带上启动时刻避免与旧响应混淆
+        self.epoch = format(int(time.time() * 1000), 'x')
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.epoch}-{self.version}"'
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            # 载入时读到的是最新数据，之前排队的变化无需再应用
+            self.pending.clear()
+            for player in get_collection('players').find(readonly=True):
+                self._put(player)
+            self.loaded = True
+            return
+        if self.pending:
+            while self.pending:
+                player_id, player = self.pending.popleft()
+                if player is not None:
+                    self._put(player)
+                elif player_id in self.keys:
+                    self._discard(player_id)
+            self.version += 1
+
+    def external_change(self, player_id: str, player: Optional[Dict]):
+        """其他进程修改了玩家（storage 变化回调）"""
+        self.pending.append((player_id, player))
+
+    def _put(self, player: Dict):
+        pid = player['_id']
+        updated_at = player.get('updated_at')
+        if updated_at is not None:
+            if updated_at < self.updated.get(pid, ''):
+                # 乱序到达的旧文档
+                return
+            self.updated[pid] = updated_at
+        old_key = self.keys.get(pid)
+        if old_key is None:
+            seq = self.next_seq
+            self.next_seq += 1
+        else:
+            seq = old_key[1]
+            self.order.remove(old_key)
+        key = (-player.get('elo', 1000), seq, pid)
+        self.order.add(key)
+        self.keys[pid] = key
+        self.rows[pid] = _row(player)
+
+    def update(self, players: Iterable[Dict]):
+        """玩家新增或 ELO/战绩变化后调用（传入写入后的玩家文档，比已应用的更旧的忽略）"""
+        with self.lock:
+            # 尚未构建时无需维护，首次访问会读到最新数据
+            if not self.loaded:
+                return
+            for player in players:
+                self._put(player)
+            self.version += 1
+
+    def _discard(self, player_id: str):
+        self.order.remove(self.keys.pop(player_id))
+        del self.rows[player_id]
+        self.updated.pop(player_id, None)
+
+    def top(self, limit: int) -> Tuple[List[Dict], str]:
+        """前 limit 名，返回 (排行数据, ETag)"""
+        with self.lock:
+            self._ensure_loaded()
+            ranking = [
+                {"rank": index + 1, **self.rows[key[2]]}
+                for index, key in enumerate(self.order.islice(0, limit))
+            ]
+            return ranking, self.etag
+
+    def rank_of(self, player_id: str) -> Tuple[Optional[Dict], str]:
+        """某个玩家的名次和排行数据，返回 (数据或 None, ETag)"""
+        with self.lock:
+            self._ensure_loaded()
+            key = self.keys.get(player_id)
+            if key is None:
+                return None, self.etag
+            return {"rank": self.order.index(key) + 1, **self.rows[player_id]}, self.etag
+
+    def current_etag(self) -> str:
+        with self.lock:
+            self._ensure_loaded()
+            return self.etag
+
+leaderboard = Leaderboard()
+add_change_listener('players', leaderboard.external_change)
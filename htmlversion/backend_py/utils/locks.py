@@ -0,0 +1,199 @@
+"""
+存储使用的锁
+
+RWLock：集合级读写锁，读者之间互不阻塞，写者独占；有写者等待时新的读者排队，避免写者饿死。
+StripedLocks：文档级锁，按 _id 的哈希分到固定数量的可重入锁上，
+同一文档的"读-改-写"串行执行，不同文档（除非哈希到同一条）互不影响。
+FileLock / FileStripedLocks：多进程模式下的跨进程版本（fcntl.flock），进程内仍然可重入。
+
+两种锁都可以传入 on_wait(lock, seconds) 回调，获取时发生了等待才调用（用于统计锁等待时间）。
+"""
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+WaitCallback = Optional[Callable[[str, float], None]]
+
+class RWLock:
+    """读写锁（不可重入）"""
+
+    def __init__(self, on_wait: WaitCallback = None):
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+        self.on_wait = on_wait
+
+    def acquire_read(self):
+        started = None
+        with self.cond:
+            if self.writer or self.waiting_writers:
+                started = time.perf_counter()
+                while self.writer or self.waiting_writers:
+                    self.cond.wait()
+            self.readers += 1
+        if started is not None and self.on_wait is not None:
+            self.on_wait('read', time.perf_counter() - started)
+
+    def release_read(self):
+        with self.cond:
+            self.readers -= 1
+            if self.readers == 0:
+                self.cond.notify_all()
+
+    def acquire_write(self):
+        started = None
+        with self.cond:
+            if self.writer or self.readers:
+                started = time.perf_counter()
+            self.waiting_writers += 1
+            try:
+                while self.writer or self.readers:
+                    self.cond.wait()
+            finally:
+                self.waiting_writers -= 1
+            self.writer = True
+        if started is not None and self.on_wait is not None:
+            self.on_wait('write', time.perf_counter() - started)
+
+    def release_write(self):
+        with self.cond:
+            self.writer = False
+            self.cond.notify_all()
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+class _TimedRLock:
+    """可重入锁，获取时发生等待则回调等待时间（只支持 with 用法）"""
+
+    def __init__(self, on_wait: Callable[[str, float], None]):
+        self.lock = threading.RLock()
+        self.on_wait = on_wait
+
+    def __enter__(self):
+        if not self.lock.acquire(blocking=False):
+            started = time.perf_counter()
+            self.lock.acquire()
+            self.on_wait('document', time.perf_counter() - started)
+        return self
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+def _stripe(key: str, stripes: int) -> int:
+    # 不用 hash()：字符串哈希每个进程不同，跨进程的分条必须一致
+    return zlib.crc32(key.encode('utf-8')) % stripes
+
+class StripedLocks:
+    """按键哈希分条的可重入锁"""
+
+    def __init__(self, stripes: int = 64, on_wait: WaitCallback = None):
+        if on_wait is None:
+            self.locks = [threading.RLock() for _ in range(stripes)]
+        else:
+            self.locks = [_TimedRLock(on_wait) for _ in range(stripes)]
+
+    def get(self, key: str):
+        return self.locks[_stripe(key, len(self.locks))]
+
+class FileLock:
+    """进程内可重入、进程间互斥的锁（path 上的 fcntl.flock）
+
+    进程内第一次获取时加文件锁，之后调用 on_acquire（例如重放其他进程的写入），最后一次释放时解锁。
+    """
+
+    def __init__(self, path: Path, on_acquire: Optional[Callable[[], None]] = None):
+        self.path = path
+        self.on_acquire = on_acquire
+        self.rlock = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self.rlock.acquire(blocking):
+            return False
+        self.depth += 1
+        if self.depth == 1:
+            try:
+                if self.file is None:
+                    self.file = open(self.path, 'a')
+                try:
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    self.depth -= 1
+                    self.rlock.release()
+                    return False
+                if self.on_acquire is not None:
+                    try:
+                        self.on_acquire()
+                    except BaseException:
+                        fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+                        raise
+            except BaseException:
+                self.depth -= 1
+                self.rlock.release()
+                raise
+        return True
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.rlock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class _FileStripe:
+    """一条跨进程的文档锁：先取进程内的锁，再取文件锁"""
+
+    def __init__(self, local, path: Path):
+        self.local = local
+        self.file_lock = FileLock(path)
+
+    def __enter__(self):
+        self.local.__enter__()
+        try:
+            self.file_lock.acquire()
+        except BaseException:
+            self.local.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.file_lock.release()
+        self.local.__exit__(*exc)
+
+class FileStripedLocks(StripedLocks):
+    """跨进程的分条锁：每条对应 directory 下的一个锁文件（首次使用时打开）"""
+
+    def __init__(self, directory: Path, prefix: str, stripes: int = 64, on_wait: WaitCallback = None):
+        super().__init__(stripes, on_wait)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.locks: List = [_FileStripe(lock, directory / f"{prefix}.{i}.lock") for i, lock in enumerate(self.locks)]
@@ -0,0 +1,222 @@
+"""
+匹配队列：按 ELO 索引的等待中房间
+
+加入房间时不再扫描所有等待中的房间、放进第一个未满的房间，而是在按平均 ELO 排序的未满房间中
+找加入后 ELO 极差（最高分 - 最低分）最小的房间：
+    - 从平均分与玩家 ELO 最接近的房间向两侧扩展；加入后的极差不小于 |玩家 ELO - 房间平均分|，
+      超过已找到的最小极差即可停止，通常只需看几个房间，O(log n)
+    - 玩家能接受的 ELO 差距 |玩家 ELO - 房间平均分| 随该玩家的等待时间放宽：
+      MATCH_ELO_WINDOW + MATCH_ELO_WINDOW_GROWTH * 等待秒数（不超过 MATCH_ELO_WINDOW_MAX，0 为不限），
+      没有房间能接受时新建房间，之后的玩家会优先加入这个新房间
+    - 等待时间从玩家第一次请求加入开始计算，进入非等待状态的房间（全员准备、开始匹配）后清除；
+      离开房间或房间解散后 REJOIN_GRACE 秒内重新加入时继续计时，超过则重新开始
+    - 极差相同时优先人数多的房间，尽快凑满
+玩家所在房间也有索引，"已在房间中" 的检查为 O(1)。
+
+索引首次使用时从 rooms 集合构建（只读 status=waiting 的房间，走索引），之后由房间路由在每次修改后
+（持有该房间的文档锁）更新；索引只用来挑选候选，真正加入时用条件更新确认房间仍在等待且未满，
+失败时用最新的房间文档修正索引后重选。多进程模式下其他进程修改的房间通过 storage.add_change_listener
+进入待处理队列，下次使用时应用。
+"""
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sortedcontainers import SortedList
+
+from utils.storage import add_change_listener, get_collection
+
+# 房间人数上限
+ROOM_SIZE = 10
+
+ELO_WINDOW = float(os.environ.get("MATCH_ELO_WINDOW", "300"))
+ELO_WINDOW_GROWTH = float(os.environ.get("MATCH_ELO_WINDOW_GROWTH", "25"))
+ELO_WINDOW_MAX = float(os.environ.get("MATCH_ELO_WINDOW_MAX", "0"))
+
+# 每次选房最多检查的候选房间数（大量房间都不接受时限制扫描长度）
+SCAN_LIMIT = 64
+
+# 离开匹配后多少秒内重新加入时沿用之前的等待时间
+REJOIN_GRACE = 60
+
+def elo_window(waited: float) -> float:
+    """等待了 waited 秒的玩家能接受的 |玩家 ELO - 房间平均分|"""
+    window = ELO_WINDOW + ELO_WINDOW_GROWTH * max(0.0, waited)
+    return min(window, ELO_WINDOW_MAX) if ELO_WINDOW_MAX > 0 else window
+
+def _timestamp(value: Optional[str]) -> float:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+class _Room:
+    """索引中的一个等待中房间"""
+
+    __slots__ = ('room_id', 'player_ids', 'count', 'avg', 'low', 'high', 'since')
+
+    def __init__(self, room: Dict):
+        players = room.get('players', [])
+        elos = [p.get('elo', 1000) for p in players]
+        self.room_id = room['_id']
+        self.player_ids = [p['player_id'] for p in players]
+        self.count = len(players)
+        self.avg = sum(elos) / len(elos)
+        self.low = min(elos)
+        self.high = max(elos)
+        self.since = _timestamp(room.get('created_at'))
+
+    @property
+    def key(self) -> Tuple[float, str]:
+        return self.avg, self.room_id
+
+    def spread_with(self, elo: float) -> float:
+        """加入 elo 后的极差"""
+        return max(self.high, elo) - min(self.low, elo)
+
+class MatchmakingQueue:
+    """等待中房间的 ELO 索引"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.rooms: Dict[str, _Room] = {}
+        # 未满的等待中房间，按 (平均分, _id) 排序
+        self.open = SortedList()
+        self.player_rooms: Dict[str, str] = {}
+        # 玩家 -> [开始等待的时刻, 离开匹配的时刻（在等待中的房间里时为 None）]
+        self.clocks: Dict[str, List] = {}
+        # 其他进程产生的变化 (room_id, 文档或 None)；回调中不能加锁等待，先入队
+        self.pending = deque()
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            self.pending.clear()
+            for room in get_collection('rooms').find({"status": "waiting"}, readonly=True):
+                self._put(room)
+            self.loaded = True
+            return
+        while self.pending:
+            room_id, room = self.pending.popleft()
+            self._apply(room_id, room)
+
+    def external_change(self, room_id: str, room: Optional[Dict]):
+        """其他进程修改了房间（storage 变化回调）"""
+        self.pending.append((room_id, room))
+
+    def _discard(self, room_id: str):
+        entry = self.rooms.pop(room_id, None)
+        if entry is None:
+            return
+        self.open.discard(entry.key)
+        for player_id in entry.player_ids:
+            if self.player_rooms.get(player_id) == room_id:
+                del self.player_rooms[player_id]
+
+    def _put(self, room: Dict):
+        if not room.get('players'):
+            # 空房间即将被删除
+            return
+        entry = _Room(room)
+        self.rooms[entry.room_id] = entry
+        if entry.count < ROOM_SIZE:
+            self.open.add(entry.key)
+        for player_id in entry.player_ids:
+            self.player_rooms[player_id] = entry.room_id
+            # 没有记录（载入已有房间、其他进程加入）时从房间创建时刻算起
+            clock = self.clocks.setdefault(player_id, [entry.since, None])
+            clock[1] = None
+
+    def _apply(self, room_id: str, room: Optional[Dict]):
+        old = self.rooms.get(room_id)
+        self._discard(room_id)
+        if room is not None and room.get('status') == 'waiting':
+            self._put(room)
+        if old is None:
+            return
+        placed = set()
+        if room is not None and room.get('status') != 'waiting':
+            placed = {p['player_id'] for p in room.get('players', [])}
+        now = time.time()
+        for player_id in old.player_ids:
+            if player_id in placed:
+                self.clocks.pop(player_id, None)
+            elif player_id not in self.player_rooms and player_id in self.clocks:
+                self.clocks[player_id][1] = now
+
+    def room_changed(self, room: Dict):
+        """房间修改后调用（传入最新的房间文档），应在持有该房间的文档锁时调用以保证顺序"""
+        with self.lock:
+            if self.loaded:
+                self._apply(room['_id'], room)
+
+    def room_removed(self, room_id: str):
+        """房间删除后调用"""
+        with self.lock:
+            if self.loaded:
+                self._apply(room_id, None)
+
+    def waited(self, player_id: str, now: Optional[float] = None) -> float:
+        """玩家（请求加入时）已等待的秒数，没有在等待的玩家从 now 开始计时"""
+        now = time.time() if now is None else now
+        with self.lock:
+            self._ensure_loaded()
+            clock = self.clocks.get(player_id)
+            if clock is None or (clock[1] is not None and now - clock[1] > REJOIN_GRACE):
+                # 离开超过 REJOIN_GRACE 的记录在再次加入时重新开始（记录数不超过玩家数）
+                clock = self.clocks[player_id] = [now, None]
+            return max(0.0, now - clock[0])
+
+    def room_of(self, player_id: str) -> Optional[str]:
+        """玩家所在的等待中房间"""
+        with self.lock:
+            self._ensure_loaded()
+            return self.player_rooms.get(player_id)
+
+    def queued_players(self) -> List[str]:
+        """等待中房间里的所有玩家，按房间创建先后、房间内加入先后排列"""
+        with self.lock:
+            self._ensure_loaded()
+            entries = sorted(self.rooms.values(), key=lambda entry: entry.since)
+            return [player_id for entry in entries for player_id in entry.player_ids]
+
+    def best_room(self, elo: float, exclude: Iterable[str] = (), waited: float = 0.0) -> Optional[str]:
+        """等待了 waited 秒、分数为 elo 的玩家应加入的房间；没有房间能接受时返回 None（应新建房间）"""
+        window = elo_window(waited)
+        exclude = set(exclude)
+        with self.lock:
+            self._ensure_loaded()
+            best: Optional[Tuple] = None
+            for entry in self._nearest(elo):
+                distance = abs(entry.avg - elo)
+                # 房间按 distance 由近到远给出：超出窗口后都不能加入；
+                # 加入后的极差至少为 distance，之后的房间不会更好（相等时人数可能更多，继续看）
+                if distance > window or (best is not None and distance > best[0]):
+                    break
+                if entry.room_id in exclude:
+                    continue
+                candidate = (entry.spread_with(elo), -entry.count, entry.since, entry.room_id)
+                if best is None or candidate < best:
+                    best = candidate
+            return best[3] if best is not None else None
+
+    def _nearest(self, elo: float):
+        """按平均分与 elo 的距离由近到远依次给出未满的房间（最多 SCAN_LIMIT 个）"""
+        right = self.open.bisect_left((elo, ''))
+        left = right - 1
+        for _ in range(SCAN_LIMIT):
+            if left < 0 and right >= len(self.open):
+                return
+            if right >= len(self.open) or (left >= 0 and elo - self.open[left][0] <= self.open[right][0] - elo):
+                key = self.open[left]
+                left -= 1
+            else:
+                key = self.open[right]
+                right += 1
+            yield self.rooms[key[1]]
+
+queue = MatchmakingQueue()
+add_change_listener('rooms', queue.external_change)
@@ -0,0 +1,255 @@
+"""
+运行指标 - 以 Prometheus 文本格式从 GET /api/metrics 导出
+
+    http_request_duration_seconds{method,route,status}   请求耗时（到响应头发出为止，按路由模板）
+    http_requests_in_progress                            正在处理的请求数
+    storage_operation_duration_seconds{collection,op}    Collection 方法的耗时（包含锁等待）
+    storage_lock_wait_seconds{collection,lock}           锁等待时间，lock 为 read / write / document（只记录发生了等待的获取）
+    storage_load_seconds{collection,source}              读取并解析快照 / 日志的耗时，source 为 snapshot / journal
+    storage_serialize_seconds{collection}                序列化快照的耗时
+    storage_bytes_read_total{collection,source}          读取的快照 / 日志字节数
+    storage_bytes_written_total{collection,target}       写入的快照 / 日志字节数
+
+每次记录只在对应子项的锁内更新几个数，每次存储调用增加约 1-2 微秒，可以常开；METRICS_ENABLED=0 时不做任何记录。
+多进程部署时每个进程只导出自己的指标。
+"""
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from utils import diagnostics
+
+ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# 请求耗时的桶（秒）
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# 存储操作耗时的桶（秒），内存操作在几十微秒内
+STORAGE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """带标签的指标：每组标签值一个子项，子项首次使用时创建"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self.children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        raise NotImplementedError
+
+class _Value:
+    __slots__ = ('lock', 'value')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self.lock:
+            self.value -= amount
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+class _HistogramValue:
+    __slots__ = ('lock', 'buckets', 'counts', 'sum')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = REQUEST_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _render_child(self, values, child) -> List[str]:
+        with child.lock:
+            counts, total = list(child.counts), child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+_registry: List[_Metric] = []
+
+def render() -> str:
+    """所有指标的 Prometheus 文本格式"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# ==================== 指标 ====================
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency until the response headers are sent",
+    ("method", "route", "status"), REQUEST_BUCKETS)
+REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests currently being handled")
+STORAGE_OPERATION_SECONDS = Histogram(
+    "storage_operation_duration_seconds", "Collection method latency including lock waits",
+    ("collection", "op"), STORAGE_BUCKETS)
+LOCK_WAIT_SECONDS = Histogram(
+    "storage_lock_wait_seconds", "Time spent waiting for a contended storage lock",
+    ("collection", "lock"), STORAGE_BUCKETS)
+LOAD_SECONDS = Histogram(
+    "storage_load_seconds", "Time spent reading and parsing snapshots and journals",
+    ("collection", "source"), STORAGE_BUCKETS)
+SERIALIZE_SECONDS = Histogram(
+    "storage_serialize_seconds", "Time spent serializing collection snapshots",
+    ("collection",), STORAGE_BUCKETS)
+BYTES_READ = Counter(
+    "storage_bytes_read_total", "Bytes read from snapshots and journals", ("collection", "source"))
+BYTES_WRITTEN = Counter(
+    "storage_bytes_written_total", "Bytes written to snapshots and journals", ("collection", "target"))
+
+# ==================== 记录 ====================
+
+def timed_operation(method):
+    """记录 Collection 方法的耗时（实例的 name 属性为集合名），并交给慢操作日志"""
+    if not ENABLED and not diagnostics.ENABLED:
+        return method
+    op = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - started
+            if ENABLED:
+                STORAGE_OPERATION_SECONDS.labels(self.name, op).observe(seconds)
+            if diagnostics.ENABLED:
+                diagnostics.operation_finished(self, op, args, seconds)
+    return wrapper
+
+def lock_wait_observer(collection: str) -> Optional[Callable[[str, float], None]]:
+    """锁等待的回调 (lock, seconds)，传给 RWLock / StripedLocks"""
+    if not ENABLED:
+        return None
+    return lambda lock, seconds: LOCK_WAIT_SECONDS.labels(collection, lock).observe(seconds)
+
+def observe_load(collection: str, source: str, nbytes: int, seconds: float):
+    if ENABLED:
+        LOAD_SECONDS.labels(collection, source).observe(seconds)
+        BYTES_READ.labels(collection, source).inc(nbytes)
+
+def observe_serialize(collection: str, seconds: float):
+    if ENABLED:
+        SERIALIZE_SECONDS.labels(collection).observe(seconds)
+
+def observe_write(collection: str, target: str, nbytes: int):
+    if ENABLED:
+        BYTES_WRITTEN.labels(collection, target).inc(nbytes)
+
+class MetricsMiddleware:
+    """ASGI 中间件：按路由模板记录请求耗时（WebSocket 不记录）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not ENABLED or scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                self._observe(scope, status, started)
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.labels().inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_PROGRESS.labels().dec()
+            if status is None:
+                self._observe(scope, 500, started)
+
+    @staticmethod
+    def _observe(scope, status: int, started: float):
+        route = scope.get('route')
+        # 未匹配到路由的请求（404 等）归为一类，避免任意路径产生大量标签
+        path = getattr(route, 'path', None) or 'unmatched'
+        REQUEST_SECONDS.labels(scope['method'], path, str(status)).observe(time.perf_counter() - started)
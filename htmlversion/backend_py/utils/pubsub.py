@@ -0,0 +1,118 @@
+"""
+房间 / BP 状态推送
+
+每个房间、每场 BP 是一个频道（"room:<id>"、"bp:<id>"），WebSocket / SSE 连接订阅频道后
+先收到一份完整状态，之后只收到写入时发布的增量：
+
+    {"type": "snapshot", "data": {...完整文档...}, "version": 12}
+    {"type": "delta",    "data": {...变化的字段...}, "version": 13}
+    {"type": "deleted",  "data": null, "version": 14}
+
+version 是文档所在集合的修改版本（storage.Collection.version），发布增量时在写入之后读取，
+因此不小于写入时的版本；订阅时版本不超过快照版本的增量已包含在快照中，服务端直接丢弃。
+增量是字段的新值（与 $set 相同，也可能是写入后的完整文档），客户端按字段覆盖即可；
+并发写入的增量可能乱序到达，客户端丢弃 updated_at 早于当前状态的增量。
+订阅者的队列有上限，来不及消费时丢弃积压并让客户端重新订阅（收到 "resync"）。
+"""
+import asyncio
+import threading
+from typing import Any, Dict, Optional, Set
+
+from utils.storage import get_collection
+
+# 单个订阅者最多积压的消息数
+QUEUE_SIZE = 100
+
+class Subscription:
+    """一个连接对一个频道的订阅"""
+
+    def __init__(self, channel: str, loop: asyncio.AbstractEventLoop):
+        self.channel = channel
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(QUEUE_SIZE)
+
+    def _put(self, message: Dict):
+        if self.queue.full():
+            # 积压过多：丢弃旧消息，让客户端重新获取完整状态
+            self.clear()
+            message = {"type": "resync", "data": None}
+        self.queue.put_nowait(message)
+
+    def clear(self):
+        """丢弃已收到的消息（在事件循环中调用）"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def discard_through(self, version: int):
+        """丢弃版本不超过 version 的消息，保留更新的消息和 resync（在事件循环中调用）"""
+        kept = []
+        while not self.queue.empty():
+            message = self.queue.get_nowait()
+            if message.get('version') is None or message['version'] > version:
+                kept.append(message)
+        for message in kept:
+            self.queue.put_nowait(message)
+
+    async def get(self) -> Dict:
+        return await self.queue.get()
+
+class Broker:
+    """频道 -> 订阅者"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels: Dict[str, Set[Subscription]] = {}
+
+    def subscribe(self, channel: str) -> Subscription:
+        """在事件循环中调用"""
+        sub = Subscription(channel, asyncio.get_running_loop())
+        with self.lock:
+            self.channels.setdefault(channel, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self.lock:
+            subs = self.channels.get(sub.channel)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self.channels[sub.channel]
+
+    def publish(self, channel: str, message_type: str, data: Any = None, version: Optional[int] = None):
+        """向频道的所有订阅者发送消息（可在任意线程调用）"""
+        with self.lock:
+            subs = list(self.channels.get(channel, ()))
+        if not subs:
+            return
+        message = {"type": message_type, "data": data, "version": version}
+        for sub in subs:
+            if _running_loop() is sub.loop:
+                sub._put(message)
+            else:
+                sub.loop.call_soon_threadsafe(sub._put, message)
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+broker = Broker()
+
+def room_channel(room_id: str) -> str:
+    return f"room:{room_id}"
+
+def bp_channel(bp_id: str) -> str:
+    return f"bp:{bp_id}"
+
+def publish_room(room_id: str, changes: Optional[Dict]):
+    """房间变化（写入之后调用）；changes 为 None 表示房间已删除"""
+    version = get_collection('rooms').version
+    if changes is None:
+        broker.publish(room_channel(room_id), "deleted", version=version)
+    else:
+        broker.publish(room_channel(room_id), "delta", changes, version)
+
+def publish_bp(bp_id: str, changes: Dict):
+    """BP 状态变化（写入之后调用）"""
+    broker.publish(bp_channel(bp_id), "delta", changes, get_collection('bp_records').version)
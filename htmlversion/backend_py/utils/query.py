@@ -0,0 +1,327 @@
+"""
+查询与更新语法 - JSON 存储和 SQLite 存储共用
+
+查询：{"field": value, ...}，所有字段相等即匹配
+    字段可以是点分路径（"players.player_id"），经过数组时任一元素匹配即可，数字表示下标（"players.9"）；
+    数组字段与单个值比较时，数组包含该值即匹配
+    value 也可以是运算符：{"$in": [...]} / {"$nin": [...]} / {"$ne": v} / {"$gt": v} / {"$gte": v} /
+    {"$lt": v} / {"$lte": v}，同一字段的多个运算符需同时满足；大小比较时缺失、为 null 或类型不可比的值不匹配，
+    $ne / $nin 匹配没有任何值（数组的任一元素）等于给定值的文档，包括缺失该字段的
+排序：[("field", 1), ("other", -1)]，或 "field" / "-field"；缺失的值排在最前（倒序时最后），
+    排序值相同时按 _id 排（方向与最后一个排序字段相同）
+投影：["field", ...] 或 {"field": 1, ...} 只保留这些顶层字段（_id 总会保留，除非 {"_id": 0}），
+    {"field": 0, ...} 去掉这些字段
+更新：$set / $inc / $push / $addToSet / $pull，字段同样可以是点分路径；
+    "players.$.ready" 中的 $ 表示查询条件（"players.player_id": ...）匹配到的第一个数组元素
+"""
+import heapq
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from datetime import datetime
+
+from utils.docview import DocumentView, thaw
+
+class ConditionFailed(Exception):
+    """条件更新（expect）时文档不满足条件；doc 为文档的当前状态"""
+
+    def __init__(self, collection: str, doc: Dict):
+        self.collection = collection
+        self.doc = doc
+        super().__init__(f"{collection}: condition not met for {doc.get('_id')!r}")
+
+def clone(value: Any) -> Any:
+    """复制 JSON 结构的数据（比 copy.deepcopy 快得多）"""
+    if isinstance(value, dict):
+        return {k: clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [clone(v) for v in value]
+    return value
+
+def generate_id() -> str:
+    """生成唯一ID"""
+    import random
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    random_suffix = ''.join([str(random.randint(0, 9)) for _ in range(6)])
+    return f"{timestamp}{random_suffix}"
+
+def prepare_insert(document: Dict) -> Dict:
+    """复制待插入的文档，补齐 _id 和 created_at"""
+    doc = thaw(document)
+
+    # 生成ID
+    if '_id' not in doc:
+        doc['_id'] = generate_id()
+
+    # 添加时间戳
+    if 'created_at' not in doc:
+        doc['created_at'] = datetime.now().isoformat()
+
+    return doc
+
+_COMPARISONS = {
+    '$gt': lambda a, b: a > b,
+    '$gte': lambda a, b: a >= b,
+    '$lt': lambda a, b: a < b,
+    '$lte': lambda a, b: a <= b,
+}
+_NEGATIONS = {'$ne', '$nin'}
+
+def is_operator(value: Any) -> bool:
+    """查询值是否为运算符表达式（{"$gt": ...} 这类所有键以 $ 开头的字典）"""
+    return isinstance(value, dict) and bool(value) and all(isinstance(k, str) and k.startswith('$') for k in value)
+
+def _test(value: Any, op: str, arg: Any) -> bool:
+    """单个正向运算符（$in 和大小比较）"""
+    if op == '$in':
+        if not isinstance(arg, (list, tuple, set)):
+            raise ValueError("$in needs a list")
+        return any(_equals(value, v) for v in arg)
+    compare = _COMPARISONS.get(op)
+    if compare is None:
+        raise ValueError(f"Unsupported query operator: {op}")
+    if isinstance(value, list) and not isinstance(arg, list):
+        return any(_test(v, op, arg) for v in value)
+    if value is None or arg is None:
+        return False
+    try:
+        return compare(value, arg)
+    except TypeError:
+        return False
+
+def _equals(value: Any, expected: Any) -> bool:
+    if is_operator(expected):
+        return all(_test(value, op, arg) for op, arg in expected.items())
+    if value == expected:
+        return True
+    return isinstance(value, list) and not isinstance(expected, list) and expected in value
+
+def _matches_path(value: Any, parts: List[str], expected: Any) -> bool:
+    if not parts:
+        return _equals(value, expected)
+    if isinstance(value, list):
+        if parts[0].isdigit():
+            index = int(parts[0])
+            return _matches_path(value[index] if index < len(value) else None, parts[1:], expected)
+        return any(_matches_path(element, parts, expected) for element in value)
+    if isinstance(value, dict):
+        return _matches_path(value.get(parts[0]), parts[1:], expected)
+    return _matches_path(None, parts[1:], expected)
+
+def _matches_field(item: Dict, field: str, expected: Any) -> bool:
+    if '.' in field:
+        return _matches_path(item, field.split('.'), expected)
+    return _equals(item.get(field), expected)
+
+def _matches_operators(item: Dict, field: str, operators: Dict) -> bool:
+    # $ne / $nin 是"没有值等于"，不能逐个数组元素判断，取正向条件的反
+    positive = {}
+    for op, arg in operators.items():
+        if op == '$ne':
+            if _matches_field(item, field, arg):
+                return False
+        elif op == '$nin':
+            if _matches_field(item, field, {'$in': arg}):
+                return False
+        else:
+            positive[op] = arg
+    return not positive or _matches_field(item, field, positive)
+
+def matches_query(item: Dict, query: Dict) -> bool:
+    """文档是否匹配查询条件"""
+    for k, v in query.items():
+        if is_operator(v):
+            if not _matches_operators(item, k, v):
+                return False
+        elif not _matches_field(item, k, v):
+            return False
+    return True
+
+# ==================== 排序和投影 ====================
+
+SortSpec = Union[str, Sequence[Tuple[str, int]], None]
+
+def normalize_sort(sort: SortSpec) -> List[Tuple[str, int]]:
+    """把排序参数整理为 [(字段, 1 或 -1), ...]"""
+    if not sort:
+        return []
+    if isinstance(sort, str):
+        sort = [sort]
+    result = []
+    for entry in sort:
+        if isinstance(entry, str):
+            field, direction = (entry[1:], -1) if entry.startswith('-') else (entry, 1)
+        else:
+            field, direction = entry
+        if direction not in (1, -1):
+            raise ValueError(f"Sort direction must be 1 or -1: {field}")
+        result.append((field, direction))
+    return result
+
+def get_field(doc: Dict, field: str) -> Any:
+    """取字段值，点分路径只经过字典"""
+    if '.' not in field:
+        return doc.get(field)
+    value = doc
+    for part in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+class _Reversed:
+    """倒序比较的包装，用于方向混合的排序键"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other: '_Reversed') -> bool:
+        return other.value < self.value
+
+    def __eq__(self, other) -> bool:
+        return self.value == other.value
+
+def sort_key(sort: List[Tuple[str, int]]) -> Tuple[Callable[[Dict], Tuple], bool]:
+    """排序键和是否倒序：方向与第一个字段不同的字段用 _Reversed 包装"""
+    reverse = sort[0][1] < 0
+    fields = [(field, (direction < 0) != reverse) for field, direction in sort]
+    id_flipped = (sort[-1][1] < 0) != reverse
+
+    def key(doc: Dict) -> Tuple:
+        parts = []
+        for field, flipped in fields:
+            value = get_field(doc, field)
+            part = (value is not None, value)
+            parts.append(_Reversed(part) if flipped else part)
+        parts.append(_Reversed(doc.get('_id')) if id_flipped else doc.get('_id'))
+        return tuple(parts)
+    return key, reverse
+
+def sort_documents(docs: Iterable[Dict], sort: List[Tuple[str, int]], skip: int = 0,
+                   limit: Optional[int] = None) -> List[Dict]:
+    """排序后跳过 skip 个、取 limit 个；有 limit 时用大小为 skip + limit 的堆，不对全部结果排序"""
+    key, reverse = sort_key(sort)
+    if limit is None:
+        return sorted(docs, key=key, reverse=reverse)[skip:]
+    if reverse:
+        top = heapq.nlargest(skip + limit, docs, key=key)
+    else:
+        top = heapq.nsmallest(skip + limit, docs, key=key)
+    return top[skip:]
+
+def projector(projection: Union[Iterable[str], Dict[str, Any], None],
+              readonly: bool = False) -> Callable[[Dict], Dict]:
+    """返回按投影复制文档的函数（没有投影时复制整个文档）；readonly 时返回不复制的只读视图（utils.docview）"""
+    if not projection:
+        return DocumentView if readonly else clone
+    if isinstance(projection, dict):
+        include = {f for f, v in projection.items() if v}
+        exclude = {f for f, v in projection.items() if not v}
+    else:
+        include, exclude = set(projection), set()
+    if include:
+        if exclude - {'_id'}:
+            raise ValueError("Projection cannot mix inclusion and exclusion")
+        if '_id' not in exclude:
+            include.add('_id')
+        if readonly:
+            return lambda doc: DocumentView({k: v for k, v in doc.items() if k in include})
+        return lambda doc: {k: clone(v) for k, v in doc.items() if k in include}
+    if readonly:
+        return lambda doc: DocumentView({k: v for k, v in doc.items() if k not in exclude})
+    return lambda doc: {k: clone(v) for k, v in doc.items() if k not in exclude}
+
+def check_expected(collection: str, doc: Dict, expect: Optional[Dict]):
+    """条件更新：文档不满足 expect 时抛出 ConditionFailed"""
+    if expect and not matches_query(doc, expect):
+        raise ConditionFailed(collection, clone(doc))
+
+def _positional(doc: Dict, parts: List[str], query: Optional[Dict]) -> List[str]:
+    """把路径中的 $ 换成查询条件匹配到的第一个数组元素的下标"""
+    if '$' not in parts:
+        return parts
+    pos = parts.index('$')
+    prefix = '.'.join(parts[:pos]) + '.'
+    conditions = [(k[len(prefix):].split('.'), v) for k, v in (query or {}).items() if k.startswith(prefix)]
+    array = _get_path(doc, parts[:pos])
+    if not conditions or not isinstance(array, list):
+        raise ValueError(f"Positional operator needs a query condition on {prefix}*")
+    for index, element in enumerate(array):
+        if all(_matches_path(element, sub, v) for sub, v in conditions):
+            return parts[:pos] + [str(index)] + parts[pos + 1:]
+    raise ValueError(f"No array element matched for {'.'.join(parts)}")
+
+def _get_path(value: Any, parts: List[str]) -> Any:
+    for part in parts:
+        if isinstance(value, list):
+            value = value[int(part)] if int(part) < len(value) else None
+        elif isinstance(value, dict):
+            value = value.get(part)
+        else:
+            return None
+    return value
+
+def _set_child(container: Any, part: str, value: Any):
+    if isinstance(container, list):
+        container[int(part)] = value
+    else:
+        container[part] = value
+
+def _update_path(new_doc: Dict, parts: List[str], func: Callable[[Any], Any]):
+    """把 new_doc 中路径处的值替换为 func(旧值)
+
+    沿途的字典和列表先复制再修改，原文档的嵌套结构保持不变（存储中的文档不会被原地修改）。
+    """
+    container = new_doc
+    for part in parts[:-1]:
+        child = _get_path(container, [part])
+        child = list(child) if isinstance(child, list) else dict(child or {})
+        _set_child(container, part, child)
+        container = child
+    _set_child(container, parts[-1], func(_get_path(container, parts[-1:])))
+
+def _add_to_set(values: Any, value: Any) -> List:
+    values = list(values or [])
+    if value not in values:
+        values.append(thaw(value))
+    return values
+
+def _pull(values: Any, condition: Any) -> List:
+    """删除等于 condition 的元素；condition 为字典时删除匹配该查询的元素"""
+    if isinstance(condition, dict):
+        return [v for v in values or [] if not (isinstance(v, dict) and matches_query(v, condition))]
+    return [v for v in values or [] if v != condition]
+
+def apply_update(doc: Dict, update: Dict, query: Optional[Dict] = None) -> Dict:
+    """在文档副本上执行 $set / $inc / $push / $addToSet / $pull，返回新文档
+
+    query 为定位文档的查询条件，用于解析路径中的位置运算符 $。
+    """
+    new_doc = dict(doc)
+
+    def path(field: str) -> List[str]:
+        return _positional(doc, field.split('.'), query)
+
+    # 处理 $set 操作
+    for k, v in update.get('$set', {}).items():
+        _update_path(new_doc, path(k), lambda old, v=v: thaw(v))
+
+    # 处理 $inc 操作
+    for k, v in update.get('$inc', {}).items():
+        _update_path(new_doc, path(k), lambda old, v=v: (old or 0) + v)
+
+    # 处理 $push 操作
+    for k, v in update.get('$push', {}).items():
+        _update_path(new_doc, path(k), lambda old, v=v: list(old or []) + [thaw(v)])
+
+    # 处理 $addToSet 操作（已存在相同元素时不添加）
+    for k, v in update.get('$addToSet', {}).items():
+        _update_path(new_doc, path(k), lambda old, v=v: _add_to_set(old, v))
+
+    # 处理 $pull 操作
+    for k, v in update.get('$pull', {}).items():
+        _update_path(new_doc, path(k), lambda old, v=v: _pull(old, v))
+
+    # 更新时间
+    new_doc['updated_at'] = datetime.now().isoformat()
+    return new_doc
@@ -0,0 +1,119 @@
+"""
+快照文件的序列化格式
+
+    json     带缩进的 JSON（默认，便于手工查看，与旧版本的文件相同）
+    orjson   紧凑 JSON，用 orjson 编码（需要 pip install orjson）
+    msgpack  MessagePack 二进制（需要 pip install msgpack）
+任一格式都可以再用 zstd 压缩（需要 pip install zstandard），文件名加 .zst 后缀。
+
+文件后缀由格式决定（players.json / players.msgpack / players.msgpack.zst），
+读取时按后缀选择解码方式，所以切换格式后旧格式的快照仍然可以读取。
+JSON 快照在装有 orjson 时总是用 orjson 解码。
+"""
+import json
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMATS = ('json', 'orjson', 'msgpack')
+COMPRESSIONS = ('', 'zstd')
+
+# zstd 压缩级别（1-22，越高越小越慢）
+ZSTD_LEVEL = 3
+
+class Serializer:
+    """一种快照格式：文件后缀和编解码函数"""
+
+    def __init__(self, name: str, suffix: str,
+                 dumps: Callable[[List[Dict]], bytes], loads: Callable[[bytes], List[Dict]]):
+        self.name = name
+        self.suffix = suffix
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return f"Serializer({self.name!r})"
+
+def _json_dumps(docs: List[Dict]) -> bytes:
+    return json.dumps(docs, ensure_ascii=False, indent=2, default=str).encode('utf-8')
+
+def _json_loads(payload: bytes) -> List[Dict]:
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+def _orjson_dumps(docs: List[Dict]) -> bytes:
+    return orjson.dumps(docs, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+def _msgpack_dumps(docs: List[Dict]) -> bytes:
+    return msgpack.packb(docs, default=str, use_bin_type=True)
+
+def _msgpack_loads(payload: bytes) -> List[Dict]:
+    return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+
+def _zstd(serializer: Serializer, level: int) -> Serializer:
+    """在 serializer 外面套一层 zstd 压缩"""
+    def dumps(docs: List[Dict]) -> bytes:
+        return zstandard.ZstdCompressor(level=level).compress(serializer.dumps(docs))
+
+    def loads(payload: bytes) -> List[Dict]:
+        return serializer.loads(zstandard.ZstdDecompressor().decompress(payload))
+
+    return Serializer(f"{serializer.name}+zstd", serializer.suffix + ".zst", dumps, loads)
+
+def _require(module, package: str, setting: str):
+    if module is None:
+        raise RuntimeError(f"{setting} requires the '{package}' package (pip install {package})")
+
+def get_serializer(name: str = 'json', compress: str = '', level: int = ZSTD_LEVEL) -> Serializer:
+    """按格式名和压缩方式构造序列化器（缺少依赖时抛出 RuntimeError）"""
+    if name not in FORMATS:
+        raise ValueError(f"Unknown storage format '{name}' (expected one of {', '.join(FORMATS)})")
+    if compress not in COMPRESSIONS:
+        raise ValueError(f"Unknown storage compression '{compress}' (expected 'zstd' or empty)")
+
+    if name == 'json':
+        serializer = Serializer('json', '.json', _json_dumps, _json_loads)
+    elif name == 'orjson':
+        _require(orjson, 'orjson', "STORAGE_FORMAT=orjson")
+        serializer = Serializer('orjson', '.json', _orjson_dumps, _json_loads)
+    else:
+        _require(msgpack, 'msgpack', "STORAGE_FORMAT=msgpack")
+        serializer = Serializer('msgpack', '.msgpack', _msgpack_dumps, _msgpack_loads)
+
+    if compress == 'zstd':
+        _require(zstandard, 'zstandard', "STORAGE_COMPRESS=zstd")
+        serializer = _zstd(serializer, level)
+    return serializer
+
+# 所有可能出现的快照后缀（长的在前，".json.zst" 先于 ".json" 匹配）
+SUFFIXES = ('.msgpack.zst', '.json.zst', '.msgpack', '.json')
+
+def snapshot_suffix(path: Path) -> Optional[str]:
+    """path 是快照文件时返回它的后缀，否则返回 None"""
+    for suffix in SUFFIXES:
+        if path.name.endswith(suffix) and len(path.name) > len(suffix):
+            return suffix
+    return None
+
+def serializer_for(path: Path) -> Serializer:
+    """按文件后缀选择读取快照用的序列化器"""
+    suffix = snapshot_suffix(path)
+    if suffix is None:
+        raise ValueError(f"Not a snapshot file: {path.name}")
+    name = 'msgpack' if suffix.startswith('.msgpack') else 'json'
+    return get_serializer(name, 'zstd' if suffix.endswith('.zst') else '')
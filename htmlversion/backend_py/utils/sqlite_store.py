@@ -0,0 +1,381 @@
+"""
+SQLite 存储后端 - 与 JSON 存储提供相同的 Collection 接口
+
+所有集合保存在同一个 SQLite 文件中（WAL 模式），每个集合一张表：
+    seq  INTEGER PRIMARY KEY  插入顺序
+    _id  TEXT UNIQUE          文档 ID
+    doc  TEXT                 文档 JSON
+
+storage.INDEXES 中声明的索引建成 json_extract 表达式索引；
+查询中的标量相等、$in 和大小比较条件下推为 SQL，其余条件在 Python 中过滤
+（下推时假定顶层字段为标量，数组字段的"包含"查询不会命中）；
+find 的排序字段为简单字段时在 SQL 中排序，逐行过滤到取够 skip + limit 个为止。
+每个线程使用独立连接，读操作互不阻塞；写操作在 BEGIN IMMEDIATE 事务中完成，
+storage.transaction() 把多个集合的写入放进同一个 SQLite 事务。
+"""
+import json
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils import metrics
+from utils.docview import DocumentView
+from utils.index import DuplicateKeyError
+from utils.query import (SortSpec, apply_update, check_expected, is_operator, matches_query, normalize_sort,
+                         prepare_insert, projector, sort_documents)
+
+_FIELD_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# 索引名 -> 字段，用于把 UNIQUE 冲突翻译成 DuplicateKeyError
+_index_fields: Dict[str, Tuple[str, ...]] = {}
+
+class SQLiteDatabase:
+    """SQLite 数据库文件及每线程连接"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.local = threading.local()
+        self.connections: List[sqlite3.Connection] = []
+        self.lock = threading.Lock()
+        self.tables = set()
+        # 集合名 -> 本进程提交的写入次数（Collection.version）
+        self.versions: Dict[str, int] = {}
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), isolation_level=None, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def ensure_table(self, name: str, indexes=()):
+        """创建集合表和声明的表达式索引"""
+        if name in self.tables:
+            return
+        conn = self.connect()
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{name}" ('
+            f'seq INTEGER PRIMARY KEY AUTOINCREMENT, _id TEXT NOT NULL UNIQUE, doc TEXT NOT NULL)'
+        )
+        for index in indexes:
+            try:
+                create_sql_index(conn, name, index.fields, index.unique, index.order_by)
+            except sqlite3.IntegrityError as e:
+                # 历史数据中已有重复值，退化为普通索引
+                print(f"Warning: {name}.{'+'.join(index.fields)} is not unique ({e})")
+                create_sql_index(conn, name, index.fields, order_by=index.order_by)
+        self.tables.add(name)
+
+    def bump(self, names):
+        """提交写入之后递增集合的版本"""
+        with self.lock:
+            for name in names:
+                self.versions[name] = self.versions.get(name, 0) + 1
+
+    @contextmanager
+    def transaction(self, names, indexes: Dict) -> Iterator[Dict[str, 'SQLiteCollection']]:
+        """在当前线程的连接上开启一个覆盖多个集合的事务"""
+        collections = {
+            name: SQLiteCollection(name, self, indexes.get(name, ()), in_transaction=True)
+            for name in names
+        }
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield collections
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self.bump(names)
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+        self.local = threading.local()
+
+def _column(field: str) -> str:
+    return f"json_extract(doc, '$.{field}')"
+
+def create_sql_index(conn: sqlite3.Connection, table: str, fields, unique: bool = False,
+                     order_by: Optional[str] = None):
+    """在 json_extract 表达式上建索引（order_by 作为最后一列，用于按该字段排序的分页查询）"""
+    fields = [f for f in fields if _FIELD_RE.match(f)]
+    if not fields:
+        return
+    index_name = f"{table}_{'_'.join(fields)}"
+    columns = ", ".join(_column(f) for f in fields)
+    if order_by and _FIELD_RE.match(order_by):
+        index_name += f"_by_{order_by}"
+        columns += f", {_column(order_by)}"
+    _index_fields[index_name] = tuple(fields)
+    conn.execute(
+        f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS "{index_name}" ON "{table}"({columns})'
+    )
+
+_SQL_COMPARISONS = {'$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}
+
+def _scalar(value) -> bool:
+    return isinstance(value, (str, int, float))
+
+def _operator_clauses(column: str, operators: Dict, clauses: list, params: list):
+    """运算符条件中能下推的部分（$in 和与标量的大小比较；$ne / $nin 对缺失字段的语义不同，不下推）"""
+    for op, arg in operators.items():
+        if op == '$in' and isinstance(arg, (list, tuple)) and all(_scalar(v) for v in arg):
+            if not arg:
+                clauses.append("0")
+            else:
+                clauses.append(f"{column} IN ({', '.join('?' * len(arg))})")
+                params.extend(arg)
+        elif op in _SQL_COMPARISONS and _scalar(arg):
+            clauses.append(f"{column} {_SQL_COMPARISONS[op]} ?")
+            params.append(arg)
+
+def _where(query: Optional[Dict]) -> Tuple[str, list]:
+    """把查询中能下推的标量相等和运算符条件翻译为 WHERE 子句"""
+    if not query:
+        return "", []
+    clauses = []
+    params = []
+    for k, v in query.items():
+        if k == '_id' and isinstance(v, str):
+            clauses.append("_id = ?")
+            params.append(v)
+        elif k != '_id' and not _FIELD_RE.match(k):
+            continue
+        elif is_operator(v):
+            _operator_clauses('_id' if k == '_id' else _column(k), v, clauses, params)
+        elif k == '_id':
+            continue
+        elif v is None:
+            clauses.append(f"{_column(k)} IS NULL")
+        elif isinstance(v, (str, int, float)):
+            clauses.append(f"{_column(k)} = ?")
+            params.append(v)
+    if not clauses:
+        return "", []
+    return " WHERE " + " AND ".join(clauses), params
+
+def _order_by(sort: List[Tuple[str, int]]) -> Optional[str]:
+    """把排序翻译为 ORDER BY 子句（NULL 在升序时排在最前，与 Python 中一致）；有字段不能下推时返回 None"""
+    terms = []
+    for field, direction in sort:
+        if field != '_id' and not _FIELD_RE.match(field):
+            return None
+        terms.append(f"{'_id' if field == '_id' else _column(field)} {'DESC' if direction < 0 else 'ASC'}")
+    terms.append(f"_id {'DESC' if sort[-1][1] < 0 else 'ASC'}")
+    return ", ".join(terms)
+
+def _duplicate_error(table: str, error: sqlite3.IntegrityError, doc: Dict) -> DuplicateKeyError:
+    """根据 SQLite 的 UNIQUE 冲突信息构造 DuplicateKeyError"""
+    match = re.search(r"index '([^']+)'", str(error))
+    fields = _index_fields.get(match.group(1), ()) if match else ()
+    if not fields:
+        fields = ('_id',)
+    return DuplicateKeyError(table, fields, tuple(doc.get(f) for f in fields))
+
+def _view(doc: Dict, readonly: bool) -> Dict:
+    return DocumentView(doc) if readonly else doc
+
+def _dumps(doc: Dict) -> str:
+    return json.dumps(doc, ensure_ascii=False, separators=(',', ':'), default=str)
+
+class SQLiteCollection:
+    """SQLite 集合操作类，接口与 storage.Collection 相同"""
+
+    def __init__(self, name: str, db: SQLiteDatabase, indexes=(), in_transaction: bool = False):
+        self.name = name
+        self.db = db
+        self.in_transaction = in_transaction
+        db.ensure_table(name, indexes)
+
+    def __len__(self) -> int:
+        """集合中的文档数"""
+        return self.db.connect().execute(f'SELECT COUNT(*) FROM "{self.name}"').fetchone()[0]
+
+    @property
+    def version(self) -> int:
+        """集合的修改版本（本进程提交的写入，只增不减）"""
+        return self.db.versions.get(self.name, 0)
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """写操作：在外层事务中直接执行，否则单独开一个 BEGIN IMMEDIATE 事务"""
+        conn = self.db.connect()
+        if self.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self.db.bump((self.name,))
+
+    def _scan(self, conn: sqlite3.Connection, query: Optional[Dict], order: str = 'seq') -> Iterator[Dict]:
+        where, params = _where(query)
+        sql = f'SELECT doc FROM "{self.name}"{where} ORDER BY {order}'
+        for (raw,) in conn.execute(sql, params):
+            doc = json.loads(raw)
+            if not query or matches_query(doc, query):
+                yield doc
+
+    def _select(self, conn: sqlite3.Connection, query: Optional[Dict], limit: Optional[int] = None) -> List[Dict]:
+        return list(islice(self._scan(conn, query), limit))
+
+    @metrics.timed_operation
+    def find_one(self, query: Dict, readonly: bool = False) -> Optional[Dict]:
+        """查找单个文档；readonly 时同样返回只读视图（文档每次从 JSON 解析，本来就不共享，包装只为行为一致）"""
+        docs = self._select(self.db.connect(), query, limit=1)
+        return _view(docs[0], readonly) if docs else None
+
+    @metrics.timed_operation
+    def find(self, query: Dict = None, sort: SortSpec = None, limit: Optional[int] = None, skip: int = 0,
+             projection=None, readonly: bool = False) -> List[Dict]:
+        """查找多个文档，可排序、分页和只取部分字段，语法见 utils.query"""
+        conn = self.db.connect()
+        sort = normalize_sort(sort)
+        order = _order_by(sort) if sort else 'seq'
+        if order is None:
+            docs = sort_documents(self._scan(conn, query), sort, skip, limit)
+        else:
+            docs = list(islice(self._scan(conn, query, order), skip, None if limit is None else skip + limit))
+        if projection or readonly:
+            copy = projector(projection, readonly)
+            docs = [copy(doc) for doc in docs]
+        return docs
+
+    @metrics.timed_operation
+    def find_by_id(self, doc_id: str, readonly: bool = False) -> Optional[Dict]:
+        """根据ID查找文档"""
+        row = self.db.connect().execute(
+            f'SELECT doc FROM "{self.name}" WHERE _id = ?', (doc_id,)
+        ).fetchone()
+        return _view(json.loads(row[0]), readonly) if row else None
+
+    @metrics.timed_operation
+    def find_by_ids(self, doc_ids, readonly: bool = False) -> List[Dict]:
+        """根据一组ID批量查找文档（不存在的ID忽略，结果按传入顺序）"""
+        doc_ids = list(dict.fromkeys(doc_ids))
+        found = {}
+        conn = self.db.connect()
+        # 分批查询，避免超过 SQLite 的参数个数限制
+        for start in range(0, len(doc_ids), 500):
+            chunk = doc_ids[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            for doc_id, raw in conn.execute(
+                f'SELECT _id, doc FROM "{self.name}" WHERE _id IN ({placeholders})', chunk
+            ):
+                found[doc_id] = json.loads(raw)
+        return [_view(found[doc_id], readonly) for doc_id in doc_ids if doc_id in found]
+
+    @metrics.timed_operation
+    def find_latest(self, query: Dict, order_by: str, before=None, limit: int = 20) -> List[Dict]:
+        """按 order_by 倒序分页查找：返回排序值小于 before 的前 limit 个文档"""
+        if not _FIELD_RE.match(order_by):
+            raise ValueError(f"Invalid order_by field: {order_by}")
+        where, params = _where(query)
+        if before is not None:
+            where += f"{' AND' if where else ' WHERE'} {_column(order_by)} < ?"
+            params.append(before)
+        sql = f'SELECT doc FROM "{self.name}"{where} ORDER BY {_column(order_by)} DESC, seq DESC'
+        result = []
+        for (raw,) in self.db.connect().execute(sql, params):
+            doc = json.loads(raw)
+            if matches_query(doc, query):
+                result.append(doc)
+                if len(result) >= limit:
+                    break
+        return result
+
+    @metrics.timed_operation
+    def insert_one(self, document: Dict) -> str:
+        """插入单个文档，违反唯一索引时抛出 DuplicateKeyError"""
+        doc = prepare_insert(document)
+        with self._write() as conn:
+            try:
+                conn.execute(
+                    f'INSERT INTO "{self.name}" (_id, doc) VALUES (?, ?)', (doc['_id'], _dumps(doc))
+                )
+            except sqlite3.IntegrityError as e:
+                raise _duplicate_error(self.name, e, doc) from e
+        return doc['_id']
+
+    @metrics.timed_operation
+    def find_one_and_update(self, query: Dict, update: Dict, expect: Optional[Dict] = None) -> Optional[Dict]:
+        """更新单个文档并返回更新后的文档；不满足 expect 时抛出 ConditionFailed"""
+        with self._write() as conn:
+            docs = self._select(conn, query, limit=1)
+            if not docs:
+                return None
+            check_expected(self.name, docs[0], expect)
+            new_doc = apply_update(docs[0], update, query)
+            try:
+                conn.execute(
+                    f'UPDATE "{self.name}" SET doc = ? WHERE _id = ?', (_dumps(new_doc), new_doc['_id'])
+                )
+            except sqlite3.IntegrityError as e:
+                raise _duplicate_error(self.name, e, new_doc) from e
+            return new_doc
+
+    @metrics.timed_operation
+    def update_one(self, query: Dict, update: Dict, expect: Optional[Dict] = None) -> bool:
+        """更新单个文档，违反唯一索引时抛出 DuplicateKeyError"""
+        return self.find_one_and_update(query, update, expect) is not None
+
+    @metrics.timed_operation
+    def delete_one(self, query: Dict) -> bool:
+        """删除单个文档"""
+        with self._write() as conn:
+            docs = self._select(conn, query, limit=1)
+            if docs:
+                conn.execute(f'DELETE FROM "{self.name}" WHERE _id = ?', (docs[0]['_id'],))
+            return bool(docs)
+
+    @metrics.timed_operation
+    def clear(self) -> int:
+        """删除集合中的所有文档，返回删除的数量"""
+        with self._write() as conn:
+            return conn.execute(f'DELETE FROM "{self.name}"').rowcount
+
+    @metrics.timed_operation
+    def count(self, query: Dict = None) -> int:
+        """统计文档数量"""
+        if not query:
+            return self.db.connect().execute(f'SELECT COUNT(*) FROM "{self.name}"').fetchone()[0]
+        return len(self._select(self.db.connect(), query))
+
+def import_documents(db: SQLiteDatabase, name: str, docs: List[Dict], indexes=()) -> int:
+    """把文档批量导入集合表（同 _id 覆盖），在一个事务中完成
+
+    先导入数据再建索引，历史数据中的重复值不会让导入失败。
+    """
+    db.ensure_table(name)
+    conn = db.connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            f'INSERT INTO "{name}" (_id, doc) VALUES (?, ?) '
+            f'ON CONFLICT(_id) DO UPDATE SET doc = excluded.doc',
+            ((doc['_id'], _dumps(doc)) for doc in docs)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    db.tables.discard(name)
+    db.ensure_table(name, indexes)
+    return len(docs)
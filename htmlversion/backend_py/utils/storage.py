@@ -1,180 +1,1266 @@
 """
 数据存储工具 - 使用 JSON 文件
+
+集合在 init_storage() 时一次性载入内存，读操作直接走内存；
+写操作只标记集合为脏，由后台线程按 STORAGE_FLUSH_INTERVAL 秒合并批量落盘。
+进程崩溃时最多丢失一个刷盘周期内的写入；设置为 0 则每次写入同步落盘。
+
+STORAGE_MODE=journal 时每次写入只向 data/<collection>.journal 追加一行，
+日志超过 STORAGE_COMPACT_THRESHOLD 条后由后台线程压缩进快照，
+启动时先读快照再重放日志。
+
+快照格式由 STORAGE_FORMAT（json / orjson / msgpack）和 STORAGE_COMPRESS=zstd 决定（见 utils/serializer.py），
+切换格式后启动时把旧格式的快照转换为新格式；日志始终是 JSON 行。
+
+STORAGE_BACKEND=sqlite 时改用单个 SQLite 文件（见 utils/sqlite_store.py），
+Collection 的查询和更新语法保持不变。
+
+跨集合的写入用 transaction() 包裹：先只改内存，提交时每个集合只落盘一次，
+要么全部生效，要么全部不生效。
+
+异步路由通过 get_async_collection() / storage_handler 使用存储：存储操作在专用的线程池
+（STORAGE_THREADS 个线程）中执行，不阻塞事件循环。
+内存中的文档不会被原地修改（写入总是生成新文档再替换），读取在集合读锁内取得文档后在锁外复制；
+只读取字段的调用方可以传 readonly=True，直接拿到内存文档的只读视图而不复制（见 utils/docview.py）；
+写入在文档锁内计算新文档，只在替换文档、更新索引和追加日志时短暂持有集合写锁，
+所以不同文档的读写互不阻塞，刷盘序列化快照时也不阻塞写入。
+依赖当前状态的修改用条件更新（expect= / find_one_and_update）一次完成，
+确实需要跨多次操作的"读-改-写"再用 document_lock() 包住整个过程。
+
+STORAGE_MULTIPROCESS=1 时允许多个进程（uvicorn --workers N）共用 data 目录：
+每个集合一把跨进程锁（data/<collection>.lock 上的 fcntl 排他锁），只在写入
+（重放其他进程的日志、检查、替换文档、追加日志）和重写快照时持有；读取前只检查日志是否变长，
+有变化才获取该集合的锁重放（此模式下强制使用 journal 模式）。文档锁也是跨进程的（data/locks/），
+所以不同集合、不同文档上的写入以及所有读取都可以在多个进程中并行。
 """
+import asyncio
+import contextvars
+import functools
 import json
 import os
+import atexit
 from pathlib import Path
-from typing import Dict, List, Any, Optional
-from datetime import datetime
+from typing import Callable, ContextManager, Dict, List, Any, Iterable, Iterator, Optional, Tuple
 import threading
+import time
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from utils import diagnostics, metrics
+from utils.docview import DocumentView
+from utils.index import DuplicateKeyError, Index
+from utils.journal import Journal, replay
+from utils.locks import FileLock, FileStripedLocks, RWLock, StripedLocks
+from utils.serializer import SUFFIXES, get_serializer, serializer_for
+from utils.query import (ConditionFailed, SortSpec, apply_update, check_expected, clone, generate_id, is_operator,
+                         matches_query, normalize_sort, prepare_insert, projector, sort_documents)
+from utils.sqlite_store import SQLiteCollection, SQLiteDatabase
+
+# 数据目录（可用 STORAGE_DATA_DIR 覆盖，例如基准测试使用临时目录）
+DATA_DIR = Path(os.environ.get("STORAGE_DATA_DIR") or Path(__file__).parent.parent / "data")
+DATA_DIR.mkdir(parents=True, exist_ok=True)
+
+# 存储后端：json（data/*.json 文件）或 sqlite（单个 SQLite 文件）
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+
+# 快照格式：json（带缩进，默认）/ orjson / msgpack；STORAGE_COMPRESS=zstd 时再压缩
+STORAGE_FORMAT = os.environ.get("STORAGE_FORMAT", "json")
+STORAGE_COMPRESS = os.environ.get("STORAGE_COMPRESS", "")
+ZSTD_LEVEL = int(os.environ.get("STORAGE_ZSTD_LEVEL", "3"))
+SERIALIZER = get_serializer(STORAGE_FORMAT, STORAGE_COMPRESS, ZSTD_LEVEL)
 
-# 数据目录
-DATA_DIR = Path(__file__).parent.parent / "data"
-DATA_DIR.mkdir(exist_ok=True)
+# 刷盘间隔（秒），即崩溃时最多丢失的写入窗口
+FLUSH_INTERVAL = float(os.environ.get("STORAGE_FLUSH_INTERVAL", "1.0"))
 
-# 线程锁，确保并发安全
-_locks = {}
+# 存储模式：snapshot（整文件重写）或 journal（追加日志 + 定期压缩）
+STORAGE_MODE = os.environ.get("STORAGE_MODE", "snapshot")
 
-def get_lock(collection: str):
-    """获取集合的线程锁"""
-    if collection not in _locks:
-        _locks[collection] = threading.Lock()
-    return _locks[collection]
+# journal 模式下日志累计多少条后压缩进快照
+COMPACT_THRESHOLD = int(os.environ.get("STORAGE_COMPACT_THRESHOLD", "1000"))
+
+# 多进程模式：多个进程共用 data 目录（仅 json 后端需要重放日志，sqlite 后端只加锁）
+MULTIPROCESS = os.environ.get("STORAGE_MULTIPROCESS", "0") == "1"
+if MULTIPROCESS and STORAGE_BACKEND == 'json':
+    STORAGE_MODE = 'journal'
+
+# 多进程模式下空闲时检查其他进程写入的间隔（秒），用于及时推送其他进程产生的变化
+POLL_INTERVAL = float(os.environ.get("STORAGE_POLL_INTERVAL", "0.05"))
+
+# 默认集合
+COLLECTIONS = ['players', 'rooms', 'matches', 'bp_records', 'player_stats', 'elo_history']
+
+# 集合名 -> 读写锁 / 文档锁
+_locks: Dict[str, RWLock] = {}
+_doc_locks: Dict[str, StripedLocks] = {}
+_locks_lock = threading.Lock()
+
+# 每个集合的文档锁条数
+LOCK_STRIPES = int(os.environ.get("STORAGE_LOCK_STRIPES", "64"))
+
+def get_lock(collection: str) -> RWLock:
+    """获取集合的读写锁：读取持有读锁，修改内存数据（文档、索引、日志）时短暂持有写锁"""
+    lock = _locks.get(collection)
+    if lock is None:
+        with _locks_lock:
+            lock = _locks.setdefault(collection, RWLock(metrics.lock_wait_observer(collection)))
+    return lock
+
+def document_lock(collection: str, doc_id: str) -> ContextManager:
+    """获取文档锁（可重入）
+
+    单次 update_one / delete_one 内部已经持有；路由中先读后写同一文档时在外层持有，
+    整个"读-改-写"就不会与同一文档上的其他写入交错：
+        with document_lock('rooms', room_id):
+            room = rooms.find_by_id(room_id)
+            rooms.update_one({"_id": room_id}, {"$set": ...})
+    获取顺序：先文档锁，再集合锁（事务）。多进程模式下是跨进程的文件锁。
+    """
+    locks = _doc_locks.get(collection)
+    if locks is None:
+        with _locks_lock:
+            locks = _doc_locks.get(collection)
+            if locks is None:
+                observer = metrics.lock_wait_observer(collection)
+                if MULTIPROCESS:
+                    # 多进程模式下文档锁也要跨进程（data/locks/<collection>.<stripe>.lock）
+                    locks = FileStripedLocks(DATA_DIR / "locks", collection, LOCK_STRIPES, observer)
+                else:
+                    locks = StripedLocks(LOCK_STRIPES, observer)
+                _doc_locks[collection] = locks
+    return locks.get(doc_id)
 
 def get_file_path(collection: str) -> Path:
-    """获取集合的文件路径"""
-    return DATA_DIR / f"{collection}.json"
+    """获取集合的快照路径（当前格式）"""
+    return DATA_DIR / f"{collection}{SERIALIZER.suffix}"
+
+def _find_snapshot(collection: str) -> Optional[Path]:
+    """集合现有的快照：优先当前格式，否则取最近写入的其他格式，都没有时返回 None"""
+    file_path = get_file_path(collection)
+    if file_path.exists():
+        return file_path
+    others = [p for p in (DATA_DIR / f"{collection}{suffix}" for suffix in SUFFIXES) if p.exists()]
+    return max(others, key=lambda p: p.stat().st_mtime) if others else None
+
+def get_sqlite_path() -> Path:
+    """获取 SQLite 数据库路径（可用 SQLITE_PATH 覆盖）"""
+    return Path(os.environ.get("SQLITE_PATH") or DATA_DIR / "cs2battle.db")
 
 def load_collection(collection: str) -> List[Dict]:
     """加载集合数据"""
-    file_path = get_file_path(collection)
-    if not file_path.exists():
+    file_path = _find_snapshot(collection)
+    if file_path is None:
         return []
-    
+
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        started = time.perf_counter()
+        payload = file_path.read_bytes()
+        docs = serializer_for(file_path).loads(payload)
+        metrics.observe_load(collection, 'snapshot', len(payload), time.perf_counter() - started)
+        return docs
     except Exception as e:
         print(f"Error loading {collection}: {e}")
         return []
 
+def _serialize(collection: str, docs: List[Dict]) -> bytes:
+    """按当前格式序列化快照"""
+    started = time.perf_counter()
+    payload = SERIALIZER.dumps(docs)
+    metrics.observe_serialize(collection, time.perf_counter() - started)
+    return payload
+
 def save_collection(collection: str, data: List[Dict]):
     """保存集合数据"""
-    file_path = get_file_path(collection)
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+        payload = _serialize(collection, data)
+        write_file_atomic(get_file_path(collection), payload)
+        metrics.observe_write(collection, 'snapshot', len(payload))
     except Exception as e:
         print(f"Error saving {collection}: {e}")
         raise
 
-def generate_id() -> str:
-    """生成唯一ID"""
-    from datetime import datetime
-    import random
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
-    random_suffix = ''.join([str(random.randint(0, 9)) for _ in range(6)])
-    return f"{timestamp}{random_suffix}"
+def _convert_snapshot(collection: str):
+    """当前格式的快照不存在时：把其他格式的快照转换过来，都没有则写入空集合"""
+    old_path = _find_snapshot(collection)
+    docs = serializer_for(old_path).loads(old_path.read_bytes()) if old_path else []
+    save_collection(collection, docs)
+    for suffix in SUFFIXES:
+        path = DATA_DIR / f"{collection}{suffix}"
+        if path != get_file_path(collection) and path.exists():
+            os.remove(path)
+    if old_path:
+        print(f"✓ Converted {old_path.name} -> {get_file_path(collection).name}")
+
+def write_file_atomic(file_path: Path, payload):
+    """先写临时文件并 fsync，再原子替换，避免崩溃时留下半截文件"""
+    os.replace(_write_temp(file_path, payload), file_path)
+
+def _write_temp(file_path: Path, payload) -> Path:
+    """把内容（str 或 bytes）写入 file_path 旁边的临时文件并 fsync，返回临时文件路径"""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    tmp_path = file_path.with_name(file_path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp_path
+
+# ==================== 内存数据 ====================
+
+# 集合上声明的二级索引（_id 总是有索引）
+INDEXES = {
+    'players': [Index(['nickname'], unique=True)],
+    'rooms': [Index(['status'], order_by='created_at')],
+    'matches': [Index(['room_id', 'status'])],
+    'bp_records': [Index(['room_id'])],
+    'player_stats': [Index(['player_id'], order_by='created_at'), Index(['match_id'])],
+    'elo_history': [Index(['player_id'])],
+}
+
+class _CollectionData:
+    """单个集合的内存数据：按 _id 存放的文档和二级索引"""
+
+    def __init__(self, name: str, docs: List[Dict]):
+        self.name = name
+        self.docs: Dict[str, Dict] = {}
+        # 文档的插入顺序，保证索引查询的结果顺序与全表扫描一致
+        self.seq: Dict[str, int] = {}
+        self.next_seq = 0
+        self.indexes: List[Index] = [idx.copy() for idx in INDEXES.get(name, [])]
+        # 每次修改递增；saved_version 为已写入快照的版本，避免旧快照覆盖新快照
+        self.version = 0
+        self.saved_version = 0
+        self.io_lock = threading.Lock()
+        # 多进程模式：已载入的快照文件（_file_signature）以及已重放到的日志偏移
+        self.snapshot_signature = None
+        self.journal_offset = 0
+        for doc in docs:
+            try:
+                self.insert(doc)
+            except DuplicateKeyError as e:
+                # 历史数据中已有的重复值照常载入，只拒绝之后的新写入
+                print(f"Warning: {e}")
+                self.insert(doc, check=False)
+        self.saved_version = self.version
+
+    def insert(self, doc: Dict, check: bool = True):
+        doc_id = doc['_id']
+        if doc_id in self.docs:
+            raise DuplicateKeyError(self.name, ('_id',), (doc_id,))
+        if check:
+            for index in self.indexes:
+                index.check(self.name, doc_id, doc)
+        self.docs[doc_id] = doc
+        self.version += 1
+        self.seq[doc_id] = self.next_seq
+        self.next_seq += 1
+        for index in self.indexes:
+            index.add(doc_id, doc)
+
+    def replace(self, doc_id: str, new_doc: Dict, check: bool = True):
+        old_doc = self.docs[doc_id]
+        changed = [index for index in self.indexes if index.changed(old_doc, new_doc)]
+        if check:
+            for index in changed:
+                index.check(self.name, doc_id, new_doc)
+        for index in changed:
+            index.remove(doc_id, old_doc)
+            index.add(doc_id, new_doc)
+        self.docs[doc_id] = new_doc
+        self.version += 1
+
+    def remove(self, doc_id: str):
+        doc = self.docs.pop(doc_id)
+        self.version += 1
+        del self.seq[doc_id]
+        for index in self.indexes:
+            index.remove(doc_id, doc)
+
+    def candidates(self, query: Optional[Dict]) -> Iterable[Dict]:
+        """返回可能匹配查询的文档：优先走 _id 和二级索引，否则全表扫描"""
+        if not query:
+            return self.docs.values()
+        if '_id' in query:
+            doc_id = query['_id']
+            if isinstance(doc_id, str):
+                doc = self.docs.get(doc_id)
+                return [doc] if doc is not None else []
+            if is_operator(doc_id) and set(doc_id) == {'$in'}:
+                return [self.docs[i] for i in dict.fromkeys(doc_id['$in']) if isinstance(i, str) and i in self.docs]
+            if not is_operator(doc_id):
+                return []
+
+        # 在所有可用的索引中选结果最少的一个
+        ids = None
+        for index in self.indexes:
+            if index.covers(query):
+                found = index.lookup(query)
+                if not found:
+                    return []
+                if ids is None or len(found) < len(ids):
+                    ids = found
+        if ids is None:
+            return self.docs.values()
+
+        if len(ids) > 1:
+            ids = sorted(ids, key=self.seq.__getitem__)
+        return [self.docs[doc_id] for doc_id in ids]
+
+    def select(self, query: Optional[Dict], sort: SortSpec = None, skip: int = 0,
+               limit: Optional[int] = None) -> List[Dict]:
+        """返回匹配查询的文档（内存中的文档本身，不能修改），按 sort 排序后跳过 skip 个、最多取 limit 个
+
+        按单个字段排序且有覆盖查询、以该字段为 order_by 的索引时按索引顺序读取，取够即停；
+        否则有 limit 时用堆取前 skip + limit 个；不排序时按插入顺序，取够即停。
+        """
+        sort = normalize_sort(sort)
+        stop = None if limit is None else skip + limit
+        matched = (item for item in self.candidates(query) if not query or matches_query(item, query))
+        if sort:
+            ordered = self._ordered(query or {}, sort)
+            if ordered is None:
+                return sort_documents(matched, sort, skip, limit)
+            matched = (item for item in ordered if not query or matches_query(item, query))
+        return list(islice(matched, skip, stop))
+
+    def _ordered(self, query: Dict, sort: List[Tuple[str, int]]) -> Optional[Iterator[Dict]]:
+        """能按索引顺序读取时返回按 sort 排好的候选文档"""
+        if len(sort) != 1:
+            return None
+        field, direction = sort[0]
+        for index in self.indexes:
+            if index.order_by == field and index.covers(query):
+                return (self.docs[doc_id] for doc_id in index.ordered(query, reverse=direction < 0))
+        return None
+
+    def latest(self, query: Dict, order_by: str, before: Any = None, limit: int = 20) -> List[Dict]:
+        """按 order_by 倒序返回匹配查询的前 limit 个文档，before 为游标（只返回排序值更小的）"""
+        for index in self.indexes:
+            if index.order_by == order_by and index.covers(query):
+                docs = (self.docs[doc_id] for doc_id in index.latest(query, before))
+                break
+        else:
+            docs = [
+                item for item in self.candidates(query)
+                if before is None or (item.get(order_by) is not None and item.get(order_by) < before)
+            ]
+            docs.sort(key=lambda item: (item.get(order_by) is not None, item.get(order_by)), reverse=True)
+        return list(islice((item for item in docs if matches_query(item, query)), limit))
+
+    def snapshot(self) -> List[Dict]:
+        return list(self.docs.values())
+
+    def save(self, payload: bytes, version: int, force: bool = False):
+        """写入 version 版本的快照（已有同样新或更新的快照落盘时跳过）"""
+        with self.io_lock:
+            if version <= self.saved_version and not force:
+                return
+            write_file_atomic(get_file_path(self.name), payload)
+            metrics.observe_write(self.name, 'snapshot', len(payload))
+            self.saved_version = max(self.saved_version, version)
+
+# 集合名 -> 内存数据
+_store: Dict[str, _CollectionData] = {}
+_store_lock = threading.Lock()
+
+# 集合名 -> 追加日志（仅 journal 模式）
+_journals: Dict[str, Journal] = {}
+
+def _get_data(collection: str) -> _CollectionData:
+    """获取集合的内存数据，首次访问时从磁盘载入"""
+    data = _store.get(collection)
+    if data is None:
+        with _store_lock:
+            data = _store.get(collection)
+            if data is None:
+                data = _load_data(collection)
+                _store[collection] = data
+    return data
+
+def _load_data(collection: str) -> _CollectionData:
+    """从快照和日志载入集合"""
+    signature = _file_signature(get_file_path(collection))
+    docs = load_collection(collection)
+    if STORAGE_MODE == 'journal':
+        old_journal = _journals.get(collection)
+        if old_journal is not None:
+            old_journal.close()
+        journal = Journal(DATA_DIR / f"{collection}.journal")
+        started = time.perf_counter()
+        docs = replay(docs, journal)
+        metrics.observe_load(collection, 'journal', _file_size(journal.rotated_path) + _file_size(journal.path),
+                             time.perf_counter() - started)
+        _journals[collection] = journal
+    data = _CollectionData(collection, docs)
+    data.snapshot_signature = signature
+    data.journal_offset = _file_size(DATA_DIR / f"{collection}.journal")
+    return data
+
+def _append_journal(collection: str, record: Dict):
+    """追加一条日志记录并记下偏移（调用方需持有集合锁）"""
+    journal = _journals[collection]
+    journal.append(record)
+    data = _store[collection]
+    offset = journal.file.tell()
+    metrics.observe_write(collection, 'journal', offset - data.journal_offset)
+    data.journal_offset = offset
+
+def _log_write(collection: str, record: Dict):
+    """journal 模式下记录一次写入（调用方需持有集合锁）"""
+    if STORAGE_MODE == 'journal':
+        _append_journal(collection, record)
+
+# ==================== 多进程 ====================
+
+# 集合名 -> 回调(doc_id, doc)，其他进程修改了文档时调用（doc 为 None 表示已删除）
+_change_listeners: Dict[str, List[Callable[[str, Optional[Dict]], None]]] = {}
+
+def add_change_listener(collection: str, callback: Callable[[str, Optional[Dict]], None]):
+    """注册其他进程修改文档时的回调（多进程模式）
+
+    回调在持有存储锁时调用，应当很快返回，且不能再访问存储。
+    """
+    _change_listeners.setdefault(collection, []).append(callback)
+
+def _notify(collection: str, doc_id: str, doc: Optional[Dict]):
+    for callback in _change_listeners.get(collection, ()):
+        try:
+            callback(doc_id, doc)
+        except Exception as e:
+            print(f"Error in change listener for {collection}: {e}")
+
+def _file_signature(path: Path) -> Optional[Tuple[int, int, int]]:
+    """文件的 (inode, 修改时间, 大小)，用于判断快照是否被其他进程重写"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+def _file_size(path: Path) -> int:
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return 0
+
+def _is_stale(name: str) -> bool:
+    """不加锁快速检查其他进程是否写入了该集合"""
+    data = _store.get(name)
+    if data is None:
+        return False
+    return (_file_signature(get_file_path(name)) != data.snapshot_signature or
+            _file_size(DATA_DIR / f"{name}.journal") != data.journal_offset)
+
+def _catch_up(name: str):
+    """重放其他进程对集合追加的日志；快照被重写（其他进程压缩了日志）时整个集合重新载入"""
+    data = _store.get(name)
+    if data is None:
+        return
+    journal_path = DATA_DIR / f"{name}.journal"
+    with get_lock(name).write():
+        data = _store[name]
+        size = _file_size(journal_path)
+        if _file_signature(get_file_path(name)) != data.snapshot_signature or size < data.journal_offset:
+            _reload(name, data)
+        elif size > data.journal_offset:
+            _replay_tail(name, data, journal_path)
+
+def _replay_tail(name: str, data: _CollectionData, journal_path: Path):
+    """从上次的偏移开始重放日志中新增的完整记录"""
+    started = time.perf_counter()
+    with open(journal_path, 'rb') as f:
+        f.seek(data.journal_offset)
+        chunk = f.read()
+    end = chunk.rfind(b"\n") + 1
+    records = [json.loads(line) for line in chunk[:end].splitlines() if line.strip()]
+    metrics.observe_load(name, 'journal', end, time.perf_counter() - started)
+    for record in records:
+        if record['op'] == 'put':
+            doc = record['doc']
+            if doc['_id'] in data.docs:
+                data.replace(doc['_id'], doc, check=False)
+            else:
+                data.insert(doc, check=False)
+            _notify(name, doc['_id'], doc)
+        elif record['_id'] in data.docs:
+            data.remove(record['_id'])
+            _notify(name, record['_id'], None)
+    data.journal_offset += end
+    _journals[name].records += len(records)
+
+def _reload(name: str, old: _CollectionData):
+    """重新载入集合，并通知发生变化的文档"""
+    data = _load_data(name)
+    # 版本接着旧数据递增，不能变小
+    data.version += old.version
+    data.saved_version = data.version
+    _store[name] = data
+    for doc_id in old.docs.keys() | data.docs.keys():
+        doc = data.docs.get(doc_id)
+        if old.docs.get(doc_id) != doc:
+            _notify(name, doc_id, doc)
+
+# 多进程模式下 json 后端需要跨进程的集合锁和日志重放
+_SHARED = MULTIPROCESS and STORAGE_BACKEND == 'json'
+
+# 集合名 -> 跨进程的集合锁（data/<collection>.lock）
+_collection_locks: Dict[str, FileLock] = {}
+# 当前线程持有的集合锁个数
+_held = threading.local()
+
+def _collection_lock(collection: str) -> FileLock:
+    lock = _collection_locks.get(collection)
+    if lock is None:
+        with _locks_lock:
+            lock = _collection_locks.get(collection)
+            if lock is None:
+                lock = FileLock(DATA_DIR / f"{collection}.lock", functools.partial(_catch_up, collection))
+                _collection_locks[collection] = lock
+    return lock
+
+@contextmanager
+def _shared(*collections: str) -> Iterator[None]:
+    """多进程模式下跨进程的集合锁（按名称顺序获取）；其他模式下什么都不做
+
+    获取时先重放其他进程对该集合追加的日志，写入在释放之前追加到日志。
+    只在"重放 + 检查 + 替换文档 + 追加日志"期间持有，路由的其余部分不持有，
+    不同集合的写入、以及所有读取都可以在多个进程中并行。
+    """
+    if not _SHARED:
+        yield
+        return
+    locks = [_collection_lock(name) for name in sorted(set(collections))]
+    acquired = []
+    _held.count = getattr(_held, 'count', 0) + 1
+    try:
+        for lock in locks:
+            lock.acquire()
+            acquired.append(lock)
+        yield
+    finally:
+        for lock in reversed(acquired):
+            lock.release()
+        _held.count -= 1
+
+def _refresh(collection: str):
+    """多进程模式下读取之前重放其他进程对该集合的写入（没有变化时只检查文件）"""
+    if not _SHARED or not _is_stale(collection):
+        return
+    lock = _collection_lock(collection)
+    # 已持有其他集合锁时不等待，避免与按其他顺序加锁的进程死锁；正在写入的进程释放锁后再读到它的写入
+    if lock.acquire(blocking=not getattr(_held, 'count', 0)):
+        lock.release()
+
+def sync_collection(collection: str):
+    """多进程模式下立即重放其他进程对集合的写入（变化回调随之触发），其他模式下什么都不做
+
+    依赖变化回调维护的内存索引（如匹配队列）在做决定之前调用。
+    """
+    _refresh(collection)
+
+# 名称 -> process_lock() 返回的锁（同一文件在进程内只能有一把，否则同进程的线程之间也会互相阻塞）
+_process_locks: Dict[str, FileLock] = {}
+
+def process_lock(name: str) -> Optional[FileLock]:
+    """多进程模式下名为 name 的跨进程锁（data/locks/<name>.lock，进程内可重入）；单进程时为 None"""
+    if not MULTIPROCESS:
+        return None
+    with _locks_lock:
+        lock = _process_locks.get(name)
+        if lock is None:
+            (DATA_DIR / "locks").mkdir(parents=True, exist_ok=True)
+            lock = _process_locks[name] = FileLock(DATA_DIR / "locks" / f"{name}.lock")
+    return lock
+
+def _copier(readonly: bool) -> Callable[[Dict], Dict]:
+    """读取结果的复制方式：逐层复制，或者只读视图（存储中的文档写时复制，视图不会看到之后的修改）"""
+    return DocumentView if readonly else clone
+
+def _synchronized(method):
+    """多进程模式下先重放其他进程对该集合的写入"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        _refresh(self.name)
+        return method(self, *args, **kwargs)
+    return wrapper
+
+class _Tailer:
+    """多进程模式下的后台线程：空闲时也及时重放其他进程的写入，触发变化回调"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None and MULTIPROCESS and STORAGE_BACKEND == 'json':
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, name="storage-tailer", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                for name in list(_store):
+                    if _is_stale(name):
+                        with _shared(name):
+                            pass
+            except Exception as e:
+                print(f"Error catching up with other processes: {e}")
+
+_tailer = _Tailer(POLL_INTERVAL)
+
+class _Flusher:
+    """后台刷盘线程 - 合并同一周期内的多次写入，只落盘一次"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.dirty = set()
+        self.cond = threading.Condition()
+        self.thread = None
+        self.stopped = False
+        # 写快照（含日志轮转）同一时间只有一个线程在做
+        self.snapshot_lock = threading.Lock()
+
+    def start(self):
+        if self.thread is None and self.interval > 0:
+            self.thread = threading.Thread(target=self._run, name="storage-flusher", daemon=True)
+            self.thread.start()
+
+    def mark_dirty(self, collection: str):
+        """标记集合为脏；同步模式下立即落盘"""
+        if self.interval <= 0 or self.thread is None:
+            self.flush_one(collection)
+            return
+        with self.cond:
+            self.dirty.add(collection)
+
+    def flush_one(self, collection: str, compact: bool = False):
+        """把单个集合的当前内存状态写入磁盘
+
+        journal 模式下只 fsync 日志，日志足够长（或 compact=True）时才重写快照。
+        """
+        journal = _journals.get(collection)
+        if journal is not None and not compact and journal.records < COMPACT_THRESHOLD:
+            # fsync 与追加可以并发，不需要持有集合锁；同时刷盘的线程共用一次 fsync
+            journal.sync()
+            return
+        # 多进程模式下重写快照期间其他进程不能追加这个集合的日志
+        with _shared(collection), self.snapshot_lock:
+            self._write_snapshot(collection, compact)
+
+    def _write_snapshot(self, collection: str, compact: bool):
+        journal = _journals.get(collection)
+        # 读锁挡住写入，保证快照与日志轮转一致；文档不会被原地修改，序列化可以放到锁外
+        with get_lock(collection).read():
+            data = _store.get(collection)
+            if data is None:
+                return
+            if journal is not None:
+                if compact and journal.records == 0 and not journal.rotated_path.exists():
+                    return
+                journal.rotate()
+            docs = data.snapshot()
+            version = data.version
+        try:
+            payload = _serialize(collection, docs)
+            # journal 模式下日志已轮转，即使版本未变也必须写快照
+            data.save(payload, version, force=journal is not None)
+            if journal is not None:
+                journal.discard_rotated()
+                data.snapshot_signature = _file_signature(get_file_path(collection))
+                data.journal_offset = 0
+        except Exception as e:
+            print(f"Error saving {collection}: {e}")
+            with self.cond:
+                self.dirty.add(collection)
+
+    def flush(self):
+        """立即写出所有脏集合"""
+        with self.cond:
+            pending = self.dirty
+            self.dirty = set()
+        for collection in pending:
+            self.flush_one(collection)
+
+    def compact(self):
+        """把所有 journal 压缩进快照"""
+        with self.cond:
+            self.dirty.difference_update(_journals)
+        for collection in list(_journals):
+            self.flush_one(collection, compact=True)
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+        self.compact()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait(self.interval)
+                if self.stopped:
+                    return
+            self.flush()
+
+_flusher = _Flusher(FLUSH_INTERVAL)
+
+# SQLite 数据库（仅 sqlite 后端）
+_sqlite_db: Optional[SQLiteDatabase] = None
+
+def _get_sqlite() -> SQLiteDatabase:
+    global _sqlite_db
+    if _sqlite_db is None:
+        with _store_lock:
+            if _sqlite_db is None:
+                _sqlite_db = SQLiteDatabase(get_sqlite_path())
+    return _sqlite_db
+
+def shutdown_storage():
+    """停止后台刷盘线程并写出剩余数据"""
+    _shutdown_executor()
+    _tailer.stop()
+    _flusher.stop()
+    for journal in _journals.values():
+        journal.close()
+    if _sqlite_db is not None:
+        _sqlite_db.close()
+
+atexit.register(shutdown_storage)
 
 class Collection:
     """集合操作类"""
-    
+
     def __init__(self, name: str):
         self.name = name
         self.lock = get_lock(name)
-    
-    def find_one(self, query: Dict) -> Optional[Dict]:
-        """查找单个文档"""
-        with self.lock:
-            data = load_collection(self.name)
-            for item in data:
-                match = all(item.get(k) == v for k, v in query.items())
-                if match:
-                    return item.copy()
+
+    def __len__(self) -> int:
+        """集合中的文档数"""
+        return len(_get_data(self.name).docs)
+
+    @property
+    def version(self) -> int:
+        """集合的修改版本（只增不减，本进程内有效）：读到 v 之前完成的写入，之后的读取一定能看到"""
+        return _get_data(self.name).version
+
+    def _first(self, query: Dict) -> Optional[Dict]:
+        """读锁内找到第一个匹配的文档（返回内存中的文档本身，不能修改）"""
+        with self.lock.read():
+            for item in _get_data(self.name).candidates(query):
+                if matches_query(item, query):
+                    return item
             return None
-    
-    def find(self, query: Dict = None) -> List[Dict]:
+
+    @metrics.timed_operation
+    @_synchronized
+    def find_one(self, query: Dict, readonly: bool = False) -> Optional[Dict]:
+        """查找单个文档；readonly 时返回不复制的只读视图（utils.docview），下同"""
+        item = self._first(query)
+        return _copier(readonly)(item) if item is not None else None
+
+    @metrics.timed_operation
+    @_synchronized
+    def find(self, query: Dict = None, sort: SortSpec = None, limit: Optional[int] = None, skip: int = 0,
+             projection=None, readonly: bool = False) -> List[Dict]:
+        """查找多个文档，可排序、分页（skip / limit）和只取部分字段（projection），语法见 utils.query"""
+        copy = projector(projection, readonly)
+        with self.lock.read():
+            items = _get_data(self.name).select(query, sort, skip, limit)
+        return [copy(item) for item in items]
+
+    @metrics.timed_operation
+    @_synchronized
+    def find_by_id(self, doc_id: str, readonly: bool = False) -> Optional[Dict]:
+        """根据ID查找文档"""
+        with self.lock.read():
+            doc = _get_data(self.name).docs.get(doc_id)
+        return _copier(readonly)(doc) if doc is not None else None
+
+    @metrics.timed_operation
+    @_synchronized
+    def find_by_ids(self, doc_ids: Iterable[str], readonly: bool = False) -> List[Dict]:
+        """根据一组ID批量查找文档（不存在的ID忽略，结果按传入顺序）"""
+        copy = _copier(readonly)
+        with self.lock.read():
+            docs = _get_data(self.name).docs
+            items = [docs[doc_id] for doc_id in dict.fromkeys(doc_ids) if doc_id in docs]
+        return [copy(item) for item in items]
+
+    @metrics.timed_operation
+    @_synchronized
+    def find_latest(self, query: Dict, order_by: str, before: Any = None, limit: int = 20) -> List[Dict]:
+        """按 order_by 倒序分页查找：返回排序值小于 before 的前 limit 个文档
+
+        有 order_by 相同且覆盖查询字段的索引时只读取需要的文档，否则扫描后排序。
+        """
+        with self.lock.read():
+            items = _get_data(self.name).latest(query, order_by, before, limit)
+        return [clone(item) for item in items]
+
+    @metrics.timed_operation
+    @_synchronized
+    def insert_one(self, document: Dict) -> str:
+        """插入单个文档，违反唯一索引时抛出 DuplicateKeyError"""
+        doc = prepare_insert(document)
+        with _shared(self.name), self.lock.write():
+            _get_data(self.name).insert(doc)
+            _log_write(self.name, {"op": "put", "doc": doc})
+        _flusher.mark_dirty(self.name)
+        return doc['_id']
+
+    def _update(self, query: Dict, update: Dict, expect: Optional[Dict]) -> Optional[Dict]:
+        """原子地更新第一个匹配的文档，返回新文档（内存中的文档本身）
+
+        在文档锁内检查条件、计算新文档，写锁内确认文档没有被其他写入替换后再换上新文档，否则重试。
+        多进程模式下文档锁跨进程，拿到文档锁后先重放其他进程的写入，换上新文档时持有集合锁。
+        """
+        while True:
+            item = self._first(query)
+            if item is None:
+                return None
+            with document_lock(self.name, item['_id']):
+                _refresh(self.name)
+                if expect:
+                    # 条件要在最新的文档上检查
+                    with self.lock.read():
+                        if _get_data(self.name).docs.get(item['_id']) is not item:
+                            continue
+                    check_expected(self.name, item, expect)
+                new_doc = apply_update(item, update, query)
+                with _shared(self.name), self.lock.write():
+                    data = _get_data(self.name)
+                    if data.docs.get(item['_id']) is not item:
+                        continue
+                    data.replace(item['_id'], new_doc)
+                    _log_write(self.name, {"op": "put", "doc": new_doc})
+            break
+
+        _flusher.mark_dirty(self.name)
+        return new_doc
+
+    @metrics.timed_operation
+    @_synchronized
+    def update_one(self, query: Dict, update: Dict, expect: Optional[Dict] = None) -> bool:
+        """更新单个文档，违反唯一索引时抛出 DuplicateKeyError
+
+        expect 为更新条件：文档存在但不满足时不更新，抛出 ConditionFailed（带文档的当前状态）。
+        """
+        return self._update(query, update, expect) is not None
+
+    @metrics.timed_operation
+    @_synchronized
+    def find_one_and_update(self, query: Dict, update: Dict, expect: Optional[Dict] = None) -> Optional[Dict]:
+        """更新单个文档并返回更新后的文档，没有匹配的文档时返回 None（expect 同 update_one）"""
+        new_doc = self._update(query, update, expect)
+        return clone(new_doc) if new_doc is not None else None
+
+    @metrics.timed_operation
+    @_synchronized
+    def delete_one(self, query: Dict) -> bool:
+        """删除单个文档"""
+        while True:
+            item = self._first(query)
+            if item is None:
+                return False
+            with document_lock(self.name, item['_id']), _shared(self.name), self.lock.write():
+                data = _get_data(self.name)
+                if data.docs.get(item['_id']) is not item:
+                    continue
+                data.remove(item['_id'])
+                _log_write(self.name, {"op": "del", "_id": item['_id']})
+            break
+
+        _flusher.mark_dirty(self.name)
+        return True
+
+    @metrics.timed_operation
+    @_synchronized
+    def count(self, query: Dict = None) -> int:
+        """统计文档数量"""
+        with self.lock.read():
+            data = _get_data(self.name)
+            if not query:
+                return len(data.docs)
+            return sum(1 for item in data.candidates(query) if matches_query(item, query))
+
+# ==================== 事务 ====================
+
+def _pending_path(names: Iterable[str]) -> Path:
+    """提交中的事务记录：存在即表示有事务已决定提交但尚未全部落盘
+
+    按涉及的集合命名，多进程模式下集合不相交的事务可以同时提交。
+    """
+    return DATA_DIR / f"transaction.{'+'.join(sorted(names))}.pending"
+
+class _TxCollection:
+    """事务内的集合视图
+
+    事务持有集合锁，其他请求看不到中间状态，所以写入直接作用于内存数据（可使用索引），
+    同时记录每个文档第一次被修改前的状态；提交时只落盘这些文档，回滚时据此恢复。
+    """
+
+    def __init__(self, name: str, data: _CollectionData):
+        self.name = name
+        self.data = data
+        # _id -> 事务开始前的文档（None 表示原本不存在）
+        self.original: Dict[str, Optional[Dict]] = {}
+
+    def _remember(self, doc_id: str):
+        if doc_id not in self.original:
+            self.original[doc_id] = self.data.docs.get(doc_id)
+
+    def changes(self) -> Dict[str, Optional[Dict]]:
+        """本事务修改过的文档的当前状态（None 表示已删除）"""
+        return {doc_id: self.data.docs.get(doc_id) for doc_id in self.original}
+
+    def rollback(self):
+        for doc_id, old in reversed(list(self.original.items())):
+            if old is None:
+                if doc_id in self.data.docs:
+                    self.data.remove(doc_id)
+            elif doc_id in self.data.docs:
+                self.data.replace(doc_id, old, check=False)
+            else:
+                self.data.insert(old, check=False)
+        self.original = {}
+
+    def find_one(self, query: Dict, readonly: bool = False) -> Optional[Dict]:
+        """查找单个文档"""
+        for item in self.data.candidates(query):
+            if matches_query(item, query):
+                return _copier(readonly)(item)
+        return None
+
+    def find(self, query: Dict = None, sort: SortSpec = None, limit: Optional[int] = None, skip: int = 0,
+             projection=None, readonly: bool = False) -> List[Dict]:
         """查找多个文档"""
-        with self.lock:
-            data = load_collection(self.name)
-            if query is None:
-                return [item.copy() for item in data]
-            
-            result = []
-            for item in data:
-                match = all(item.get(k) == v for k, v in query.items())
-                if match:
-                    result.append(item.copy())
-            return result
-    
-    def find_by_id(self, doc_id: str) -> Optional[Dict]:
+        copy = projector(projection, readonly)
+        return [copy(item) for item in self.data.select(query, sort, skip, limit)]
+
+    def find_by_id(self, doc_id: str, readonly: bool = False) -> Optional[Dict]:
         """根据ID查找文档"""
-        return self.find_one({"_id": doc_id})
-    
+        doc = self.data.docs.get(doc_id)
+        return _copier(readonly)(doc) if doc is not None else None
+
+    def find_by_ids(self, doc_ids: Iterable[str], readonly: bool = False) -> List[Dict]:
+        """根据一组ID批量查找文档"""
+        docs = self.data.docs
+        copy = _copier(readonly)
+        return [copy(docs[doc_id]) for doc_id in dict.fromkeys(doc_ids) if doc_id in docs]
+
+    def find_latest(self, query: Dict, order_by: str, before: Any = None, limit: int = 20) -> List[Dict]:
+        """按 order_by 倒序分页查找"""
+        return [clone(item) for item in self.data.latest(query, order_by, before, limit)]
+
     def insert_one(self, document: Dict) -> str:
-        """插入单个文档"""
-        with self.lock:
-            data = load_collection(self.name)
-            doc = document.copy()
-            
-            # 生成ID
-            if '_id' not in doc:
-                doc['_id'] = generate_id()
-            
-            # 添加时间戳
-            if 'created_at' not in doc:
-                doc['created_at'] = datetime.now().isoformat()
-            
-            data.append(doc)
-            save_collection(self.name, data)
-            return doc['_id']
-    
-    def update_one(self, query: Dict, update: Dict) -> bool:
-        """更新单个文档"""
-        with self.lock:
-            data = load_collection(self.name)
-            updated = False
-            
-            for i, item in enumerate(data):
-                match = all(item.get(k) == v for k, v in query.items())
-                if match:
-                    # 处理 $set 操作
-                    if '$set' in update:
-                        for k, v in update['$set'].items():
-                            data[i][k] = v
-                    
-                    # 处理 $inc 操作
-                    if '$inc' in update:
-                        for k, v in update['$inc'].items():
-                            data[i][k] = data[i].get(k, 0) + v
-                    
-                    # 处理 $push 操作
-                    if '$push' in update:
-                        for k, v in update['$push'].items():
-                            if k not in data[i]:
-                                data[i][k] = []
-                            data[i][k].append(v)
-                    
-                    # 更新时间
-                    data[i]['updated_at'] = datetime.now().isoformat()
-                    updated = True
-                    break
-            
-            if updated:
-                save_collection(self.name, data)
-            return updated
-    
+        """插入单个文档，违反唯一索引时抛出 DuplicateKeyError"""
+        doc = prepare_insert(document)
+        if doc['_id'] in self.data.docs:
+            raise DuplicateKeyError(self.name, ('_id',), (doc['_id'],))
+        self._remember(doc['_id'])
+        self.data.insert(doc)
+        return doc['_id']
+
+    def _update(self, query: Dict, update: Dict, expect: Optional[Dict]) -> Optional[Dict]:
+        for item in self.data.candidates(query):
+            if matches_query(item, query):
+                check_expected(self.name, item, expect)
+                new_doc = apply_update(item, update, query)
+                self._remember(item['_id'])
+                self.data.replace(item['_id'], new_doc)
+                return new_doc
+        return None
+
+    def update_one(self, query: Dict, update: Dict, expect: Optional[Dict] = None) -> bool:
+        """更新单个文档，违反唯一索引时抛出 DuplicateKeyError，不满足 expect 时抛出 ConditionFailed"""
+        return self._update(query, update, expect) is not None
+
+    def find_one_and_update(self, query: Dict, update: Dict, expect: Optional[Dict] = None) -> Optional[Dict]:
+        """更新单个文档并返回更新后的文档"""
+        new_doc = self._update(query, update, expect)
+        return clone(new_doc) if new_doc is not None else None
+
     def delete_one(self, query: Dict) -> bool:
         """删除单个文档"""
-        with self.lock:
-            data = load_collection(self.name)
-            original_len = len(data)
-            
-            data = [item for item in data if not all(item.get(k) == v for k, v in query.items())]
-            
-            if len(data) < original_len:
-                save_collection(self.name, data)
+        for item in self.data.candidates(query):
+            if matches_query(item, query):
+                self._remember(item['_id'])
+                self.data.remove(item['_id'])
                 return True
-            return False
-    
+        return False
+
+    def clear(self) -> int:
+        """删除集合中的所有文档，返回删除的数量"""
+        doc_ids = list(self.data.docs)
+        for doc_id in doc_ids:
+            self._remember(doc_id)
+            self.data.remove(doc_id)
+        return len(doc_ids)
+
     def count(self, query: Dict = None) -> int:
         """统计文档数量"""
-        return len(self.find(query or {}))
+        if not query:
+            return len(self.data.docs)
+        return sum(1 for item in self.data.candidates(query) if matches_query(item, query))
+
+class Transaction:
+    """transaction() 返回的事务对象，tx['players'] 获取事务内的集合"""
+
+    def __init__(self, collections: Dict[str, Any]):
+        self.collections = collections
+
+    def __getitem__(self, name: str):
+        if name not in self.collections:
+            raise KeyError(f"Collection '{name}' was not declared in transaction()")
+        return self.collections[name]
+
+def _persist_transaction(touched: List[_TxCollection]):
+    """事务落盘：先写好所有数据和提交记录，再逐个生效
+
+    snapshot 模式：每个集合写一个 fsync 过的临时文件，提交记录列出待替换的文件；
+    journal 模式：提交记录包含所有日志记录，写入后再追加到各集合的日志。
+    提交记录写入之前崩溃则事务不生效，之后崩溃则启动时由 _recover_transaction() 补完。
+    """
+    pending_path = _pending_path(col.name for col in touched)
+    if STORAGE_MODE == 'journal':
+        records = {
+            col.name: [
+                {"op": "put", "doc": doc} if doc is not None else {"op": "del", "_id": doc_id}
+                for doc_id, doc in col.changes().items()
+            ]
+            for col in touched
+        }
+        write_file_atomic(pending_path, json.dumps({"journal": records}, ensure_ascii=False, default=str))
+        for name, entries in records.items():
+            for record in entries:
+                _append_journal(name, record)
+            _journals[name].sync()
+    else:
+        io_locks = [col.data.io_lock for col in touched]
+        for lock in io_locks:
+            lock.acquire()
+        try:
+            renames = []
+            for col in touched:
+                payload = _serialize(col.name, col.data.snapshot())
+                target = get_file_path(col.name)
+                renames.append([_write_temp(target, payload).name, target.name])
+                metrics.observe_write(col.name, 'snapshot', len(payload))
+            write_file_atomic(pending_path, json.dumps({"renames": renames}))
+            for tmp_name, target_name in renames:
+                os.replace(DATA_DIR / tmp_name, DATA_DIR / target_name)
+            for col in touched:
+                col.data.saved_version = col.data.version
+        finally:
+            for lock in reversed(io_locks):
+                lock.release()
+    os.remove(pending_path)
+
+def _recover_transaction():
+    """启动时补完上次崩溃前已提交但未全部落盘的事务"""
+    for path in sorted(DATA_DIR.glob("transaction.*pending")):
+        stem = path.name[len("transaction."):-len(".pending")]
+        names = stem.split('+') if stem else ()
+        # 多进程模式下其他进程可能正在启动或写入这些集合
+        with _shared(*names):
+            if path.exists():
+                _recover_pending(path)
+
+def _recover_pending(path: Path):
+    with open(path, 'r', encoding='utf-8') as f:
+        pending = json.load(f)
+    for tmp_name, target_name in pending.get("renames", []):
+        if (DATA_DIR / tmp_name).exists():
+            os.replace(DATA_DIR / tmp_name, DATA_DIR / target_name)
+    for name, entries in pending.get("journal", {}).items():
+        journal = Journal(DATA_DIR / f"{name}.journal")
+        for record in entries:
+            journal.append(record)
+        journal.close()
+    os.remove(path)
+    print("✓ Recovered an interrupted transaction")
+
+@contextmanager
+def transaction(*names: str) -> Iterator[Transaction]:
+    """多集合原子事务
+
+    用法：
+        with transaction('matches', 'players') as tx:
+            tx['players'].update_one(...)
+            tx['matches'].insert_one(...)
+
+    进入时按固定顺序获取涉及集合的写锁，事务内的写入只作用于内存；
+    正常退出时一次性落盘（每个集合一次写入），抛出异常则全部撤销。
+    事务内不要再通过 get_collection() 访问同一集合（锁不可重入）；
+    需要文档锁时在进入事务之前获取。
+    """
+    if STORAGE_BACKEND == 'sqlite':
+        with _get_sqlite().transaction(names, INDEXES) as collections:
+            yield Transaction(collections)
+    else:
+        # 多进程模式下先按顺序获取这些集合的跨进程锁（同时重放其他进程的写入）
+        with _shared(*names), _local_transaction(names) as tx:
+            yield tx
+
+@contextmanager
+def _local_transaction(names) -> Iterator[Transaction]:
+    names = sorted(set(names))
+    locks = [get_lock(name) for name in names]
+    for lock in locks:
+        lock.acquire_write()
+    try:
+        collections = {name: _TxCollection(name, _get_data(name)) for name in names}
+        try:
+            yield Transaction(collections)
+            touched = [col for col in collections.values() if col.original]
+            if touched:
+                _persist_transaction(touched)
+        except BaseException:
+            for col in collections.values():
+                col.rollback()
+            raise
+    finally:
+        for lock in reversed(locks):
+            lock.release_write()
 
 def get_collection(name: str) -> Collection:
     """获取集合"""
+    if STORAGE_BACKEND == 'sqlite':
+        return SQLiteCollection(name, _get_sqlite(), INDEXES.get(name, ()))
     return Collection(name)
 
+# ==================== 异步接口 ====================
+
+# 存储线程池：磁盘 I/O 和锁等待不阻塞事件循环，不同文档上的请求可以并行；
+# 同一文档上的"读-改-写"由 document_lock() 串行化
+STORAGE_THREADS = int(os.environ.get("STORAGE_THREADS", "4"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=STORAGE_THREADS, thread_name_prefix='storage')
+        return _executor
+
+def _shutdown_executor():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+async def run_storage(func, *args, **kwargs):
+    """在存储线程中执行 func(*args, **kwargs) 并等待结果"""
+    loop = asyncio.get_running_loop()
+    if diagnostics.ENABLED:
+        # 把请求上下文带到存储线程，慢操作日志据此找到所属路由
+        call = functools.partial(contextvars.copy_context().run, diagnostics.track_thread,
+                                 functools.partial(func, *args, **kwargs))
+    else:
+        call = functools.partial(func, *args, **kwargs)
+    return await loop.run_in_executor(_get_executor(), call)
+
+def storage_handler(func):
+    """把同步的路由函数整体放到存储线程执行
+
+    用于先读后写的接口，写入用条件更新保证基于的状态没有被其他请求改变：
+        @router.post("/ready")
+        @storage_handler
+        def set_ready(req):
+            room = rooms.find_one_and_update(
+                {"_id": req.room_id, "players.player_id": req.player_id},
+                {"$set": {"players.$.ready": req.ready}})
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_storage(func, *args, **kwargs)
+    return wrapper
+
+class AsyncCollection:
+    """Collection 的异步版本：每个操作在存储线程中执行"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_one(self, query: Dict, readonly: bool = False) -> Optional[Dict]:
+        return await run_storage(self.collection.find_one, query, readonly)
+
+    async def find(self, query: Dict = None, sort: SortSpec = None, limit: Optional[int] = None, skip: int = 0,
+                   projection=None, readonly: bool = False) -> List[Dict]:
+        return await run_storage(self.collection.find, query, sort, limit, skip, projection, readonly)
+
+    async def find_by_id(self, doc_id: str, readonly: bool = False) -> Optional[Dict]:
+        return await run_storage(self.collection.find_by_id, doc_id, readonly)
+
+    async def find_by_ids(self, doc_ids: Iterable[str], readonly: bool = False) -> List[Dict]:
+        return await run_storage(self.collection.find_by_ids, list(doc_ids), readonly)
+
+    async def find_latest(self, query: Dict, order_by: str, before: Any = None, limit: int = 20) -> List[Dict]:
+        return await run_storage(self.collection.find_latest, query, order_by, before, limit)
+
+    async def insert_one(self, document: Dict) -> str:
+        return await run_storage(self.collection.insert_one, document)
+
+    async def update_one(self, query: Dict, update: Dict, expect: Optional[Dict] = None) -> bool:
+        return await run_storage(self.collection.update_one, query, update, expect)
+
+    async def find_one_and_update(self, query: Dict, update: Dict, expect: Optional[Dict] = None) -> Optional[Dict]:
+        return await run_storage(self.collection.find_one_and_update, query, update, expect)
+
+    async def delete_one(self, query: Dict) -> bool:
+        return await run_storage(self.collection.delete_one, query)
+
+    async def count(self, query: Dict = None) -> int:
+        return await run_storage(self.collection.count, query)
+
+def get_async_collection(name: str) -> AsyncCollection:
+    """获取集合的异步接口（在 async 路由中使用）"""
+    return AsyncCollection(get_collection(name))
+
 def init_storage():
     """初始化存储"""
-    DATA_DIR.mkdir(exist_ok=True)
-    
-    # 创建空集合文件（如果不存在）
-    collections = ['players', 'rooms', 'matches', 'bp_records', 'player_stats', 'elo_history']
-    for col in collections:
-        file_path = get_file_path(col)
-        if not file_path.exists():
-            save_collection(col, [])
-    
-    print(f"✓ Data storage initialized: {DATA_DIR}")
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    if MULTIPROCESS and fcntl is None:
+        raise RuntimeError("STORAGE_MULTIPROCESS requires fcntl (not available on this platform)")
+
+    if STORAGE_BACKEND == 'sqlite':
+        for col in COLLECTIONS:
+            get_collection(col)
+        print(f"✓ Data storage initialized: {get_sqlite_path()} (backend: sqlite)")
+        return
+
+    _recover_transaction()
+
+    # 创建空集合文件或转换旧格式的快照（如果当前格式的文件不存在），并把所有集合载入内存；
+    # 多进程模式下持有集合锁，不会读到其他进程压缩到一半的快照和日志
+    for col in COLLECTIONS:
+        with _shared(col):
+            if not get_file_path(col).exists():
+                _convert_snapshot(col)
+            _get_data(col)
 
+    _flusher.start()
+    _tailer.start()
+    print(f"✓ Data storage initialized: {DATA_DIR} (mode: {STORAGE_MODE}, format: {SERIALIZER.name}, flush interval: {FLUSH_INTERVAL}s"
+          f"{', multiprocess' if MULTIPROCESS else ''})")
@@ -70,10 +70,13 @@ class API {
   
   // 匹配相关
   static match = {
-    start: async (room_id) => {
+    // 默认由后端选择分队策略（auto）；传入车队 parties（每组 player_id 分在同一队）
+    // 或 constrained = true 时才使用带约束的分队
+    start: async (room_id, parties = [], constrained = parties.length > 0) => {
+      const body = constrained ? { room_id, strategy: 'constrained', parties } : { room_id };
       return await API.request('/api/match/start', {
         method: 'POST',
-        body: JSON.stringify({ room_id })
+        body: JSON.stringify(body)
       });
     }
   }
@@ -122,8 +125,11 @@ class API {
   
   // 历史记录相关
   static history = {
-    getPlayer: async (player_id) => {
-      return await API.request(`/api/history/player/${player_id}`);
+    // before 传入上一页最后一条记录的 created_at，获取更早的战绩
+    getPlayer: async (player_id, before = null, limit = 20) => {
+      const params = new URLSearchParams({ limit });
+      if (before) params.set('before', before);
+      return await API.request(`/api/history/player/${player_id}?${params}`);
     },
     
     getRanking: async () => {
@@ -134,5 +140,107 @@ class API {
       return await API.request(`/api/history/player-info/${player_id}`);
     }
   }
+  
+  // 实时推送：onState 收到合并后的完整状态，onDeleted 在房间被删除时调用；返回值的 close() 取消订阅
+  static live = {
+    room: (room_id, onState, onDeleted = null) => {
+      return new LiveChannel(`/api/live/room/${room_id}`, onState, onDeleted);
+    },
+    
+    bp: (bp_id, onState) => {
+      return new LiveChannel(`/api/live/bp/${bp_id}`, onState);
+    }
+  }
+}
+
+// 订阅一个推送频道：优先 WebSocket，连不上时降级为 SSE，断线后自动重连
+class LiveChannel {
+  constructor(path, onState, onDeleted = null) {
+    this.path = path;
+    this.onState = onState;
+    this.onDeleted = onDeleted;
+    this.state = null;
+    this.conn = null;
+    this.closed = false;
+    this.useSSE = !('WebSocket' in window);
+    this.failures = 0;
+    this.retryTimer = null;
+    this.connect();
+  }
+  
+  connect() {
+    if (this.closed) return;
+    if (this.useSSE) {
+      this.connectSSE();
+    } else {
+      this.connectWebSocket();
+    }
+  }
+  
+  connectWebSocket() {
+    const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const ws = new WebSocket(`${protocol}//${location.host}${BASE_URL}${this.path}`);
+    let opened = false;
+    ws.onopen = () => {
+      opened = true;
+      this.failures = 0;
+    };
+    ws.onmessage = (event) => this.handle(JSON.parse(event.data));
+    ws.onclose = () => {
+      // 从未连上（代理不支持 WebSocket 等）时改用 SSE
+      if (!opened) this.useSSE = true;
+      this.reconnect();
+    };
+    this.conn = ws;
+  }
+  
+  connectSSE() {
+    const source = new EventSource(BASE_URL + this.path);
+    source.onopen = () => {
+      this.failures = 0;
+    };
+    source.onmessage = (event) => this.handle(JSON.parse(event.data));
+    source.onerror = () => {
+      source.close();
+      this.reconnect();
+    };
+    this.conn = source;
+  }
+  
+  handle(message) {
+    if (message.type === 'snapshot') {
+      this.state = message.data;
+    } else if (message.type === 'delta') {
+      if (!this.state) return;
+      // 并发写入的增量可能乱序到达，丢弃比当前状态旧的
+      const at = message.data.updated_at;
+      if (at && this.state.updated_at && at < this.state.updated_at) return;
+      this.state = { ...this.state, ...message.data };
+    } else if (message.type === 'deleted') {
+      this.close();
+      if (this.onDeleted) this.onDeleted();
+      return;
+    } else {
+      // resync：服务端会关闭连接，重连后重新收到完整状态
+      return;
+    }
+    this.onState(this.state);
+  }
+  
+  reconnect() {
+    if (this.closed || this.retryTimer) return;
+    const delay = Math.min(500 * 2 ** this.failures, 10000);
+    this.failures++;
+    this.retryTimer = setTimeout(() => {
+      this.retryTimer = null;
+      this.connect();
+    }, delay);
+  }
+  
+  close() {
+    this.closed = true;
+    clearTimeout(this.retryTimer);
+    if (this.conn) this.conn.close();
+  }
 }
 